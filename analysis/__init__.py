@@ -0,0 +1,19 @@
+"""
+Offline analysis of logged espresso sessions, with NumPy.
+
+Sessions come from the machine's session log (/log, see fetch_log()), its
+/history and /shots (see fetch()), or a simulator trace (python -m
+simulation --csv). The metrics work on whole
+arrays, so a folder of logs is summarized in seconds.
+
+    from analysis import load, summarize, fit_model, replay
+    session = load("session.json")
+    print(summarize(session, pid=(4.3, 0.37, 1)))
+    print(summarize(replay(session, 6, 0.2, 1)))
+
+or from the repository root: python -m analysis report logs/*.json
+"""
+
+from .metrics import detect_shots, pid_terms, summarize
+from .replay import Model, fit_model, replay
+from .session import Session, fetch, fetch_log, from_csv, from_history, from_log, load, load_many, save
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import time
+
+from . import fetch, fetch_log, fit_model, load_many, replay, save, summarize
+
+COLUMNS = (
+    ("heat_up", "heat s", "8.0f"),
+    ("overshoot", "over C", "7.2f"),
+    ("settling", "settle s", "8.0f"),
+    ("ripple_rms", "rms C", "6.3f"),
+    ("duty_mean", "duty %", "6.1f"),
+    ("duty_p95", "p95 %", "6.1f"),
+    ("shots", "shots", "5d"),
+    ("shot_drop", "drop C", "6.1f"),
+    ("shot_recovery", "recover s", "9.0f"),
+)
+PID_COLUMNS = (("pid_P", "P %", "5.0f"), ("pid_I", "I %", "5.0f"), ("pid_D", "D %", "5.0f"))
+PERCENT = ("duty_mean", "duty_p95", "pid_P", "pid_I", "pid_D")
+
+
+def width(spec):
+    return int(spec.rstrip("df").split(".")[0])
+
+
+def fmt(value, spec):
+    if value is None or value != value:  # None or NaN
+        return "-".rjust(width(spec))
+    return format(value, spec)
+
+
+def table(rows, columns):
+    name_width = max([len(row["name"]) for row in rows] + [7])
+    print(f"{'session':<{name_width}} " + " ".join(title.rjust(width(spec)) for _, title, spec in columns))
+    for row in rows:
+        cells = []
+        for key, _, spec in columns:
+            value = row.get(key)
+            if key in PERCENT and value is not None:
+                value *= 100
+            cells.append(fmt(value, spec))
+        print(f"{row['name']:<{name_width}} " + " ".join(cells))
+
+
+def report(args):
+    pid = tuple(args.pid) if args.pid else None
+    rows = [summarize(session, args.band, pid) for session in load_many(args.files)]
+    table(rows, COLUMNS + (PID_COLUMNS if pid else ()))
+
+
+def replay_cmd(args):
+    for session in load_many(args.files):
+        model = fit_model(session)
+        if model is None:
+            print(f"{session.name}: can't fit a boiler model")
+            continue
+        print(f"{session.name}: gain {model.gain:.0f} C, tau {model.tau:.0f} s, "
+              f"dead time {model.dead_time:.0f} s, ambient {model.ambient:.1f} C")
+        rows = [summarize(session, args.band)]
+        rows[0]["name"] = "logged"
+        for kp, ki, kd in args.pid:
+            replayed = replay(session, kp, ki, kd, model)
+            rows.append(summarize(replayed, args.band))
+            rows[-1]["name"] = f"P{kp:g} I{ki:g} D{kd:g}"
+        table(rows, COLUMNS)
+
+
+def fetch_cmd(args):
+    name = time.strftime("session-%Y%m%d-%H%M%S") + (".log" if args.log else ".json")
+    path = args.output or name
+    if os.path.isdir(path):
+        path = os.path.join(path, name)
+    if args.log:
+        start = time.time() - args.hours * 3600 if args.hours else None
+        with open(path, "wb") as f:
+            f.write(fetch_log(args.host, start))
+    else:
+        save(fetch(args.host), path)
+    print(f"saved {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m analysis", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("report", help="metrics for each session")
+    p.add_argument("files", nargs="+", help="saved sessions (.json, .log) or simulator traces (.csv)")
+    p.add_argument("--band", type=float, default=0.5, help="ready band in C (default 0.5)")
+    p.add_argument("--pid", type=float, nargs=3, metavar=("P", "I", "D"),
+                   help="gains the sessions ran with, to show the share of each term")
+    p.set_defaults(run=report)
+
+    p = commands.add_parser("replay", help="replay sessions on the fitted boiler model with other gains")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--pid", type=float, nargs=3, metavar=("P", "I", "D"), action="append", required=True,
+                   help="gains to try, repeat for more")
+    p.add_argument("--band", type=float, default=0.5)
+    p.set_defaults(run=replay_cmd)
+
+    p = commands.add_parser("fetch", help="save the history and shot log from the machine")
+    p.add_argument("host", help="IP address of the machine")
+    p.add_argument("-o", "--output", help="file or folder to save to")
+    p.add_argument("--log", action="store_true", help="save the session log from flash instead of the last 10 minutes")
+    p.add_argument("--hours", type=float, help="with --log, only the last so many hours")
+    p.set_defaults(run=fetch_cmd)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Control performance of a Session, computed on whole arrays at once."""
+
+import numpy as np
+
+BAND = 0.5  # |temp - setpoint| counted as ready, as on the display
+
+
+def runs(mask):
+    """(start, stop) index pairs of the runs of True in a boolean array"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.stack((np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)), axis=1)
+
+
+def segments(session):
+    """(start, stop) index pairs of the stretches with one setpoint"""
+    sp = session.setpoint
+    valid = ~np.isnan(sp)
+    change = np.ones(len(sp), dtype=bool)
+    change[1:] = (sp[1:] != sp[:-1]) | (valid[1:] != valid[:-1])
+    starts = np.flatnonzero(change & valid)
+    stops = np.append(np.flatnonzero(change)[1:], len(sp))
+    stops = stops[np.searchsorted(stops, starts, side="right")]
+    return np.stack((starts, stops), axis=1) if len(starts) else np.zeros((0, 2), dtype=int)
+
+
+def rate(session, smooth=5):
+    """Rate of change of the temperature (C/s), averaged over smooth samples"""
+    temp = session.temp
+    slope = np.gradient(temp, session.t) if len(temp) > 1 else np.zeros_like(temp)
+    if smooth > 1:
+        kernel = np.ones(smooth) / smooth
+        slope = np.convolve(np.nan_to_num(slope), kernel, mode="same")
+    return slope
+
+
+def detect_shots(session, drop_rate=0.15, confirm=3, arm_band=3.0):
+    """(n, 2) shot starts and durations (s) found in the temperature, for
+    logs without a shot log: a fall faster than drop_rate C/s for confirm
+    samples, starting within arm_band of the setpoint"""
+    falling = rate(session) < -drop_rate
+    near = np.abs(session.error) < arm_band
+    found = []
+    for start, stop in runs(falling):
+        if stop - start >= confirm and near[start]:
+            found.append((session.t[start], session.t[stop - 1] - session.t[start]))
+    return np.array(found, dtype=float).reshape(-1, 2)
+
+
+def shots(session):
+    """The logged shots, or those found in the temperature if none were logged"""
+    return session.shots if len(session.shots) else detect_shots(session)
+
+
+def shot_mask(session, shot_list, after=120.0):
+    """True for samples from a shot start until after seconds past its end"""
+    mask = np.zeros(len(session), dtype=bool)
+    for start, duration in shot_list:
+        mask |= (session.t >= start) & (session.t < start + duration + after)
+    return mask
+
+
+def step_response(session, start, stop, band=BAND):
+    """Heat up (or cool down) time to within band, overshoot past the
+    setpoint and settling time (stays within band from then on), in seconds
+    and C, for samples start:stop with one setpoint. None where it never gets
+    there."""
+    t = session.t[start:stop]
+    err = session.error[start:stop]
+    inside = np.abs(err) <= band
+    if not inside.any():
+        return None, None, None
+    first = int(np.argmax(inside))
+    start_err = err[~np.isnan(err)][0]
+    direction = -1.0 if start_err < 0 else 1.0  # + heating
+    after = -err[first:] * direction
+    overshoot = max(0.0, float(np.nanmax(after)))
+    outside = np.flatnonzero(~inside[first:] & ~np.isnan(err[first:]))
+    settled = first if not len(outside) else first + int(outside[-1]) + 1
+    settling = float(t[settled] - t[0]) if settled < len(t) else None
+    return float(t[first] - t[0]), overshoot, settling
+
+
+def ripple(session, mask):
+    """RMS and peak to peak of the error over the masked samples"""
+    err = session.error[mask]
+    err = err[~np.isnan(err)]
+    if not len(err):
+        return None, None
+    return float(np.sqrt(np.mean(err ** 2))), float(np.ptp(err))
+
+
+def duty_stats(duty):
+    """Mean, standard deviation, 95th percentile and fraction of the time at
+    full power of heater duties (0-1)"""
+    duty = duty[~np.isnan(duty)]
+    if not len(duty):
+        return {"mean": None, "std": None, "p95": None, "saturated": None}
+    return {
+        "mean": float(duty.mean()),
+        "std": float(duty.std()),
+        "p95": float(np.percentile(duty, 95)),
+        "saturated": float(np.mean(duty >= 0.999)),
+    }
+
+
+def recovery(session, shot_list, band=BAND):
+    """(n, 3) lowest temperature, drop from the setpoint and seconds from
+    the end of each shot until back within band, NaN if it didn't recover
+    before the next shot or the end of the log"""
+    out = np.full((len(shot_list), 3), np.nan)
+    ends = np.append(shot_list[1:, 0], np.inf) if len(shot_list) else []
+    err = session.error
+    for k, (start, duration) in enumerate(shot_list):
+        during = (session.t >= start) & (session.t < ends[k])
+        if not np.any(during & ~np.isnan(err)):
+            continue
+        i = int(np.nanargmax(np.where(during, err, -np.inf)))
+        out[k, 0] = session.temp[i]
+        out[k, 1] = err[i]
+        back = np.flatnonzero(during & (session.t >= start + duration) & (np.abs(err) <= band))
+        if len(back):
+            out[k, 2] = session.t[back[0]] - (start + duration)
+    return out
+
+
+def clamped_cumsum(values, low, high):
+    """Running sum held between low and high, like a PID integral with
+    anti-windup clamping"""
+    if not len(values):
+        return np.zeros(0)
+    step = np.frompyfunc(lambda acc, v: min(high, max(low, acc + v)), 2, 1)
+    values = np.asarray(values, dtype=object)
+    values[0] = min(high, max(low, values[0]))
+    return step.accumulate(values).astype(float)
+
+
+def pid_terms(session, kp, ki, kd, integral_limits=(0.0, 20.0)):
+    """P, I and D terms (%) and the output of PIDController for the logged
+    temperatures, as the firmware computes them once a sample. The integral
+    starts again whenever the setpoint goes away."""
+    err = session.error
+    dt = np.diff(session.t, prepend=session.t[0] - session.period)
+    p = kp * err
+    i = np.zeros(len(err))
+    d = np.zeros(len(err))
+    valid = ~np.isnan(err)
+    for start, stop in runs(valid):
+        e = err[start:stop]
+        i[start:stop] = ki * clamped_cumsum(e * dt[start:stop], *integral_limits)
+        d[start:stop] = kd * np.diff(e, prepend=0.0) / dt[start:stop]
+    p[~valid] = i[~valid] = d[~valid] = np.nan
+    output = np.clip(p + i - d, 0, 100)
+    return {"P": p, "I": i, "D": -d, "output": output}
+
+
+def term_shares(terms, mask=None):
+    """Mean absolute size of each PID term as a fraction of their total"""
+    size = {}
+    for key in ("P", "I", "D"):
+        values = terms[key] if mask is None else terms[key][mask]
+        size[key] = float(np.nanmean(np.abs(values))) if np.any(~np.isnan(values)) else 0.0
+    total = sum(size.values()) or 1.0
+    return {key: value / total for key, value in size.items()}
+
+
+def summarize(session, band=BAND, pid=None):
+    """Metrics for a session as a flat dict. The heat up, overshoot and
+    settling are those of the first setpoint, ripple and duty statistics are
+    over the time held at a setpoint away from shots. pid: (kp, ki, kd) to
+    add the share of each term."""
+    result = {"name": session.name, "seconds": session.duration}
+    segs = segments(session)
+    shot_list = shots(session)
+    disturbed = shot_mask(session, shot_list)
+    steady = np.zeros(len(session), dtype=bool)
+    heat_up = overshoot = settling = None
+    for k, (start, stop) in enumerate(segs):
+        # a shot ends the step response, a little before it was spotted
+        first_shot = np.flatnonzero(disturbed[start:stop])
+        end = start + max(int(first_shot[0]) - int(10 / session.period), 1) if len(first_shot) else stop
+        up, over, settle = step_response(session, start, end, band)
+        if k == 0:
+            heat_up, overshoot, settling = up, over, settle
+        if settle is not None:
+            steady[start:stop] |= session.t[start:stop] >= session.t[start] + settle
+    steady &= ~disturbed
+    rms, p2p = ripple(session, steady)
+    result.update({"heat_up": heat_up, "overshoot": overshoot, "settling": settling,
+                   "ripple_rms": rms, "ripple_p2p": p2p, "setpoints": len(segs)})
+    for key, value in duty_stats(session.duty[steady]).items():
+        result["duty_" + key] = value
+    rec = recovery(session, shot_list, band)
+    result["shots"] = len(shot_list)
+    result["shot_drop"] = float(np.nanmean(rec[:, 1])) if len(rec) and np.any(~np.isnan(rec[:, 1])) else None
+    result["shot_recovery"] = float(np.nanmean(rec[:, 2])) if len(rec) and np.any(~np.isnan(rec[:, 2])) else None
+    if pid is not None:
+        shares = term_shares(pid_terms(session, *pid), steady)
+        for key, value in shares.items():
+            result["pid_" + key] = value
+    return result
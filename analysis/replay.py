@@ -0,0 +1,99 @@
+"""Fit the boiler model to a session and replay it with other PID gains."""
+
+from collections import namedtuple
+
+import numpy as np
+
+from simulation.boiler import Boiler
+
+from .metrics import shot_mask, shots
+from .session import Session
+
+Model = namedtuple("Model", "gain tau dead_time ambient")
+
+
+def fit_model(session, ambient=None, max_dead_time=20, interval=10):
+    """Least squares fit of tau dT/dt = gain*u(t - dead_time) - (T - ambient)
+    to the logged temperatures and duties, leaving out the shots. The rise
+    over every interval seconds is regressed on the mean temperature and the
+    mean duty a dead time before, like the firmware's ModelIdentifier but on
+    the whole log at once. Each whole second of dead time up to max_dead_time
+    is fitted and the best one kept. ambient defaults to the first reading
+    if the session starts cold, otherwise 22 C. Returns a Model, or None if
+    the log doesn't vary enough."""
+    temp, duty = session.temp, session.duty
+    if ambient is None:
+        first = temp[~np.isnan(temp)][:1]
+        ambient = float(first[0]) if len(first) and first[0] < 40 else 22.0
+    period = session.period
+    n = max(1, int(round(interval / period)))
+    if len(temp) <= n:
+        return None
+    y = (temp[n:] - temp[:-n]) / (n * period)
+    mean_temp = (temp[n:] + temp[:-n]) / 2
+    mean_duty = np.convolve(duty, np.ones(n) / n, mode="valid")[:len(y)]  # over each interval
+    usable = ~np.isnan(y) & ~shot_mask(session, shots(session))[n:]
+    best = None
+    for d in range(int(max_dead_time / period) + 1):
+        u = np.full(len(y), np.nan)
+        u[d:] = mean_duty[:len(y) - d]
+        ok = usable & ~np.isnan(u)
+        if ok.sum() < 30:
+            break
+        x = np.stack((-(mean_temp[ok] - ambient), u[ok]), axis=1)
+        (a, b), _, rank, _ = np.linalg.lstsq(x, y[ok], rcond=None)
+        if rank < 2 or a <= 0 or b <= 0:
+            continue
+        error = float(np.mean((x @ (a, b) - y[ok]) ** 2))
+        if best is None or error < best[0]:
+            best = (error, Model(b / a, 1 / a, d * period, ambient))
+    return best[1] if best else None
+
+
+def replay(session, kp, ki, kd, model=None, flow=2.0, integral_limits=(0.0, 20.0)):
+    """Run the session again on the boiler model with other PID gains: the
+    same setpoints and shots (drawing flow ml/s), from the same first
+    temperature, with PIDController's maths once a sample. The heater is
+    taken as a continuous duty rather than the 4 s SSR windows. The loop
+    can't be vectorized, each step depends on the one before.
+    Returns the replayed Session."""
+    model = model or fit_model(session)
+    if model is None:
+        raise ValueError("can't fit a boiler model to this session, pass one")
+    t = session.t
+    first = session.temp[~np.isnan(session.temp)]
+    boiler = Boiler(model.gain, model.tau, model.dead_time, model.ambient,
+                    temp=float(first[0]) if len(first) else model.ambient)
+    shot_list = shots(session)
+    events = sorted([(start, flow) for start, _ in shot_list]
+                    + [(start + duration, 0.0) for start, duration in shot_list])
+    temp = np.empty(len(t))
+    duty = np.zeros(len(t))
+    low, high = integral_limits
+    integral = 0.0
+    last_error = 0.0
+    last_t = t[0] - session.period
+    e = 0
+    for k, now in enumerate(t):
+        while e < len(events) and events[e][0] <= now:
+            boiler.set_flow(events[e][1], events[e][0] - t[0])
+            e += 1
+        temp[k] = boiler.temperature(now - t[0])
+        setpoint = session.setpoint[k]
+        if np.isnan(setpoint):
+            integral = last_error = 0.0
+            output = 0.0
+        else:
+            dt = now - last_t
+            error = setpoint - temp[k]
+            integral = min(high, max(low, integral + error * dt))
+            output = kp * error + ki * integral - kd * (error - last_error) / dt
+            last_error = error
+            output = min(100.0, max(0.0, output))
+        last_t = now
+        duty[k] = output / 100
+        boiler.set_heater(duty[k], now - t[0])
+    name = f"{session.name} P{kp} I{ki} D{kd}"
+    return Session(t, np.round(temp, 1), session.setpoint, duty, session.mode, shot_list, name,
+                   session.start_time)
+
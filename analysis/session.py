@@ -0,0 +1,192 @@
+"""Logged sessions loaded into NumPy arrays."""
+
+import csv
+import json
+import urllib.request
+
+import numpy as np
+
+MODES = ("espresso", "steam")  # mode codes, as in history.py
+
+# session log format, as in session_log.py
+LOG_MAGIC = b"SLOG"
+LOG_HEADER = np.dtype([("magic", "S4"), ("version", "u1"), ("record_size", "u1"), ("period", "<u2"),
+                       ("created", "<u4"), ("reserved", "<u2"), ("checksum", "<u2")])
+LOG_RECORD = np.dtype([("time", "<u4"), ("temp", "<i2"), ("setpoint", "<i2"), ("duty", "<u2"),
+                       ("flags", "u1"), ("checksum", "u1")])
+LOG_EMPTY = -32768
+ON, STEAM, BREWING, AUTOTUNE, NO_READING, BOOT = 1, 2, 4, 8, 16, 32
+
+
+class Session:
+    def __init__(self, t, temp, setpoint, duty, mode=None, shots=None, name="", start_time=None):
+        """
+        One logged session, sampled at regular times.
+        t: seconds from the first sample, temp / setpoint: C, NaN where there
+        was no reading or no setpoint (machine off), duty: heater duty 0-1,
+        mode: index into MODES, -1 when off or unknown, shots: (n, 2) array of
+        shot start (seconds, on the t scale) and duration, start_time: Unix
+        time of the first sample if known.
+        """
+        self.t = np.asarray(t, dtype=float)
+        self.temp = np.asarray(temp, dtype=float)
+        self.setpoint = np.asarray(setpoint, dtype=float)
+        self.duty = np.asarray(duty, dtype=float)
+        n = len(self.t)
+        self.mode = np.full(n, -1, dtype=np.int8) if mode is None else np.asarray(mode, dtype=np.int8)
+        self.shots = np.zeros((0, 2)) if shots is None else np.asarray(shots, dtype=float).reshape(-1, 2)
+        self.name = name
+        self.start_time = start_time
+
+    def __len__(self):
+        return len(self.t)
+
+    def __repr__(self):
+        return f"<Session {self.name or '?'}: {len(self)} samples, {self.duration:.0f} s, {len(self.shots)} shots>"
+
+    @property
+    def period(self):
+        """Sample period in seconds"""
+        return float(np.median(np.diff(self.t))) if len(self) > 1 else 1.0
+
+    @property
+    def duration(self):
+        return float(self.t[-1] - self.t[0]) if len(self) else 0.0
+
+    @property
+    def error(self):
+        """setpoint - temp, NaN where either is missing"""
+        return self.setpoint - self.temp
+
+    def window(self, start, stop):
+        """The part of the session between two times (seconds)"""
+        keep = (self.t >= start) & (self.t < stop)
+        shots = self.shots[(self.shots[:, 0] >= start) & (self.shots[:, 0] < stop)]
+        return Session(self.t[keep], self.temp[keep], self.setpoint[keep], self.duty[keep],
+                       self.mode[keep], shots, self.name, self.start_time)
+
+
+def _floats(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def from_history(history, shots=None, name=""):
+    """Session from the /history JSON, and the /shots JSON if given"""
+    period = history.get("period_ms", 1000) / 1000
+    temp = _floats(history["temp_history"])
+    n = len(temp)
+    setpoint = _floats(history["setpoint_history"])
+    duty = _floats(history.get("pwm_history", [None] * n)) / 100
+    mode = np.array([MODES.index(m) if m in MODES else -1 for m in history.get("mode_history", [None] * n)])
+    start_time = None
+    if "time" in history:
+        start_time = history["time"] - (n - 1) * period
+    starts = []
+    if shots and start_time is not None:
+        starts = [(shot["start"] - start_time, shot["duration"] or 0) for shot in shots.get("shots", [])]
+    return Session(np.arange(n) * period, temp, setpoint, duty, mode, starts, name, start_time)
+
+
+def read_log(data):
+    """Records of a session log (the /log response or a file copied off the
+    flash) as a structured array, leaving out any that fail their checksum"""
+    header = np.frombuffer(data, LOG_HEADER, count=1)[0]
+    if header["magic"] != LOG_MAGIC or header["record_size"] != LOG_RECORD.itemsize:
+        raise ValueError("not a session log")
+    body = np.frombuffer(data, np.uint8, offset=LOG_HEADER.itemsize)
+    body = body[:len(body) - len(body) % LOG_RECORD.itemsize].reshape(-1, LOG_RECORD.itemsize)
+    check = (body[:, :-1].sum(axis=1) ^ 0x5A) & 0xFF
+    good = body[check == body[:, -1]]
+    return np.ascontiguousarray(good).view(LOG_RECORD).ravel()
+
+
+def from_log(data, name=""):
+    """Sessions from a session log, split where the machine was turned off
+    or restarted. Shots are the runs of records flagged as brewing."""
+    records = read_log(data)
+    if not len(records):
+        return []
+    period = np.median(np.diff(records["time"].astype(float))) if len(records) > 1 else 1.0
+    gap = np.diff(records["time"].astype(np.int64)) > 5 * max(period, 1)
+    boot = (records["flags"][1:] & BOOT) != 0
+    bounds = np.concatenate(([0], np.flatnonzero(gap | boot) + 1, [len(records)]))
+    sessions = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        part = records[start:stop]
+        t = (part["time"] - part["time"][0]).astype(float)
+        temp = np.where(part["temp"] == LOG_EMPTY, np.nan, part["temp"] / 10)
+        setpoint = np.where(part["setpoint"] == LOG_EMPTY, np.nan, part["setpoint"] / 10)
+        flags = part["flags"]
+        mode = np.where(flags & ON, (flags & STEAM) != 0, -1)
+        brewing = np.concatenate(([0], (flags & BREWING) != 0, [0])).astype(np.int8)
+        edges = np.diff(brewing)
+        starts, stops = t[np.flatnonzero(edges == 1)], np.flatnonzero(edges == -1)
+        ends = t[stops - 1] + (t[1] - t[0] if len(t) > 1 else 1.0)
+        shots = np.stack((starts, ends - starts), axis=1)
+        label = f"{name}#{len(sessions) + 1}" if name else f"session {len(sessions) + 1}"
+        sessions.append(Session(t, temp, setpoint, part["duty"] / 1000, mode, shots, label,
+                                int(part["time"][0])))
+    return sessions
+
+
+def is_log(path):
+    with open(path, "rb") as f:
+        return f.read(len(LOG_MAGIC)) == LOG_MAGIC
+
+
+def from_csv(path, name=""):
+    """Session from a simulator trace (python -m simulation --csv)"""
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    column = lambda key: np.array([float(row[key]) if row[key] else np.nan for row in rows])
+    return Session(column("seconds"), column("controller_temp"), column("setpoint"), column("duty"),
+                   name=name or path)
+
+
+def load(path):
+    """Load a simulator CSV trace, a /history JSON or a bundle saved by
+    fetch(). A session log loads as the list of sessions in it."""
+    if is_log(path):
+        with open(path, "rb") as f:
+            return from_log(f.read(), path)
+    if path.endswith(".csv"):
+        return from_csv(path)
+    with open(path) as f:
+        data = json.load(f)
+    if "history" in data:
+        return from_history(data["history"], data.get("shots"), name=path)
+    return from_history(data, name=path)
+
+
+def load_many(paths):
+    """Sessions from all the files, session logs split into their sessions"""
+    sessions = []
+    for path in paths:
+        loaded = load(path)
+        sessions.extend(loaded if isinstance(loaded, list) else [loaded])
+    return sessions
+
+
+def fetch(host, timeout=10):
+    """Download the history and shot log from the machine at host, returns a
+    bundle for save() / from_history()"""
+    def get(path):
+        with urllib.request.urlopen(f"http://{host}{path}", timeout=timeout) as response:
+            return json.load(response)
+    return {"host": host, "history": get("/history"), "shots": get("/shots")}
+
+
+def fetch_log(host, start=None, end=None, timeout=60):
+    """Download the session log from the machine at host, between two times
+    if given. The times are the machine's clock seconds, as in the log records,
+    which the web page sets to local time, so not Unix times. Returns the raw
+    log for from_log(), or to save as is."""
+    query = "&".join(f"{key}={int(value)}" for key, value in (("from", start), ("to", end)) if value is not None)
+    url = f"http://{host}/log" + (f"?{query}" if query else "")
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def save(bundle, path):
+    with open(path, "w") as f:
+        json.dump(bundle, f)
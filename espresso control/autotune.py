@@ -0,0 +1,136 @@
+from utime import ticks_ms, ticks_diff
+from math import pi, sqrt
+
+# Tuning rules, see RelayAutotune.tunings()
+RULES = ('zn', 'tl', 'simc')
+
+class RelayAutotune:
+    IDLE = 'idle'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    ABORTED = 'aborted'
+
+    def __init__(self, setpoint, bias=10.0, step=20.0, hysteresis=0.2, cycles=4, rule='zn', timeout=1800):
+        """Relay (Astrom-Hagglund) autotune.
+        The heater is switched between bias + step and bias - step % whenever
+        the temperature crosses setpoint -+ hysteresis, which makes it
+        oscillate around the setpoint. The first cycle is dropped, then the
+        amplitude a and period Pu of the next cycles give the ultimate gain
+        Ku = 4d / (pi * sqrt(a^2 - hysteresis^2)) for a relay of amplitude d,
+        which the rule turns into PID tunings. bias should be about the power
+        that holds the setpoint. Gives up after timeout seconds."""
+        self.setpoint = setpoint
+        self.high = min(100.0, bias + step)
+        self.low = max(0.0, bias - step)
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.rule = rule if rule in RULES else 'zn'
+        self.timeout = timeout
+
+        self.state = RelayAutotune.RUNNING
+        self.message = 'heating to the setpoint'
+        self.start_time = ticks_ms()
+        self.elapsed = 0  # seconds, fixed once it stops
+        self.heating = True
+        self.switch_times = []  # ticks_ms of each switch to heating, one per cycle
+        self.peaks = []  # (max, min) temperature of each completed cycle
+        self.cycle_max = None
+        self.cycle_min = None
+        self.ku = None
+        self.pu = None
+        self.result = None
+
+    def update(self, temp):
+        """Feed a reading, returns the heater duty (0-1) to use"""
+        if self.state != RelayAutotune.RUNNING:
+            return 0
+        now = ticks_ms()
+        self.elapsed = ticks_diff(now, self.start_time) // 1000
+        if self.elapsed > self.timeout:
+            self.fail('timed out')
+            return 0
+        if temp is None:
+            return self.output()
+
+        if self.cycle_max is not None:
+            self.cycle_max = max(self.cycle_max, temp)
+            self.cycle_min = min(self.cycle_min, temp)
+
+        if self.heating and temp > self.setpoint + self.hysteresis:
+            self.heating = False
+            if not self.switch_times:
+                self.message = 'oscillating'
+        elif not self.heating and temp < self.setpoint - self.hysteresis:
+            self.heating = True
+            if self.cycle_max is not None:
+                self.peaks.append((self.cycle_max, self.cycle_min))
+            self.switch_times.append(now)
+            self.cycle_max = self.cycle_min = temp
+            if len(self.peaks) > self.cycles:
+                self.finish()
+        return self.output()
+
+    def output(self):
+        return (self.high if self.heating else self.low) / 100
+
+    def finish(self):
+        # the first cycle starts from the heat up, leave it out
+        peaks = self.peaks[1:]
+        a = sum(hi - lo for hi, lo in peaks) / len(peaks) / 2
+        times = self.switch_times[1:]
+        self.pu = ticks_diff(times[-1], times[0]) / 1000 / (len(times) - 1)
+        d = (self.high - self.low) / 2
+        if a <= self.hysteresis:
+            self.fail('no oscillation')
+            return
+        self.ku = 4 * d / (pi * sqrt(a * a - self.hysteresis * self.hysteresis))
+        self.result = self.tunings(self.ku, self.pu, self.rule)
+        self.stop(RelayAutotune.DONE, f"Ku {self.ku:.2f}, Pu {self.pu:.0f} s")
+
+    def stop(self, state, message):
+        self.elapsed = ticks_diff(ticks_ms(), self.start_time) // 1000
+        self.state = state
+        self.message = message
+
+    def fail(self, message):
+        self.stop(RelayAutotune.FAILED, message)
+
+    def abort(self):
+        if self.state == RelayAutotune.RUNNING:
+            self.stop(RelayAutotune.ABORTED, 'aborted')
+
+    @staticmethod
+    def tunings(ku, pu, rule='zn'):
+        """PID gains {"P", "I", "D"} (I = Kp/Ti, D = Kp*Td) from the ultimate
+        gain and period.
+        zn: Ziegler-Nichols, fast but with some overshoot.
+        tl: Tyreus-Luyben, slower and better damped.
+        simc: Skogestad's SIMC PI with tau_c = theta, on the integrating
+        process with dead time k e^(-theta s)/s that gives the same relay
+        oscillation (theta = Pu/4, k = pi / (2 Ku theta)), which suits the
+        slow boiler."""
+        if rule == 'tl':
+            kp, ti, td = ku / 2.2, 2.2 * pu, pu / 6.3
+        elif rule == 'simc':
+            theta = pu / 4
+            k = pi / (2 * ku * theta)
+            kp, ti, td = 1 / (k * 2 * theta), 8 * theta, 0
+        else:
+            kp, ti, td = 0.6 * ku, pu / 2, pu / 8
+        return {"P": round(kp, 3), "I": round(kp / ti, 4), "D": round(kp * td, 3)}
+
+    def get_status(self):
+        status = {
+            "state": self.state,
+            "message": self.message,
+            "rule": self.rule,
+            "cycles": max(len(self.peaks) - 1, 0),
+            "of": self.cycles,
+            "elapsed": self.elapsed,
+        }
+        if self.result:
+            status["Ku"] = round(self.ku, 3)
+            status["Pu"] = round(self.pu, 1)
+            status["PID"] = self.result
+        return status
@@ -0,0 +1,138 @@
+from array import array
+from utime import ticks_ms, ticks_diff, ticks_add, time
+
+class BrewDetector:
+    IDLE = 'idle'
+    BREWING = 'brewing'
+    RECOVERING = 'recovering'
+
+    def __init__(self, profile=((0, 80),), drop_rate=0.15, end_rate=0.05, confirm=3,
+                 max_time=60, band=0.5, arm_band=3.0, keep=10, max_samples=180):
+        """Spots shots in the temperature stream and boosts the heater for them.
+        Drawing water cools the boiler faster than it can lose heat, so a shot
+        shows up as the temperature falling more than drop_rate C/s faster than
+        the boiler model expects (and at least half that fast), for confirm
+        seconds in a row, while it is within arm_band of the setpoint. The shot ends when that falls back
+        under end_rate C/s for confirm seconds, or after max_time seconds.
+        While it lasts, profile adds heater power on top of the controller:
+        (seconds since the shot was spotted, %) steps, the last one held.
+        The last keep shots are logged with their temperature every second
+        from the start until back within band of the setpoint."""
+        self.profile = profile
+        self.drop_rate = drop_rate
+        self.end_rate = end_rate
+        self.confirm = confirm
+        self.max_time = max_time * 1000
+        self.band = band
+        self.arm_band = arm_band
+        self.keep = keep
+        self.max_samples = max_samples
+        self.state = BrewDetector.IDLE
+        self.count = 0  # seconds in a row meeting the start or end condition
+        self.last_temp = None
+        self.drop = []  # temperatures since the fall started, before it is confirmed
+        self.start_time = 0  # ticks_ms the shot was spotted
+        self.end_time = 0
+        self.shot = None  # record of the current shot
+        self.temps = None  # its temperatures, deci-degrees
+        self.shots = []  # completed records, oldest first
+
+    def update(self, temp, setpoint, rate, expected=0.0):
+        """Feed the reading of this second, the setpoint, the rate of change
+        (C/s) and the rate the boiler model expects from the heater.
+        Returns the extra heater power (0-1) to add."""
+        if temp is None or setpoint is None:
+            self.cancel()
+            return 0
+        now = ticks_ms()
+        residual = rate - expected
+        if self.temps is not None and len(self.temps) < self.max_samples:
+            self.temps.append(int(round(temp * 10)))
+
+        if self.state == BrewDetector.IDLE or self.state == BrewDetector.RECOVERING:
+            armed = abs(temp - setpoint) < self.arm_band
+            # the heat still on its way after a shot can look like a fall
+            # against the model, it has to be really falling as well
+            if armed and residual < -self.drop_rate and rate < -self.drop_rate / 2:
+                if not self.count:
+                    self.drop = [self.last_temp if self.last_temp is not None else temp]
+                self.count += 1
+                self.drop.append(temp)
+            else:
+                self.count = 0
+            if self.count >= self.confirm:
+                self.start(now)
+            elif self.state == BrewDetector.RECOVERING and abs(temp - setpoint) <= self.band:
+                self.shot["recovery"] = ticks_diff(now, self.end_time) // 1000
+                self.finish()
+        else:
+            self.shot["min_temp"] = min(self.shot["min_temp"], temp)
+            self.count = self.count + 1 if residual > -self.end_rate else 0
+            elapsed = ticks_diff(now, self.start_time)
+            if self.count >= self.confirm:
+                self.stop(now, self.confirm)  # it ended when the fall did
+            elif elapsed >= self.max_time:
+                self.stop(now, 0)
+        self.last_temp = temp
+
+        if self.state != BrewDetector.BREWING or self.count:
+            return 0  # no boost once the fall looks to be over
+        return self.boost(ticks_diff(now, self.start_time) / 1000) / 100
+
+    def boost(self, seconds):
+        """Heater boost in % from the profile, seconds into the shot"""
+        power = 0
+        for at, pct in self.profile:
+            if seconds < at:
+                break
+            power = pct
+        return power
+
+    def start(self, now):
+        if self.state == BrewDetector.RECOVERING:
+            self.finish()  # back to back, this one didn't recover
+        # the shot started with the fall, confirm seconds ago
+        self.state = BrewDetector.BREWING
+        self.count = 0
+        self.start_time = now
+        self.shot = {
+            "start": time() - self.confirm,
+            "duration": None,
+            "start_temp": self.drop[0],
+            "min_temp": min(self.drop),
+            "recovery": None,
+        }
+        self.temps = array('h', [int(round(t * 10)) for t in self.drop[1:]])
+
+    def stop(self, now, lag):
+        self.state = BrewDetector.RECOVERING
+        self.count = 0
+        self.end_time = ticks_add(now, -lag * 1000)
+        self.shot["duration"] = ticks_diff(self.end_time, self.start_time) // 1000 + self.confirm
+
+    def finish(self):
+        self.shot["temps"] = self.temps
+        self.shots.append(self.shot)
+        if len(self.shots) > self.keep:
+            self.shots.pop(0)
+        self.state = BrewDetector.IDLE
+        self.shot = None
+        self.temps = None
+
+    def cancel(self):
+        """Machine off or no reading, log what there is of the shot"""
+        if self.state != BrewDetector.IDLE:
+            if self.shot["duration"] is None:
+                self.stop(ticks_ms(), 0)
+            self.finish()
+        self.count = 0
+
+    def get_shots(self):
+        """Logged shots, newest last, with the temperatures in C"""
+        shots = []
+        for shot in self.shots:
+            shot = dict(shot)
+            shot["temps"] = [t / 10 for t in shot["temps"]]
+            shot["min_temp"] = round(shot["min_temp"], 1)
+            shots.append(shot)
+        return shots
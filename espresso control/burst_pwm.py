@@ -0,0 +1,57 @@
+from machine import Pin, Timer
+
+class BurstPWM:
+    RESOLUTION = 1000  # duty steps
+
+    def __init__(self, pin_num, mains_hz=60, half_cycle=False, duty=0.0, timer_id=2):
+        """Burst fire heater drive for a zero crossing SSR.
+        A timer ticks once per mains cycle (or half cycle) and a sigma-delta
+        accumulator decides if the SSR conducts for that cycle, so a duty of
+        0.1 fires every 10th cycle instead of one 0.4 s block every 4 s.
+        Same interface as TimerPWM. The timer isn't locked to the mains, which
+        doesn't matter as the SSR only switches at zero crossings anyway.
+        Timer(0) is used by ZACwire, on the ESP32-C6 the other timer is id 2."""
+        self.pin = Pin(pin_num, Pin.OUT)
+        self.pin.value(0)
+        self.timer = Timer(timer_id)
+        self.freq = mains_hz * 2 if half_cycle else mains_hz
+        self.level = 0  # duty in RESOLUTION steps
+        self.acc = 0
+        self.state = 0
+        self.running = False
+        self._tick_cb = self._tick  # bound once, so the timer callback doesn't allocate
+        self.set_duty(duty)
+
+    def set_frequency(self, freq):
+        """Only for compatibility with the PWM drivers, the rate is the mains frequency"""
+        pass
+
+    def set_duty(self, duty):
+        """Set duty cycle (0.0-1.0), used from the next cycle"""
+        self.level = int(min(max(0.0, duty), 1.0) * BurstPWM.RESOLUTION)
+
+    async def start(self):
+        """Start firing. A coroutine like AsyncPWM.start(), but it returns at
+        once, the timer keeps running"""
+        self.running = True
+        self.acc = 0
+        self.timer.init(mode=Timer.PERIODIC, freq=self.freq, callback=self._tick_cb)
+
+    def _tick(self, _):
+        # Bresenham: fire whenever the accumulated duty passes a whole cycle
+        self.acc += self.level
+        if self.acc >= BurstPWM.RESOLUTION:
+            self.acc -= BurstPWM.RESOLUTION
+            on = 1
+        else:
+            on = 0
+        if on != self.state:
+            self.pin.value(on)
+            self.state = on
+
+    def stop(self):
+        """Stop firing"""
+        self.running = False
+        self.timer.deinit()
+        self.pin.value(0)
+        self.state = 0
@@ -0,0 +1,160 @@
+from array import array
+from math import sqrt
+from utime import ticks_ms, ticks_diff
+
+class TempEstimator:
+    def __init__(self, noise=0.1, drift=0.2, gate=5.0, min_gate=2.0, timeout=60):
+        """Kalman filter for the boiler temperature and its rate of change.
+        The rate is modelled as drifting by about drift C/s each second and
+        the sensor as noise C rms (the TSic306 steps are 0.1 C). A reading
+        more than gate standard deviations (and at least min_gate C) off the
+        prediction is rejected as a bad reading. After timeout seconds
+        without a reading the filter starts again from the next one."""
+        self.r = noise * noise
+        self.q = drift * drift
+        self.gate = gate
+        self.min_gate = min_gate
+        self.timeout = timeout * 1000
+        self.temp = None  # filtered temperature
+        self.rate = 0.0  # C/s
+        self.p00 = self.p01 = self.p11 = 0.0  # covariance
+        self.last_time = 0
+        self.rejected = 0  # readings rejected since the last accepted one
+
+    def reset(self):
+        self.temp = None
+        self.rate = 0.0
+        self.rejected = 0
+
+    def update(self, reading):
+        """Add a reading, returns False if it was rejected"""
+        now = ticks_ms()
+        dt = ticks_diff(now, self.last_time) / 1000
+        if self.temp is None or dt * 1000 > self.timeout:
+            self.temp = reading
+            self.rate = 0.0
+            self.p00 = self.r
+            self.p01 = 0.0
+            self.p11 = 1.0
+            self.last_time = now
+            self.rejected = 0
+            return True
+
+        # predict, constant rate with a white noise acceleration
+        q = self.q
+        temp = self.temp + self.rate * dt
+        p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + q * dt * dt * dt / 3
+        p01 = self.p01 + dt * self.p11 + q * dt * dt / 2
+        p11 = self.p11 + q * dt
+
+        innovation = reading - temp
+        s = p00 + self.r
+        if abs(innovation) > max(self.gate * sqrt(s), self.min_gate):
+            self.rejected += 1
+            return False
+
+        k0 = p00 / s
+        k1 = p01 / s
+        self.temp = temp + k0 * innovation
+        self.rate += k1 * innovation
+        self.p00 = (1 - k0) * p00
+        self.p01 = (1 - k0) * p01
+        self.p11 = p11 - k1 * p01
+        self.last_time = now
+        self.rejected = 0
+        return True
+
+
+class ModelIdentifier:
+    def __init__(self, ambient=22.0, max_dead_time=20, interval=5, forgetting=0.995):
+        """Online fit of the boiler model tau dT/dt = gain*u(t - dead_time) - (T - ambient).
+        Every interval seconds the rise over the interval is regressed on the
+        temperature and the heater duty a dead time before, by recursive least
+        squares with forgetting. There is one fit for each whole second of
+        dead time up to max_dead_time, the one predicting best gives the dead
+        time. Intervals the fit is far off for (a shot drawing cold water in)
+        are left out. Feed it once a second with add()."""
+        self.ambient = ambient
+        self.interval = interval
+        self.forgetting = forgetting
+        self.n = max_dead_time + 1
+        size = max_dead_time + interval + 1
+        self.temps = array('f', [0.0] * size)
+        self.duties = array('f', [0.0] * size)
+        self.size = size
+        self.pos = 0
+        self.count = 0  # samples added since the last gap
+        self.updates = 0
+        # per dead time: parameters 1/tau and gain/tau, covariance, squared error
+        self.a = array('f', [1 / 1000] * self.n)
+        self.b = array('f', [0.5] * self.n)
+        self.p00 = array('f', [1e-4] * self.n)
+        self.p01 = array('f', [0.0] * self.n)
+        self.p11 = array('f', [1.0] * self.n)
+        self.error = array('f', [0.0] * self.n)
+        self.best = 0
+
+    def add(self, temp, duty):
+        """Add the reading and heater duty (0-1) of this second"""
+        if temp is None:
+            self.count = 0
+            return
+        self.temps[self.pos] = temp
+        self.duties[self.pos] = duty
+        self.pos = (self.pos + 1) % self.size
+        self.count += 1
+        if self.count >= self.size and self.count % self.interval == 0:
+            self.fit()
+
+    def at(self, buf, ago):
+        return buf[(self.pos - 1 - ago) % self.size]
+
+    def fit(self):
+        n = self.interval
+        t1 = self.at(self.temps, 0)
+        t0 = self.at(self.temps, n)
+        y = (t1 - t0) / n
+        x0 = -((t0 + t1) / 2 - self.ambient)
+        lam = self.forgetting
+        for d in range(self.n):
+            x1 = 0.0
+            for i in range(n):
+                x1 += self.at(self.duties, d + i)
+            x1 /= n
+            a, b = self.a[d], self.b[d]
+            e = y - (a * x0 + b * x1)
+            if self.updates > 60 and e * e > 25 * self.error[d]:
+                # a shot drawing cold water, not the heater, leave the fit
+                # alone. The error grows so that a lasting change gets through.
+                self.error[d] *= 1.2
+                continue
+            self.error[d] = 0.98 * self.error[d] + 0.02 * e * e
+            p00, p01, p11 = self.p00[d], self.p01[d], self.p11[d]
+            g0 = p00 * x0 + p01 * x1
+            g1 = p01 * x0 + p11 * x1
+            den = lam + x0 * g0 + x1 * g1
+            k0 = g0 / den
+            k1 = g1 / den
+            self.a[d] = a + k0 * e
+            self.b[d] = b + k1 * e
+            self.p00[d] = (p00 - k0 * g0) / lam
+            self.p01[d] = (p01 - k0 * g1) / lam
+            self.p11[d] = (p11 - k1 * g1) / lam
+        self.updates += 1
+        best = 0
+        for d in range(1, self.n):
+            if self.error[d] < self.error[best]:
+                best = d
+        self.best = best
+
+    def converged(self):
+        """True once there has been enough data for a plausible fit"""
+        a, b = self.a[self.best], self.b[self.best]
+        return self.updates >= 60 and 0 < a < 0.1 and b > 0
+
+    def params(self):
+        """(gain, tau, dead_time) of the best fit, or None before it converged"""
+        if not self.converged():
+            return None
+        a, b = self.a[self.best], self.b[self.best]
+        return b / a, 1 / a, self.best
@@ -0,0 +1,51 @@
+import uasyncio as asyncio
+
+class EventHub:
+    def __init__(self, max_subscribers=4, backlog=4):
+        """Server-Sent Events fan out.
+        Each message is serialized once and kept in a small ring, so every
+        subscriber writes the same bytes and a slow one can catch up on the
+        last few messages."""
+        self.max_subscribers = max_subscribers
+        self.backlog = backlog
+        self.messages = [None] * backlog
+        self.version = 0  # number of messages published
+        self.event = asyncio.Event()
+        self.subscribers = []
+        self.next_id = 0
+
+    def publish(self, data, event=None):
+        """Send a JSON string to every subscriber, optionally as a named event"""
+        if event:
+            msg = f"event: {event}\ndata: {data}\n\n"
+        else:
+            msg = f"data: {data}\n\n"
+        self.messages[self.version % self.backlog] = msg.encode('utf-8')
+        self.version += 1
+        # wake every waiting subscriber
+        self.event.set()
+        self.event.clear()
+
+    def subscribe(self):
+        """Register a subscriber, dropping the oldest one if there are too many.
+        Returns an id to check the subscription with"""
+        if len(self.subscribers) >= self.max_subscribers:
+            self.subscribers.pop(0)
+            self.event.set()
+            self.event.clear()
+        self.next_id += 1
+        self.subscribers.append(self.next_id)
+        return self.next_id
+
+    def unsubscribe(self, sub_id):
+        if sub_id in self.subscribers:
+            self.subscribers.remove(sub_id)
+
+    def next_message(self, seen):
+        """Get message number seen, or the oldest one still kept if it has been
+        overwritten. Returns (message, number of the next one) or (None, seen)
+        if it hasn't been published yet"""
+        if seen >= self.version:
+            return None, seen
+        seen = max(seen, self.version - self.backlog)
+        return self.messages[seen % self.backlog], seen + 1
@@ -30,8 +30,69 @@ GS4_HMSB = framebuf.GS4_HMSB
 GS8 = framebuf.GS8
 
 
+class GlyphCache:
+    def __init__(self, max_glyphs=48):
+        """Characters pre-rendered for large_text(): scaled, rotated and in
+        one colour, each in a small frame buffer that is drawn with one
+        blit. Glyphs are grouped by (scale, rotation, colour). When
+        max_glyphs are cached the group used longest ago is dropped whole,
+        so a scale that is no longer drawn doesn't hold on to memory."""
+        self.max_glyphs = max_glyphs
+        self.groups = {}  # (m, t, c): {character: FrameBuffer}
+        self.used = {}  # (m, t, c): tick it was last used
+        self.count = 0
+        self.tick = 0
+
+    def clear(self):
+        self.groups = {}
+        self.used = {}
+        self.count = 0
+
+    def get(self, character, m, t, c):
+        """The glyph for character at scale m, character rotation t (0-3)
+        and colour c, with everything else in the other colour. None if
+        the cache is full of glyphs in use."""
+        key = (m, t, c)
+        self.tick += 1
+        self.used[key] = self.tick
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {}
+        glyph = group.get(character)
+        if glyph is None:
+            if self.count >= self.max_glyphs and not self.evict(key):
+                return None
+            glyph = self.render(character, m, t, c)
+            group[character] = glyph
+            self.count += 1
+        return glyph
+
+    def evict(self, keep):
+        """Drop the group used longest ago other than keep"""
+        oldest = None
+        for key, tick in self.used.items():
+            if key != keep and key in self.groups and (oldest is None or tick < self.used[oldest]):
+                oldest = key
+        if oldest is None:
+            return False
+        self.count -= len(self.groups.pop(oldest))
+        del self.used[oldest]
+        return True
+
+    @staticmethod
+    def render(character, m, t, c):
+        size = 8 * m
+        glyph = framebuf.FrameBuffer(bytearray(size * ((size + 7) // 8)), size, size, framebuf.MONO_VLSB)
+        glyph.fill(1 - c)
+        FrameBuffer.draw_char(glyph, character, 0, 0, m, c, t)
+        return glyph
+
+
+glyphs = GlyphCache()
+
+
 class FrameBuffer(framebuf.FrameBuffer):
-    def _reverse(self, s: string) -> string:
+    def _reverse(self, s: str) -> str:
         t = ""
         for i in range(0, len(s)):
             t += s[len(s) - 1 - i]
@@ -46,36 +107,46 @@ class FrameBuffer(framebuf.FrameBuffer):
         colour, c [optional parameter, default value c=1]
         optional parameter, r is rotation of the text: 0, 90, 180, or 270 degrees
         optional parameter, t is rotation of each character within the text: 0, 90, 180, or 270 degrees
+        characters come from the glyph cache (see GlyphCache), one blit each
         """
         colour = c
-        smallbuffer = bytearray(8)
-        letter = framebuf.FrameBuffer(smallbuffer, 8, 8, framebuf.MONO_HMSB)
         r = r % 360 // 90
         dx = 8 * m if r in (0, 2) else 0
         dy = 8 * m if r in (1, 3) else 0
         if r in (2, 3):
             s = self._reverse(s)
         t = r if t is None else t % 360 // 90
-        a, b, c, d = 1, 0, 0, 1
-        for i in range(0, t):
-            a, b, c, d = c, d, -a, -b
-        x0 = 0 if a + c > 0 else 7
-        y0 = 0 if b + d > 0 else 7
         for character in s:
-            letter.fill(0)
-            letter.text(character, 0, 0, 1)
-            for i in range(0, 8):
-                for j in range(0, 8):
-                    if letter.pixel(i, j) == 1:
-                        p = x0 + a * i + c * j
-                        q = y0 + b * i + d * j
-                        if m == 1:
-                            self.pixel(x + p, y + q, colour)
-                        else:
-                            self.fill_rect(x + p * m, y + q * m, m, m, colour)
+            glyph = glyphs.get(character, m, t, colour) if colour in (0, 1) else None
+            if glyph is None:
+                FrameBuffer.draw_char(self, character, x, y, m, colour, t)
+            else:
+                self.blit(glyph, x, y, 1 - colour)  # the background is see-through
             x += dx
             y += dy
 
+    @staticmethod
+    def draw_char(fbuf, character, x, y, m, c, t):
+        """Draw one character on fbuf pixel by pixel, scaled by m and
+        rotated by t quarter turns"""
+        smallbuffer = bytearray(8)
+        letter = framebuf.FrameBuffer(smallbuffer, 8, 8, framebuf.MONO_HMSB)
+        a, b, e, d = 1, 0, 0, 1
+        for i in range(0, t):
+            a, b, e, d = e, d, -a, -b
+        x0 = 0 if a + e > 0 else 7
+        y0 = 0 if b + d > 0 else 7
+        letter.text(character, 0, 0, 1)
+        for i in range(0, 8):
+            for j in range(0, 8):
+                if letter.pixel(i, j) == 1:
+                    p = x0 + a * i + e * j
+                    q = y0 + b * i + d * j
+                    if m == 1:
+                        fbuf.pixel(x + p, y + q, c)
+                    else:
+                        fbuf.fill_rect(x + p * m, y + q * m, m, m, c)
+
     def circle(self, x0, y0, radius, c, f: bool = None):
         """
         Circle drawing function.  Will draw a single pixel wide circle with
@@ -0,0 +1,161 @@
+from array import array
+import struct
+
+# Binary history formats, see History.binary()
+FORMAT_INT16 = 1
+FORMAT_DELTA = 2
+HEADER = '<BBHiHH'  # format, channels, sample period ms, start tick, samples per channel, reserved
+ESCAPE = -128  # delta byte followed by an absolute int16 value
+MODES = ('espresso', 'steam')  # stored as the index, see History.append()
+
+class History:
+    # Value stored for readings that are None (sensor off, no setpoint)
+    EMPTY = -32768
+
+    def __init__(self, length, period_ms=1000):
+        """Fixed size temperature/setpoint/heater duty/mode history.
+        Samples are stored as deci-degrees (tenths of a % for the duty) in
+        preallocated arrays, so appending is O(1) and does not allocate."""
+        self.length = length
+        self.period_ms = period_ms
+        self.temp = array('h', [History.EMPTY] * length)
+        self.setpoint = array('h', [History.EMPTY] * length)
+        self.duty = array('h', [History.EMPTY] * length)
+        self.mode = array('h', [History.EMPTY] * length)
+        self.channels = (self.temp, self.setpoint, self.duty, self.mode)
+        self.head = 0  # index of the oldest sample, next slot to be written
+        self.ticks = 0  # number of samples appended since boot, the next sequence number
+
+    @staticmethod
+    def encode(value):
+        if value is None:
+            return History.EMPTY
+        return int(round(value * 10))
+
+    @staticmethod
+    def decode(value):
+        if value == History.EMPTY:
+            return None
+        return value / 10
+
+    def append(self, temp, setpoint, duty=None, mode=None):
+        """Add a sample, overwriting the oldest one. duty is the heater duty
+        (0-1), mode one of MODES or None when the machine is off"""
+        self.temp[self.head] = History.encode(temp)
+        self.setpoint[self.head] = History.encode(setpoint)
+        self.duty[self.head] = History.encode(None if duty is None else duty * 100)
+        self.mode[self.head] = MODES.index(mode) if mode in MODES else History.EMPTY
+        self.head += 1
+        if self.head == self.length:
+            self.head = 0
+        self.ticks += 1
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def seq(self):
+        """Sequence number of the newest sample, every sample gets the next one"""
+        return self.ticks - 1
+
+    def snapshot(self, since=None):
+        """Get (sequence number of the first sample, number of samples, buffer
+        index of the first sample) for the samples newer than since, or the
+        whole history if since is None. If since has already been overwritten
+        the whole history is returned. A response takes one snapshot and
+        passes it to every channel, so samples appended while it is sent
+        don't make the channels disagree with the header or each other."""
+        start = self.ticks - self.length
+        if since is not None and since + 1 > start:
+            start = min(since + 1, self.ticks)
+        count = self.ticks - start
+        first = self.head - count
+        if first < 0:
+            first += self.length
+        return start, count, first
+
+    def raw(self, buf, snap):
+        """Iterate the stored deci-degree values of a channel in a snapshot
+        oldest first. Samples overwritten since the snapshot was taken, when
+        sending it took longer than the history is long, come out EMPTY."""
+        start, count, i = snap
+        for seq in range(start, start + count):
+            yield buf[i] if seq >= self.ticks - self.length else History.EMPTY
+            i += 1
+            if i == self.length:
+                i = 0
+
+    def values(self, buf, snap=None):
+        """Iterate a channel (self.temp, self.setpoint or self.duty in %)
+        oldest first, the samples in snap or the whole history"""
+        for v in self.raw(buf, snap or self.snapshot()):
+            yield History.decode(v)
+
+    def json_values(self, buf, snap=None):
+        """Yield a channel as a JSON array in small encoded pieces"""
+        yield b'['
+        sep = b''
+        for value in self.values(buf, snap):
+            yield sep
+            yield b'null' if value is None else str(value).encode()
+            sep = b', '
+        yield b']'
+
+    def modes(self, snap=None):
+        """Iterate the mode channel as mode names, None when off, oldest first"""
+        for v in self.raw(self.mode, snap or self.snapshot()):
+            yield None if v == History.EMPTY else MODES[v]
+
+    def mode_json(self, snap=None):
+        """Yield the mode channel as a JSON array of mode names and nulls"""
+        yield b'['
+        sep = b''
+        for v in self.raw(self.mode, snap or self.snapshot()):
+            yield sep
+            yield b'null' if v == History.EMPTY else b'"' + MODES[v].encode() + b'"'
+            sep = b', '
+        yield b']'
+
+    def binary(self, fmt=FORMAT_DELTA, since=None):
+        """Yield the history in a compact binary form, in small pieces.
+        A header (see HEADER) is followed by the temp, setpoint, duty and mode
+        samples, a channel after the other, each oldest first. FORMAT_INT16 stores each sample as a
+        little endian int16 of deci-degrees (EMPTY for None). FORMAT_DELTA
+        stores each sample as an int8 difference to the previous one, or as
+        ESCAPE followed by the int16 value when the difference doesn't fit.
+        The start tick is the sequence number of the first sample. The
+        channels all come from one snapshot taken before the header."""
+        snap = self.snapshot(since)
+        start, count = snap[:2]
+        yield struct.pack(HEADER, fmt, len(self.channels), self.period_ms, start, count, 0)
+        block = bytearray(64)
+        for buf in self.channels:
+            n = 0
+            prev = History.EMPTY
+            for v in self.raw(buf, snap):
+                if n > len(block) - 3:
+                    yield memoryview(block)[:n]
+                    n = 0
+                if fmt == FORMAT_INT16:
+                    block[n] = v & 0xff
+                    block[n + 1] = (v >> 8) & 0xff
+                    n += 2
+                    continue
+                d = v - prev
+                if v == prev or (-128 < d < 128 and v != History.EMPTY and prev != History.EMPTY):
+                    block[n] = d & 0xff
+                    n += 1
+                else:
+                    block[n] = ESCAPE & 0xff
+                    block[n + 1] = v & 0xff
+                    block[n + 2] = (v >> 8) & 0xff
+                    n += 3
+                prev = v
+            if n:
+                yield memoryview(block)[:n]
+
+    def __iter__(self):
+        """Iterate (temp, setpoint) pairs oldest first"""
+        for k in range(self.length):
+            i = (self.head + k) % self.length
+            yield History.decode(self.temp[i]), History.decode(self.setpoint[i])
@@ -0,0 +1,133 @@
+from array import array
+from math import exp
+import time
+
+class BoilerModel:
+    def __init__(self, gain, tau, dead_time, ambient=22.0):
+        """First order plus dead time boiler: tau dT/dt = gain*u - (T - ambient)
+        for heater power u (0-1), seen dead_time seconds late.
+        gain: degrees above ambient full power would reach, tau: seconds."""
+        self.gain = gain
+        self.tau = tau
+        self.dead_time = dead_time
+        self.ambient = ambient
+
+    def step(self, temp, u, dt):
+        """Temperature dt seconds on with the heater at u"""
+        target = self.ambient + self.gain * u
+        return target + (temp - target) * exp(-dt / self.tau)
+
+    def hold_power(self, temp):
+        """Heater power (0-1) that holds temp"""
+        return (temp - self.ambient) / self.gain
+
+    @staticmethod
+    def from_heat_up(times, temps, duties, setpoint, ambient=None):
+        """Fit a model to a logged heat up from cold: seconds, temperatures and
+        heater duties (0-1) of a run that heats at full power and then holds
+        setpoint. The full power part gives the heating rate and the dead time,
+        the power holding the setpoint gives the gain, and the two the time
+        constant. Returns None if the log doesn't have both parts."""
+        samples = [(t, T, u) for t, T, u in zip(times, temps, duties) if T is not None]
+        start = None
+        for t, T, u in samples:
+            if u > 0:
+                start = (t, T)
+                break
+        if start is None:
+            return None
+        if ambient is None:
+            ambient = start[1]
+
+        # least squares line through the full power part
+        rise = [(t, T) for t, T, u in samples if u >= 0.99 and ambient + 5 <= T <= setpoint - 5]
+        hold = [u for t, T, u in samples if t > start[0] and abs(T - setpoint) < 0.5]
+        if len(rise) < 10 or len(hold) < 10:
+            return None
+        n = len(rise)
+        mean_t = sum(t for t, _ in rise) / n
+        mean_T = sum(T for _, T in rise) / n
+        slope = sum((t - mean_t) * (T - mean_T) for t, T in rise) / sum((t - mean_t) ** 2 for t, _ in rise)
+        dead_time = max(0.0, mean_t - (mean_T - start[1]) / slope - start[0])
+
+        hold = hold[len(hold) // 2:]  # once settled
+        u_hold = sum(hold) / len(hold)
+        gain = (setpoint - ambient) / u_hold
+        tau = (gain - (mean_T - ambient)) / slope
+        return BoilerModel(gain, tau, dead_time, ambient)
+
+
+class PredictiveController:
+    def __init__(self, model, setpoint=None, horizon=None, response=None, sample_time=0.5):
+        """Predictive functional control on a BoilerModel, a drop in for
+        PIDController to be called about once a second.
+        The model runs alongside the boiler. Its change over the dead time is
+        added to the reading (a Smith predictor), which estimates where the
+        temperature is heading once the heater changes already made show up.
+        The heater power is then worked out so that the model, from there,
+        meets a reference curve that closes the gap to the setpoint with a
+        time constant of response seconds, at horizon seconds ahead.
+        Both default to the dead time."""
+        self.model = model
+        dead = max(model.dead_time, 1.0)
+        self.horizon = horizon or dead
+        self.response = response or dead
+        self.sample_ms = int(sample_time * 1000)
+        self.output_limits = (0, 100)
+        self.setpoint = setpoint
+        # model temperatures over the last dead time, one per call
+        self.delay = array('f', [0.0] * max(1, int(round(model.dead_time))))
+        self.last_time = time.ticks_ms()
+        self.reset()
+
+    def set_setpoint(self, setpoint):
+        """Update the target setpoint."""
+        self.setpoint = setpoint
+
+    def set_model(self, model):
+        """Switch to an updated model, keeping the state"""
+        if int(round(model.dead_time)) != int(round(self.model.dead_time)):
+            self.delay = array('f', [self.model_temp or 0.0] * max(1, int(round(model.dead_time))))
+            self.pos = 0
+        self.model = model
+
+    def set_tunings(self, kp, ki, kd):
+        """PID tunings don't apply, kept for the PIDController interface"""
+        pass
+
+    def reset(self):
+        self.model_temp = None
+        self.pos = 0
+        self.output = 0
+        self.u = 0.0
+
+    def compute(self, process_value):
+        current_time = time.ticks_ms()
+        if self.setpoint is None:
+            self.last_time = current_time
+            self.reset()
+            return 0
+        dt = time.ticks_diff(current_time, self.last_time) / 1000
+        if dt < self.sample_ms / 1000 and self.model_temp is not None:
+            return self.u
+        self.last_time = current_time
+
+        model = self.model
+        delay = self.delay
+        if self.model_temp is None:
+            self.model_temp = process_value
+            for i in range(len(delay)):
+                delay[i] = process_value
+        else:
+            self.model_temp = model.step(self.model_temp, self.u, dt)
+        delayed = delay[self.pos]  # model temperature a dead time ago
+        delay[self.pos] = self.model_temp
+        self.pos = (self.pos + 1) % len(delay)
+
+        start = process_value + self.model_temp - delayed
+        reference = self.setpoint - (self.setpoint - start) * exp(-self.horizon / self.response)
+        a = exp(-self.horizon / model.tau)
+        u = ((reference - start * a) / (1 - a) - model.ambient) / model.gain
+        self.u = min(max(u, 0.0), 1.0)
+        self.output = self.u * 100
+        return self.u
@@ -77,3 +77,204 @@ class PIDController:
     def set_setpoint(self, setpoint):
         """Update the target setpoint."""
         self.setpoint = setpoint
+
+
+class FixedPointPID:
+    SCALE = 1000  # gains are stored as integers times SCALE
+    OUT_MAX = 100000  # output in thousandths of a percent
+    TRANSFER_MS = 10000  # fade time of the transfer term without an integral
+    
+    def __init__(self, kp, ki, kd, setpoint=None, b=1.0, ff=0.0, d_filter=2.0, ambient=22.0, i_max=10.0, sample_time=0.1):
+        """PID in integer arithmetic, a drop in for PIDController.
+        Temperatures are handled in deci-degrees and the terms in thousandths
+        of a percent, so a step only makes floats to convert the reading in
+        and the output out.
+        b: setpoint weight, so a setpoint step kicks less. The P term sees b
+        of a setpoint step at once and the rest with the integral time Ti,
+        which is how b*setpoint - temp in the P term works out without
+        leaving the integral to make up the difference.
+        ff: feed-forward in % per degree of setpoint above ambient, the power
+        that just makes up the heat loss there.
+        d_filter: time constant (s) of the low pass on the D term, which acts
+        on the measurement only.
+        The integral is limited by back-calculation: while the output is
+        saturated it is pulled back by the excess, with a time constant of
+        sqrt(Ti*Td). It is also kept within +-i_max %.
+        A change of tunings (ScheduledPID) makes up its step in the P term
+        with a transfer term, kept apart from the integral and its limit and
+        faded out over Ti."""
+        self.output_limits = (0, 100)
+        self.sample_ms = int(sample_time * 1000)
+        self.ambient = int(round(ambient * 10))
+        self.b = self.ff = self.d_filter = None
+        self.set_tunings(kp, ki, kd, b, ff, d_filter)
+        self.i_max = int(i_max * 1000)
+        self.setpoint = None
+        self.sp = 0  # setpoint in deci-degrees
+        self.sp_w = None  # weighted setpoint seen by the P term
+        self.set_setpoint(setpoint)
+        self.last_time = time.ticks_ms()
+        self.reset()
+        self.output = 0
+        
+    def set_tunings(self, kp, ki, kd, b=None, ff=None, d_filter=None):
+        """Update PID tuning parameters, None leaves one unchanged."""
+        S = FixedPointPID.SCALE
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        if b is not None:
+            self.b = b
+        if ff is not None:
+            self.ff = ff
+        if d_filter is not None:
+            self.d_filter = d_filter
+        self.kp_q = int(round(kp * S))
+        self.ki_q = int(round(ki * S))
+        self.kd_q = int(round(kd * S))
+        self.b_q = int(round(self.b * S))
+        self.ff_q = int(round(self.ff * S))
+        self.tf_ms = int(self.d_filter * 1000)
+        self.ti_ms = int(kp / ki * 1000) if ki else 0
+        # anti-windup tracking time sqrt(Ti*Td), Ti without D
+        if ki and kd:
+            self.tt_ms = int((kd / ki) ** 0.5 * 1000)
+        else:
+            self.tt_ms = self.ti_ms
+        
+    def set_setpoint(self, setpoint):
+        """Update the target setpoint."""
+        if setpoint is not None:
+            sp = int(round(setpoint * 10))
+            if self.setpoint is not None and self.sp_w is not None:
+                # the weighted setpoint takes b of the step now
+                self.sp_w += self.b_q * (sp - self.sp) // FixedPointPID.SCALE
+            self.sp = sp
+        self.setpoint = setpoint
+        
+    def reset(self):
+        """Reset the PID controller's internal state."""
+        self.integral = 0
+        self.transfer = 0
+        self.d = 0
+        self.last_pv = None
+        self.sp_w = None
+        
+    def compute(self, process_value):
+        current_time = time.ticks_ms()
+        if self.setpoint is None:
+            self.last_time = current_time
+            self.reset()
+            self.output = 0
+            return 0
+        
+        dt = time.ticks_diff(current_time, self.last_time)
+        # Only update if sample_time has passed
+        if dt < self.sample_ms:
+            return self.output / FixedPointPID.OUT_MAX
+        self.last_time = current_time
+        
+        S = FixedPointPID.SCALE
+        sp = self.sp
+        pv = int(round(process_value * 10))
+        
+        if self.sp_w is None:
+            # switched on, a step from the current temperature
+            self.sp_w = pv + self.b_q * (sp - pv) // S
+        if self.ti_ms:
+            self.sp_w += (sp - self.sp_w) * dt // (self.ti_ms + dt)
+        else:
+            self.sp_w = sp
+        p = self.kp_q * (self.sp_w - pv) // 10
+        
+        # derivative on measurement, low pass filtered
+        if self.last_pv is not None:
+            d_raw = self.kd_q * (pv - self.last_pv) * 100 // dt
+            self.d += (d_raw - self.d) * dt // (self.tf_ms + dt)
+        self.last_pv = pv
+        
+        ff = self.ff_q * (sp - self.ambient) // 10
+        self.integral += self.ki_q * (sp - pv) * dt // 10000
+        
+        if self.transfer:
+            tau = self.ti_ms or FixedPointPID.TRANSFER_MS
+            self.transfer -= self.transfer * dt // (tau + dt)
+        
+        v = p + self.integral + self.transfer + ff - self.d
+        u = min(max(v, 0), FixedPointPID.OUT_MAX)
+        if u != v and self.transfer and (v > u) == (self.transfer > 0):
+            # saturated, the transfer term gives up the excess first
+            take = v - u if abs(v - u) < abs(self.transfer) else self.transfer
+            self.transfer -= take
+            v -= take
+        if u != v and self.tt_ms:
+            # back-calculation, pull the integral back by the excess
+            self.integral += (u - v) * min(dt, self.tt_ms) // self.tt_ms
+        self.integral = min(max(self.integral, -self.i_max), self.i_max)
+        
+        self.output = u
+        return u / FixedPointPID.OUT_MAX #returns between 0 and 1
+
+
+class ScheduledPID:
+    def __init__(self, pid, schedule, mode='espresso'):
+        """Gain scheduling around a FixedPointPID, a drop in for PIDController.
+        schedule maps a mode to bands [[error, P, I, D], ...], largest error
+        first. The first band the error (setpoint - temperature) is at least
+        is used, below the last one or in a mode with no bands the PID keeps
+        its own tunings. Switching is bumpless: the change in the P term goes
+        into the PID's transfer term, outside the integral limit, and fades
+        out over the new Ti."""
+        self.pid = pid
+        self.schedule = schedule
+        self.default = (pid.kp, pid.ki, pid.kd)
+        self.bands = ()
+        self.band = None
+        self.set_mode(mode)
+        
+    @property
+    def setpoint(self):
+        return self.pid.setpoint
+        
+    @property
+    def output(self):
+        return self.pid.output
+        
+    def set_mode(self, mode):
+        """Use the bands of a mode (espresso, steam)"""
+        self.bands = self.schedule.get(mode, ())
+        self.band = None
+        
+    def set_setpoint(self, setpoint):
+        self.pid.set_setpoint(setpoint)
+        
+    def set_tunings(self, kp, ki, kd):
+        """Set the tunings used outside the bands"""
+        self.default = (kp, ki, kd)
+        self.band = None
+        
+    def reset(self):
+        self.pid.reset()
+        
+    def compute(self, process_value):
+        if self.pid.setpoint is not None:
+            error = self.pid.setpoint - process_value
+            band = len(self.bands)
+            for i in range(len(self.bands)):
+                if error >= self.bands[i][0]:
+                    band = i
+                    break
+            if band != self.band:
+                self.band = band
+                if band < len(self.bands):
+                    self.switch(*self.bands[band][1:])
+                else:
+                    self.switch(*self.default)
+        return self.pid.compute(process_value)
+        
+    def switch(self, kp, ki, kd):
+        pid = self.pid
+        kp_q = pid.kp_q
+        pid.set_tunings(kp, ki, kd)
+        if pid.sp_w is not None and pid.last_pv is not None:
+            pid.transfer += (kp_q - pid.kp_q) * (pid.sp_w - pid.last_pv) // 10
@@ -0,0 +1,75 @@
+from math import log
+from utime import ticks_ms, ticks_diff
+
+class ReadyMonitor:
+    HEATING = 'heating'
+    COOLING = 'cooling'
+    SETTLING = 'settling'
+    READY = 'ready'
+
+    def __init__(self, band=0.5, hold=30):
+        """Works out if the boiler is ready and how long until it will be.
+        It is ready once the temperature has stayed within band C of the
+        setpoint for hold seconds, and stops being ready when it leaves twice
+        the band (a shot), so noise at the edge doesn't flip it back and forth."""
+        self.band = band
+        self.hold = hold * 1000
+        self.state = None
+        self.since = None  # ticks_ms the temperature came within the band
+        self.eta = None  # seconds until ready, None if unknown
+
+    def reset(self):
+        self.state = None
+        self.since = None
+        self.eta = None
+
+    def update(self, temp, setpoint, rate, model=None):
+        """Feed a reading, the temperature rate (C/s) and the boiler model
+        (gain, tau, dead_time, ambient) if there is one.
+        Returns True the moment the boiler becomes ready."""
+        if temp is None or setpoint is None:
+            self.reset()
+            return False
+        now = ticks_ms()
+        diff = temp - setpoint
+        was_ready = self.state == ReadyMonitor.READY
+        if abs(diff) <= self.band or (was_ready and abs(diff) <= 2 * self.band):
+            if self.since is None:
+                self.since = now
+            left = self.hold - ticks_diff(now, self.since)
+            if was_ready or left <= 0:
+                self.state = ReadyMonitor.READY
+                self.eta = 0
+                return not was_ready
+            self.state = ReadyMonitor.SETTLING
+            self.eta = (left + 999) // 1000
+            return False
+
+        self.since = None
+        self.state = ReadyMonitor.HEATING if diff < 0 else ReadyMonitor.COOLING
+        eta = self.time_to_band(temp, setpoint, rate, model)
+        self.eta = None if eta is None else int(eta + self.hold / 1000)
+        return False
+
+    def time_to_band(self, temp, setpoint, rate, model):
+        """Seconds for the temperature to get within the band, extrapolating
+        the current rate. When heating, the model at full power gives a lower
+        bound, as the controller eases off on the way. When cooling the heater
+        is off, which the model predicts better than the rate. None if the
+        temperature isn't heading for the setpoint."""
+        heating = temp < setpoint
+        edge = setpoint - self.band if heating else setpoint + self.band
+        predicted = None
+        if model:
+            gain, tau, dead_time, ambient = model
+            target = ambient + gain if heating else ambient
+            if (target - edge) * (target - temp) > 0:
+                predicted = tau * log((target - temp) / (target - edge))
+        if not heating and predicted is not None:
+            return predicted
+        if heating and rate < 0.01 or not heating and rate > -0.01:
+            return None
+        eta = (edge - temp) / rate
+        if predicted is not None:
+            eta = max(eta, predicted)
+        return eta
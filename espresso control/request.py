@@ -0,0 +1,163 @@
+import micropython
+
+# methods, as bits so routes can allow several
+GET = 1
+POST = 2
+HEAD = 4
+
+CR = 13
+LF = 10
+SPACE = 32
+COLON = 58
+QUESTION = 63
+
+class Request:
+    def __init__(self, size=1024):
+        """HTTP request parsed in place in a receive buffer that is reused for
+        every request on a connection. Only the method, path, query and the few
+        headers the server acts on are picked out, as offsets into the buffer."""
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.filled = 0  # bytes received into buf
+        self.reset()
+
+    def reset(self):
+        """Forget the parsed request, keeping any bytes already received"""
+        self.scan = 0  # where parsing got to
+        self.line_start = 0
+        self.lines = 0
+        self.method = 0
+        self.path_start = 0
+        self.path_end = 0
+        self.query_start = 0  # 0 if there is no query string
+        self.query_end = 0
+        self.header_end = 0  # start of the body, 0 until all headers are in
+        self.content_length = 0
+        self.bad = False  # malformed, e.g. a Content-Length that isn't a number
+        self.etag_start = 0  # If-None-Match value
+        self.etag_end = 0
+        self.close = False  # Connection: close
+
+    @micropython.native
+    def parse(self):
+        """Scan the bytes received since the last call.
+        Returns True once all the headers are in."""
+        buf = self.buf
+        i = self.scan
+        end = self.filled - 1
+        while i < end:
+            if buf[i] == CR and buf[i + 1] == LF:
+                if i == self.line_start:
+                    # blank line ends the headers
+                    self.header_end = i + 2
+                    self.scan = i + 2
+                    return True
+                if self.lines == 0:
+                    self.parse_request_line(self.line_start, i)
+                else:
+                    self.parse_header(self.line_start, i)
+                self.lines += 1
+                i += 2
+                self.line_start = i
+            else:
+                i += 1
+        self.scan = i
+        return False
+
+    def parse_request_line(self, start, end):
+        buf = self.buf
+        if self.matches(start, b'GET '):
+            self.method = GET
+        elif self.matches(start, b'POST '):
+            self.method = POST
+        elif self.matches(start, b'HEAD '):
+            self.method = HEAD
+        i = start
+        while i < end and buf[i] != SPACE:
+            i += 1
+        i += 1
+        self.path_start = i
+        while i < end and buf[i] != SPACE and buf[i] != QUESTION:
+            i += 1
+        self.path_end = i
+        if i < end and buf[i] == QUESTION:
+            i += 1
+            self.query_start = i
+            while i < end and buf[i] != SPACE:
+                i += 1
+            self.query_end = i
+
+    def parse_header(self, start, end):
+        buf = self.buf
+        colon = start
+        while colon < end and buf[colon] != COLON:
+            colon += 1
+        value = colon + 1
+        while value < end and buf[value] == SPACE:
+            value += 1
+        name_len = colon - start
+        if name_len == 14 and self.matches(start, b'content-length', True):
+            while end > value and buf[end - 1] == SPACE:
+                end -= 1
+            n = 0
+            for i in range(value, end):
+                c = buf[i]
+                if c < 48 or c > 57:  # digits only
+                    self.bad = True
+                    return
+                n = n * 10 + c - 48
+            if end == value:
+                self.bad = True
+                return
+            self.content_length = n
+        elif name_len == 10 and self.matches(start, b'connection', True):
+            self.close = self.matches(value, b'close', True)
+        elif name_len == 13 and self.matches(start, b'if-none-match', True):
+            self.etag_start = value
+            self.etag_end = end
+
+    def matches(self, start, text, ignore_case=False):
+        """Check if the buffer holds text at start"""
+        buf = self.buf
+        if start + len(text) > self.filled:
+            return False
+        for i in range(len(text)):
+            c = buf[start + i]
+            if ignore_case and 65 <= c <= 90:
+                c += 32
+            if c != text[i]:
+                return False
+        return True
+
+    def complete(self):
+        """True once the headers and the whole body are in"""
+        return self.header_end > 0 and self.filled >= self.header_end + self.content_length
+
+    def path(self):
+        return str(self.mv[self.path_start:self.path_end], 'utf-8')
+
+    def query(self):
+        if not self.query_start:
+            return None
+        return str(self.mv[self.query_start:self.query_end], 'utf-8')
+
+    def body(self):
+        return self.mv[self.header_end:self.header_end + self.content_length]
+
+    def etag_matches(self, etag):
+        """Check the If-None-Match header against etag (bytes)"""
+        start = self.etag_start
+        while start + len(etag) <= self.etag_end:
+            if self.matches(start, etag):
+                return True
+            start += 1
+        return False
+
+    def consume(self):
+        """Drop the handled request, moving any pipelined bytes after it to the front"""
+        end = self.header_end + self.content_length
+        rest = self.filled - end
+        if rest > 0:
+            self.buf[:rest] = self.buf[end:self.filled]
+        self.filled = max(0, rest)
+        self.reset()
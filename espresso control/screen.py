@@ -0,0 +1,51 @@
+class Screen:
+    def __init__(self, oled, partial=True):
+        """Retained drawing on the OLED: each item on the screen has a key and
+        is only redrawn when what it shows changes, and show() then sends
+        just the changed area (SSD1306.show_dirty). partial=False redraws
+        and sends the whole screen every time, as before. Items must not
+        overlap, a changed one is cleared before it is drawn again."""
+        self.oled = oled
+        self.partial = partial
+        self.items = {}  # key: (what, x, y, w, h)
+        self.wipe = True
+
+    def invalidate(self):
+        """Forget what is on the screen, after drawing on it directly"""
+        self.items = {}
+        self.wipe = True
+
+    def item(self, key, what, x, y, w, h, draw, *args):
+        """Draw what with draw(*args) in the rectangle if it isn't there already"""
+        if self.wipe:
+            self.oled.fill(0)
+            self.oled.mark(0, 0, self.oled.width, self.oled.height)
+            self.wipe = False
+        old = self.items.get(key)
+        shown = (what, x, y, w, h)
+        if old == shown:
+            return
+        if old:
+            self.oled.fill_rect(old[1], old[2], old[3], old[4], 0)
+            self.oled.mark(old[1], old[2], old[3], old[4])
+        draw(*args)
+        self.oled.mark(x, y, w, h)
+        self.items[key] = shown
+
+    def text(self, key, s, x, y, scale=1):
+        """Text in the 8x8 font, scale times the size"""
+        size = 8 * scale
+        if scale == 1:
+            self.item(key, s, x, y, size * len(s), size, self.oled.text, s, x, y, 1)
+        else:
+            self.item(key, s, x, y, size * len(s), size, self.oled.large_text, s, x, y, scale)
+
+    def hline(self, key, x, y, w):
+        self.item(key, None, x, y, w, 1, self.oled.hline, x, y, w, 1)
+
+    def show(self):
+        if self.partial:
+            self.oled.show_dirty()
+        else:
+            self.oled.show()
+            self.invalidate()
@@ -32,9 +32,7 @@ function updateStatus(state) {
     
     updateSwitchAvailability();
     
-    if (state.on_interval === true) {
-        updateChart(state.current_temp, state.setpoint);
-    }
+    syncHistory(state);
     
     if (state.alarm_time === null) {
         alarmDisplay.textContent = "--";
@@ -42,6 +40,22 @@ function updateStatus(state) {
         alarmDisplay.textContent = state.alarm_time;
     }
     
+    updateReady(state);
+}
+
+function updateReady(state) {
+    const readyDisplay = document.getElementById("readyEta");
+    if (!state.power || !state.ready) {
+        readyDisplay.textContent = "--";
+    } else if (state.ready === "ready") {
+        readyDisplay.textContent = "Now";
+    } else if (state.ready_eta === null) {
+        readyDisplay.textContent = state.ready;
+    } else {
+        const minutes = Math.floor(state.ready_eta / 60);
+        const seconds = String(state.ready_eta % 60).padStart(2, "0");
+        readyDisplay.textContent = `${state.ready} (${minutes}:${seconds})`;
+    }
 }
 
 function updateSettings(state) {
@@ -113,8 +127,12 @@ async function sendRequest(endpoint, data) {
         if (endpoint === "/settings") {
             updateSettings(result);
         }
+        if (endpoint === "/autotune") {
+            updateAutotune(result);
+        }
         if (endpoint === "/history") {
             createHistory(result);
+            historySeq = result.seq;
         }
 
     } catch (error) {
@@ -197,12 +215,46 @@ saveBtn.addEventListener("click", async () => {
     }
 });
 
+// Autotune, polled while it runs
+const autotuneBtn = document.getElementById("autotuneBtn");
+let autotuneRunning = false;
+let autotuneTimer = null;
+
+function updateAutotune(state) {
+    const wasRunning = autotuneRunning;
+    autotuneRunning = state.state === "running";
+    let text = state.state;
+    if (state.message) {
+        text += ": " + state.message;
+    }
+    if (autotuneRunning) {
+        text += ` (${state.cycles}/${state.of} cycles)`;
+    }
+    document.getElementById("autotuneStatus").textContent = text;
+    autotuneBtn.textContent = autotuneRunning ? "Abort" : "Start";
+    
+    clearTimeout(autotuneTimer);
+    if (autotuneRunning) {
+        autotuneTimer = setTimeout(() => sendRequest("/autotune", {}), 5000);
+    } else if (wasRunning) {
+        sendRequest("/settings");  // show the new tunings
+    }
+}
+
+autotuneBtn.addEventListener("click", () => {
+    if (autotuneRunning) {
+        sendRequest("/autotune", { action: "abort" });
+    } else {
+        sendRequest("/autotune", { action: "start", rule: document.getElementById("autotuneRule").value });
+    }
+});
+
 function createHistory(history){
     const tempHistory = history.temp_history;
     const setpointHistory = history.setpoint_history;
+    const period = history.period_ms || 1000;
     const timeLabels = Array.from({ length: setpointHistory.length }, (_, i) => {
-        const step = 10 / (setpointHistory.length - 1); // Calculate the step size
-        return -10 + i * step; // Generate each time label
+        return (i - (setpointHistory.length - 1)) * period / 60000; // minutes before now
     });
     
     temperatureGraph.data.labels = timeLabels;   
@@ -213,6 +265,103 @@ function createHistory(history){
     temperatureGraph.update();
 }
 
+// Binary history, see History.binary() in history.py
+const HISTORY_INT16 = 1;
+const HISTORY_DELTA = 2;
+const HISTORY_EMPTY = -32768;
+const HISTORY_ESCAPE = -128;
+
+function decodeHistory(buffer) {
+    const view = new DataView(buffer);
+    const format = view.getUint8(0);
+    const channels = view.getUint8(1);
+    const count = view.getUint16(8, true);
+    const series = [];
+    let offset = 12;
+    
+    if (format === HISTORY_INT16) {
+        const samples = new Int16Array(buffer, offset, count * channels);
+        for (let c = 0; c < channels; c++) {
+            series.push(Array.from(samples.subarray(c * count, (c + 1) * count)));
+        }
+    } else {
+        const bytes = new Int8Array(buffer);
+        for (let c = 0; c < channels; c++) {
+            const values = new Array(count);
+            let prev = HISTORY_EMPTY;
+            for (let i = 0; i < count; i++) {
+                const d = bytes[offset++];
+                if (d === HISTORY_ESCAPE) {
+                    prev = view.getInt16(offset, true);
+                    offset += 2;
+                } else {
+                    prev += d;
+                }
+                values[i] = prev;
+            }
+            series.push(values);
+        }
+    }
+    
+    const toTemp = (v) => (v === HISTORY_EMPTY ? null : v / 10);
+    return {
+        period_ms: view.getUint16(2, true),
+        start: view.getInt32(4, true),
+        temp_history: series[0].map(toTemp),
+        setpoint_history: series[1].map(toTemp)
+    };
+}
+
+let historySeq = null; // sequence number of the newest sample on the chart
+let historySyncing = false;
+
+async function loadHistory() {
+    historySyncing = true;
+    try {
+        const response = await fetch("/history?format=delta");
+        const history = decodeHistory(await response.arrayBuffer());
+        createHistory(history);
+        historySeq = history.start + history.temp_history.length - 1;
+    } catch (error) {
+        console.error("Error loading binary history:", error);
+        sendRequest("/history");
+    }
+    historySyncing = false;
+}
+
+// Fetch only the samples recorded since the newest one on the chart
+async function catchUpHistory() {
+    historySyncing = true;
+    try {
+        const response = await fetch(`/history?format=delta&since=${historySeq}`);
+        const history = decodeHistory(await response.arrayBuffer());
+        if (history.start !== historySeq + 1) {
+            // missed more than the whole window
+            historySyncing = false;
+            return loadHistory();
+        }
+        for (let i = 0; i < history.temp_history.length; i++) {
+            updateChart(history.temp_history[i], history.setpoint_history[i]);
+        }
+        historySeq = history.start + history.temp_history.length - 1;
+    } catch (error) {
+        console.error("Error syncing history:", error);
+    }
+    historySyncing = false;
+}
+
+function syncHistory(state) {
+    if (historySeq === null || historySyncing || state.history_seq <= historySeq) {
+        return;
+    }
+    if (state.history_seq === historySeq + 1) {
+        updateChart(state.current_temp, state.setpoint);
+        historySeq = state.history_seq;
+    } else {
+        catchUpHistory();
+    }
+}
+
 let ctx = document.getElementById("temperatureGraph").getContext('2d');
 
 const data = {
@@ -252,8 +401,46 @@ function updateChart(newTemp, newSetpoint) {
 }
 
 getStatus();
-sendRequest("/history");
+loadHistory();
 sendRequest("/settings");
+sendRequest("/autotune", {});
+
 
+// Status is pushed by the server, fall back to polling without EventSource
+let pollTimer = null;
+
+function startPolling() {
+    if (pollTimer === null) {
+        pollTimer = setInterval(getStatus, 1000);
+    }
+}
+
+if (window.EventSource) {
+    const events = new EventSource("/events");
+    events.onmessage = (event) => {
+        updateStatus(JSON.parse(event.data));
+    };
+    // sent once when the boiler has settled at the setpoint
+    events.addEventListener("ready", (event) => {
+        updateStatus(JSON.parse(event.data));
+        if (document.hidden) {
+            document.title = "Ready - " + document.title.replace(/^Ready - /, "");
+        }
+    });
+    events.onerror = () => {
+        // EventSource retries by itself unless the connection was refused
+        if (events.readyState === EventSource.CLOSED) {
+            startPolling();
+        }
+    };
+} else {
+    startPolling();
+}
 
-setInterval(getStatus, 1000);
+// catch up straight away when a backgrounded tab is shown again
+document.addEventListener("visibilitychange", () => {
+    if (!document.hidden) {
+        document.title = document.title.replace(/^Ready - /, "");
+        getStatus();
+    }
+});
@@ -0,0 +1,128 @@
+from array import array
+
+SCALE = const(256)  # filtered values are in 1/256 of a sensor step
+LEVELS = const(2048)  # 11 bit readings
+
+class SensorFilter:
+    MODE = 'mode'
+    MEDIAN = 'median'
+    TRIMMED = 'trimmed'
+    EMA = 'ema'
+    METHODS = (MODE, MEDIAN, TRIMMED, EMA)
+
+    def __init__(self, method='mode', window=15, trim=0.2, ema_shift=2):
+        """Filters raw sensor readings as they arrive, so reading the result
+        is just an attribute and nothing is allocated on either side.
+        mode: the most common of the last window readings (the newest wins
+            a tie), from running counts of each value
+        median: the middle of the last window readings, kept in order
+        trimmed: the mean of the last window readings without the lowest and
+            highest trim fraction
+        ema: exponential average, each reading moves it 1/2**ema_shift of
+            the way
+        The trimmed mean and the EMA resolve steps smaller than the 0.1 C of
+        a reading, which the PID derivative sees as a smoother rate. value
+        is the result in 1/SCALE steps, None before the first reading.
+        window is at most 255."""
+        if method not in SensorFilter.METHODS:
+            print('unknown sensor filter', method, 'using mode')
+            method = SensorFilter.MODE
+        self.method = method
+        self.window = min(max(window, 1), 255)
+        self.samples = array('h', [0] * self.window)  # ring of the last readings
+        self.order = array('h', [0] * self.window)  # the same readings sorted
+        self.counts = bytearray(LEVELS) if method == SensorFilter.MODE else None
+        self.trim = int(self.window * trim)
+        self.ema_shift = ema_shift
+        self.n = 0
+        self.pos = 0
+        self.mode = 0
+        self.value = None
+
+    def reset(self):
+        if self.counts is not None:
+            for k in range(self.n):
+                self.counts[self.samples[k]] = 0
+        self.n = 0
+        self.pos = 0
+        self.value = None
+
+    def add(self, raw):
+        """Add a reading (0 to 2047). Safe to call from a timer callback."""
+        pos = self.pos
+        if self.n == self.window:
+            old = self.samples[pos]
+        else:
+            old = -1
+            self.n += 1
+        self.samples[pos] = raw
+        self.pos = (pos + 1) % self.window
+        method = self.method
+        if method == SensorFilter.EMA:
+            if self.value is None:
+                self.value = raw * SCALE
+            else:
+                self.value += (raw * SCALE - self.value) >> self.ema_shift
+        elif method == SensorFilter.MODE:
+            self.add_mode(raw, old)
+        else:
+            self.add_sorted(raw, old)
+            if method == SensorFilter.MEDIAN:
+                self.value = self.median()
+            else:
+                self.value = self.trimmed_mean()
+
+    def add_mode(self, raw, old):
+        counts = self.counts
+        if old >= 0:
+            counts[old] -= 1
+        counts[raw] += 1
+        mode = self.mode
+        if self.value is None or raw == mode:
+            mode = raw
+        elif old == mode:
+            # its count went down, another value may be as common now
+            best = 0
+            k = self.pos
+            for _ in range(self.n):
+                k = (k - 1) % self.window  # newest first
+                v = self.samples[k]
+                if counts[v] > best:
+                    best = counts[v]
+                    mode = v
+        elif counts[raw] >= counts[mode]:
+            mode = raw
+        self.mode = mode
+        self.value = mode * SCALE
+
+    def add_sorted(self, raw, old):
+        """Take old out of self.order and put raw in, shifting in place"""
+        order = self.order
+        n = self.n  # counting raw
+        if old >= 0:
+            i = 0
+            while order[i] != old:
+                i += 1
+            while i < n - 1:
+                order[i] = order[i + 1]
+                i += 1
+        i = n - 1
+        while i > 0 and order[i - 1] > raw:
+            order[i] = order[i - 1]
+            i -= 1
+        order[i] = raw
+
+    def median(self):
+        n = self.n
+        mid = n // 2
+        if n & 1:
+            return self.order[mid] * SCALE
+        return (self.order[mid - 1] + self.order[mid]) * SCALE // 2
+
+    def trimmed_mean(self):
+        n = self.n
+        cut = self.trim * n // self.window
+        total = 0
+        for k in range(cut, n - cut):
+            total += self.order[k]
+        return total * SCALE // (n - 2 * cut)
@@ -0,0 +1,139 @@
+from utime import ticks_ms, ticks_diff
+
+RATE = 10  # readings a second the TSic306 sends
+
+class SensorHealth:
+    OK = 'ok'
+    HOLD = 'hold'  # last good temperature held, heater as normal
+    DEGRADED = 'degraded'  # still held, heater duty capped
+    FAULT = 'fault'  # shut down
+
+    # what get_temp made of a reading
+    GOOD = 0
+    MISSING = 1  # no reading, or a parity error
+    JUMP = 2  # rejected, too far from the estimate
+
+    def __init__(self, hold=5, shutdown=30, cap=0.3, min_quality=0.5, smoothing=0.1):
+        """Keeps track of how well the temperature sensor is doing and how far
+        to trust it. Fed once a second while the machine is on with update().
+        Without a good reading the last good temperature is held for hold
+        seconds with the heater as normal, then the heater duty is capped at
+        cap, and after shutdown seconds it is a fault and the machine should
+        shut down. The duty is capped as well while the quality score is
+        below min_quality: the share of the readings the sensor should have
+        sent that came through and were used, averaged with weight smoothing
+        per update. A quality that stays below min_quality for shutdown
+        seconds is a fault too. Packet rate and error rates are averaged the
+        same way."""
+        self.hold = hold * 1000
+        self.shutdown = shutdown * 1000
+        self.cap = cap
+        self.min_quality = min_quality
+        self.smoothing = smoothing
+        self.rejected_jumps = 0
+        self.missing = 0
+        self.faults = 0
+        self.packets = self.good = self.parity = self.framing = self.overruns = 0
+        self.reset()
+
+    def reset(self, sensor=None):
+        """Start again, e.g. when the machine is turned on. sensor: the
+        ZACwire whose counters the next update counts from"""
+        self.state = SensorHealth.OK
+        self.quality = 1.0
+        self.packet_rate = float(RATE)
+        self.parity_rate = 0.0  # parity errors per packet
+        self.framing_rate = 0.0
+        self.last_good = None  # ticks_ms of the last good reading
+        self.last_update = ticks_ms()
+        self.since = None  # ticks_ms the current run of bad readings began
+        self.low_since = None  # ticks_ms the quality fell below min_quality
+        if sensor is not None:
+            self.take_counts(sensor)
+
+    def take_counts(self, sensor):
+        """The sensor's counter increases since the last call"""
+        packets = sensor.packet_count - self.packets
+        good = sensor.success_count - self.good
+        parity = sensor.parity_count - self.parity
+        framing = sensor.framing_count - self.framing
+        self.overruns = sensor.overrun_count
+        self.packets = sensor.packet_count
+        self.good = sensor.success_count
+        self.parity = sensor.parity_count
+        self.framing = sensor.framing_count
+        return packets, good, parity, framing
+
+    def update(self, sensor, outcome):
+        """Count what came of this reading (GOOD, MISSING or JUMP) and the
+        sensor's packets since the last update. Returns the state."""
+        now = ticks_ms()
+        dt = max(ticks_diff(now, self.last_update), 1) / 1000
+        self.last_update = now
+        packets, good, parity, framing = self.take_counts(sensor)
+        a = self.smoothing
+        used = min(1.0, good / (RATE * dt)) if outcome == SensorHealth.GOOD else 0.0
+        self.quality += a * (used - self.quality)
+        self.packet_rate += a * (packets / dt - self.packet_rate)
+        if packets:
+            self.parity_rate += a * (parity / packets - self.parity_rate)
+            self.framing_rate += a * (framing / packets - self.framing_rate)
+
+        if outcome == SensorHealth.GOOD:
+            self.last_good = now
+            self.since = None
+        else:
+            if outcome == SensorHealth.JUMP:
+                self.rejected_jumps += 1
+            else:
+                self.missing += 1
+            if self.since is None:
+                self.since = now
+
+        if self.quality >= self.min_quality:
+            self.low_since = None
+        elif self.low_since is None:
+            self.low_since = now
+
+        bad_for = ticks_diff(now, self.since) if self.since is not None else 0
+        low_for = ticks_diff(now, self.low_since) if self.low_since is not None else 0
+        if bad_for >= self.shutdown or low_for >= self.shutdown:
+            if self.state != SensorHealth.FAULT:
+                self.faults += 1
+            self.state = SensorHealth.FAULT
+        elif bad_for > self.hold or self.quality < self.min_quality:
+            self.state = SensorHealth.DEGRADED
+        elif self.since is not None:
+            self.state = SensorHealth.HOLD
+        else:
+            self.state = SensorHealth.OK
+        return self.state
+
+    def max_duty(self):
+        """Heater duty allowed in this state, 0-1"""
+        if self.state == SensorHealth.FAULT:
+            return 0.0
+        if self.state == SensorHealth.DEGRADED:
+            return self.cap
+        return 1.0
+
+    def age(self):
+        """Seconds since the last good reading, None if there hasn't been one"""
+        if self.last_good is None:
+            return None
+        return ticks_diff(ticks_ms(), self.last_good) / 1000
+
+    def get_status(self):
+        age = self.age()
+        return {
+            "state": self.state,
+            "quality": round(self.quality, 3),
+            "packet_rate": round(self.packet_rate, 1),
+            "parity_error_rate": round(self.parity_rate, 4),
+            "framing_error_rate": round(self.framing_rate, 4),
+            "age": None if age is None else round(age, 1),
+            "rejected_jumps": self.rejected_jumps,
+            "missing": self.missing,
+            "overruns": self.overruns,
+            "faults": self.faults,
+        }
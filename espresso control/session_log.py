@@ -0,0 +1,163 @@
+import os
+import struct
+
+# Session log file format, see SessionLog
+MAGIC = b'SLOG'
+VERSION = 1
+HEADER = '<4sBBHIHH'  # magic, version, record size, period s, created, reserved, checksum
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD = '<IhhHBB'  # time, temp, setpoint (deci-degrees), duty (tenths of a %), flags, checksum
+RECORD_SIZE = struct.calcsize(RECORD)
+EMPTY = -32768  # temp or setpoint that was None
+
+# record flags
+ON = 1
+STEAM = 2
+BREWING = 4
+AUTOTUNE = 8
+NO_READING = 16
+BOOT = 32  # first record since power up
+
+class SessionLog:
+    def __init__(self, path='session.log', period=2, max_bytes=128 * 1024, files=4, buffer_records=85):
+        """Append only log of fixed size records on flash.
+        Every period seconds a record (see RECORD) goes into a RAM buffer,
+        which is written out in one go when it is full, so the flash sees
+        a write every few minutes instead of one a second. When the file
+        would grow past max_bytes it is renamed path.1 (path.1 to path.2 and
+        so on, dropping path.<files - 1>) and a new one is started.
+        Each file starts with a header (see HEADER) that has a checksum, and
+        each record has a checksum byte, so a reader can tell a torn write
+        after a power cut. A file whose header is bad or whose length is not
+        a whole number of records isn't appended to, a new one is started."""
+        self.path = path
+        self.period = period
+        self.max_bytes = max_bytes
+        self.files = files
+        self.buf = bytearray(buffer_records * RECORD_SIZE)
+        self.n = 0  # bytes in buf
+        self.count = 0  # append() calls, every period-th is kept
+        self.flags = BOOT
+        self.size = self.check_file()
+
+    @staticmethod
+    def checksum(data):
+        return (sum(data) ^ 0x5a) & 0xff
+
+    def header(self, created):
+        head = bytearray(struct.pack(HEADER, MAGIC, VERSION, RECORD_SIZE, self.period, created, 0, 0))
+        struct.pack_into('<H', head, HEADER_SIZE - 2, sum(head) & 0xffff)
+        return head
+
+    @staticmethod
+    def header_ok(head):
+        if len(head) != HEADER_SIZE:
+            return False
+        magic, version, size, _, _, _, check = struct.unpack(HEADER, head)
+        return (magic == MAGIC and version == VERSION and size == RECORD_SIZE
+                and check == sum(memoryview(head)[:HEADER_SIZE - 2]) & 0xffff)
+
+    def check_file(self):
+        """Size of the current file, after rotating it out if it can't be
+        appended to. 0 if there is none yet."""
+        try:
+            size = os.stat(self.path)[6]
+        except OSError:
+            return 0
+        with open(self.path, 'rb') as f:
+            ok = self.header_ok(f.read(HEADER_SIZE))
+        if ok and (size - HEADER_SIZE) % RECORD_SIZE == 0:
+            return size
+        print('session log damaged, starting a new file')
+        self.rotate()
+        return 0
+
+    def append(self, time, temp, setpoint, duty, flags):
+        """Add a sample, call once a second. time: seconds of the machine's
+        clock (time()), which the web page sets to its local time, so not
+        Unix time. temp and setpoint: C or None, duty: 0-1, flags: ON | STEAM | ..."""
+        self.count += 1
+        if (self.count - 1) % self.period:
+            return
+        n = self.n
+        struct.pack_into(RECORD, self.buf, n, time,
+                         EMPTY if temp is None else int(round(temp * 10)),
+                         EMPTY if setpoint is None else int(round(setpoint * 10)),
+                         int(round(duty * 1000)), flags | self.flags, 0)
+        self.buf[n + RECORD_SIZE - 1] = self.checksum(memoryview(self.buf)[n:n + RECORD_SIZE - 1])
+        self.flags = 0
+        self.n = n + RECORD_SIZE
+        if self.n == len(self.buf):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records to flash"""
+        if not self.n:
+            return
+        if self.size and self.size + self.n > self.max_bytes:
+            self.rotate()
+            self.size = 0
+        try:
+            with open(self.path, 'ab') as f:
+                if not self.size:
+                    f.write(self.header(struct.unpack_from('<I', self.buf, 0)[0]))
+                    self.size = HEADER_SIZE
+                f.write(memoryview(self.buf)[:self.n])
+            self.size += self.n
+        except OSError as e:
+            print('session log write failed:', e)
+        self.n = 0
+
+    def rotate(self):
+        for i in range(self.files - 1, 0, -1):
+            older = self.name(i)
+            try:
+                if i == self.files - 1:
+                    os.remove(older)
+                else:
+                    os.rename(older, self.name(i + 1))
+            except OSError:
+                pass
+        try:
+            os.rename(self.path, self.name(1))
+        except OSError:
+            pass
+
+    def name(self, i):
+        return self.path if i == 0 else '%s.%d' % (self.path, i)
+
+    def read(self, start=None, end=None, chunk_records=42):
+        """Yield the records from start to end (times as in append()) as bytes
+        pieces, oldest file first, after one header. The buffer is written
+        out first so the newest records are included."""
+        self.flush()
+        yield self.header(0)
+        buf = bytearray(chunk_records * RECORD_SIZE)
+        for i in range(self.files - 1, -1, -1):
+            try:
+                f = open(self.name(i), 'rb')
+            except OSError:
+                continue
+            with f:
+                if not self.header_ok(f.read(HEADER_SIZE)):
+                    continue
+                while True:
+                    n = f.readinto(buf)
+                    n -= n % RECORD_SIZE
+                    if not n:
+                        break
+                    yield from self.in_range(buf, n, start, end)
+
+    def in_range(self, buf, n, start, end):
+        """The runs of records in buf[:n] with a time from start to end"""
+        run = None
+        for pos in range(0, n, RECORD_SIZE):
+            t = struct.unpack_from('<I', buf, pos)[0]
+            inside = (start is None or t >= start) and (end is None or t <= end)
+            if inside and run is None:
+                run = pos
+            elif not inside and run is not None:
+                yield memoryview(buf)[run:pos]
+                run = None
+        if run is not None:
+            yield memoryview(buf)[run:n]
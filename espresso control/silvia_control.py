@@ -1,14 +1,23 @@
 from machine import SPI, Pin, I2C, Timer, RTC
 import socket
 import ssd1306
+from screen import Screen
 from utime import ticks_ms, ticks_diff, time, localtime
-from mqtt import MQTTClient
 import uasyncio as asyncio
-from async_pwm import AsyncPWM
-from pid import PIDController
+from timer_pwm import TimerPWM
+from burst_pwm import BurstPWM
+from pid import PIDController, FixedPointPID, ScheduledPID
+from mpc import BoilerModel, PredictiveController
 import ujson
 from webserver import WebServer
+from history import History
+from autotune import RelayAutotune
+from estimator import TempEstimator, ModelIdentifier
+from ready import ReadyMonitor
+from brew import BrewDetector
+from session_log import SessionLog, ON, STEAM, BREWING, AUTOTUNE, NO_READING
 from zacwire import ZACwire
+from sensor_health import SensorHealth
 from rotary_irq_esp import RotaryIRQ
 from micropython import schedule
 
@@ -21,6 +30,7 @@ class SilviaControl:
         self.oled = ssd1306.SSD1306_I2C(128, 64, self.oled_i2c)
         self.oled.fill(0)
         self.oled.show()
+        self.screen = Screen(self.oled)
         
         '''self.knob = RotaryIRQ(
             pin_num_clk=knob_clk,
@@ -39,33 +49,52 @@ class SilviaControl:
         self.long_press_threshold = 2000  # 2 seconds in ms
         self.long_press_detected = False
         
-        self.tsic = ZACwire(tsic_data, tsic_power, start=False)        
+        self.pid_tunings, self.mode_temps = self.load_settings()
+        
+        sensor_filter = self.settings.get('sensor_filter', {})
+        self.tsic = ZACwire(tsic_data, tsic_power, start=False, method=sensor_filter.get('method', 'mode'),
+                            window=sensor_filter.get('window', 15))
         
-        self.heater = AsyncPWM(ssr)
-        self.heater.set_frequency(0.25)
+        self.heater = self.make_heater(ssr)
         self.pwm_val = 0
         
-        self.pid_tunings, self.mode_temps = self.load_settings()
         self.mode = 'espresso'
         
         self.history_length = 60*10  # Assuming one reading per second (5 minutes = 300 seconds)
         self.setpoint = None
         self.current_temp = None #self.sensor.temperature
-        self.setpoint_history = [None] * self.history_length
-        self.temp_history = [None] * (self.history_length - 1) + [self.current_temp]
+        self.history = History(self.history_length)
+        log = self.settings.get('session_log', {})
+        self.session_log = SessionLog(period=log.get('period', 2), max_bytes=log.get('file_kb', 128) * 1024,
+                                      files=log.get('files', 4))
         
-        self.last_temp = None
-        self.bad_reading_ct = 0
-        self.temp_thresh = 5 # max change in temp between readings
+        self.estimator = TempEstimator()  # filtered temp and rate, rejects bad readings
+        health = self.settings.get('sensor_health', {})
+        self.sensor_health = SensorHealth(hold=health.get('hold', 5), shutdown=health.get('shutdown', 30),
+                                          cap=health.get('cap', 0.3), min_quality=health.get('min_quality', 0.5))
+        self.sensor_good = 0  # the sensor's good packet count at the last get_temp
+        self.identifier = ModelIdentifier(self.settings.get('controller_options', {}).get('ambient', 22.0))
+        self.model_updates = 0
+        ready = self.settings.get('ready', {})
+        self.ready = ReadyMonitor(ready.get('band', 0.5), ready.get('hold', 30))
+        brew = self.settings.get('brew', {})
+        self.brew = BrewDetector(profile=brew.get('profile', ((0, 80),)),
+                                 drop_rate=brew.get('drop_rate', 0.15),
+                                 end_rate=brew.get('end_rate', 0.05),
+                                 max_time=brew.get('max_time', 60),
+                                 band=ready.get('band', 0.5))
                 
         self.on = False
-        self.pid_controller = PIDController(self.pid_tunings['P'], self.pid_tunings['I'], self.pid_tunings['D'], self.setpoint)
+        self.pid_controller = self.make_pid()
         
         self.alarm_task = None
         self.alarm_time = None
         self.alarm_time_str = None
         self.timezone = -5 # EST (UTC - 5)
         
+        self.last_published = None
+        self.autotuner = None
+        
         self.server = WebServer(self)
         if self.on:
             self.power_switch('on')
@@ -78,45 +107,96 @@ class SilviaControl:
             mode_temps = settings['mode_temps']
         except:
             print('failed to open settings')
+            settings = {}
             pid_tunings = {"P": 1, "I": 0, "D": 0}
             mode_temps = {'espresso': 98.0, 'steam': 120.0}
+        self.settings = settings  # kept whole so saving doesn't drop other keys
             
         return pid_tunings, mode_temps
+    
+    def make_heater(self, ssr):
+        """SSR driver chosen by the "heater" setting: "pwm" for a 4 s slow PWM,
+        "burst" for firing whole mains cycles ("mains_hz", default 60), or half
+        cycles with "half_cycle": true"""
+        if self.settings.get('heater') == 'burst':
+            return BurstPWM(ssr, mains_hz=self.settings.get('mains_hz', 60),
+                            half_cycle=self.settings.get('half_cycle', False))
+        heater = TimerPWM(ssr)
+        heater.set_frequency(0.25)
+        return heater
+    
+    def make_pid(self):
+        """Controller chosen by the "controller" setting:
+        "float": PIDController
+        "fixed": FixedPointPID, which also takes the "controller_options"
+            b (setpoint weight), FF (% per degree above ambient), Tf (D filter
+            seconds), Imax (integral limit %) and ambient
+        "scheduled": FixedPointPID with the gains switched by mode and
+            distance from the setpoint, from "schedule", see ScheduledPID
+        "mpc": PredictiveController on the boiler "model" (gain, tau,
+            dead_time, ambient), with the "controller_options" horizon and
+            response in seconds"""
+        tunings = self.pid_tunings
+        controller = self.settings.get('controller')
+        options = self.settings.get('controller_options', {})
+        if controller == 'mpc':
+            m = self.settings.get('model')
+            if m:
+                model = BoilerModel(m['gain'], m['tau'], m['dead_time'], m.get('ambient', 22.0))
+                return PredictiveController(model, self.setpoint, horizon=options.get('horizon'),
+                                            response=options.get('response'))
+            print('no boiler model in settings, using the PID')
+        if controller in ('fixed', 'scheduled', 'mpc'):
+            pid = FixedPointPID(tunings['P'], tunings['I'], tunings['D'], self.setpoint,
+                                b=options.get('b', 1.0), ff=options.get('FF', 0.0),
+                                d_filter=options.get('Tf', 2.0), ambient=options.get('ambient', 22.0),
+                                i_max=options.get('Imax', 10.0))
+            if controller == 'scheduled':
+                return ScheduledPID(pid, self.settings.get('schedule', {}), self.mode)
+            return pid
+        return PIDController(tunings['P'], tunings['I'], tunings['D'], self.setpoint)
         
     def get_temp(self):
         #return self.sensor.temperature
         temp = self.tsic.temp()
-        if temp == 2333 or temp == 2222:
-            self.last_temp = None
-            return None
-        if self.last_temp:
-            if -self.temp_thresh < temp - self.last_temp < self.temp_thresh:
-                self.last_temp = temp
-                self.bad_reading_ct = 0
-                return round(temp, 1)
-            else:
-                if self.bad_reading_ct > 10:
-                    self.shut_down("bad readings")
-                self.bad_reading_ct += 1
-                return round(self.last_temp, 1)
+        good = self.tsic.success_count
+        fresh = good != self.sensor_good  # else the filter still holds the same readings
+        self.sensor_good = good
+        if not fresh or temp == ZACwire.NOT_RUNNING or temp == ZACwire.WRONG_PARITY:
+            outcome = SensorHealth.MISSING
+        elif self.estimator.update(temp):
+            outcome = SensorHealth.GOOD
         else:
-            self.last_temp = temp
-            return round(temp, 1)
+            outcome = SensorHealth.JUMP  # too far from where the filter expected it
+        if self.on and self.sensor_health.update(self.tsic, outcome) == SensorHealth.FAULT:
+            self.shut_down("sensor fault")
+            return None
+        if outcome == SensorHealth.GOOD:
+            return round(temp, 2)  # the filter resolves finer than a 0.1 C sensor step
+        if outcome == SensorHealth.MISSING and (not self.on or self.sensor_health.last_good is None):
+            return None
+        # hold the last good temperature, the estimate, see SensorHealth
+        return round(self.estimator.temp, 2)
 
     def draw_screen(self):
-        self.oled.fill(0)
+        """Update the display, only the items that changed are redrawn and sent"""
+        screen = self.screen
         
         # mode info
         if self.on:
-            ready_thresh = 0.5
-            if self.current_temp and self.setpoint:
-                diff = self.current_temp - self.setpoint
-                if diff > ready_thresh:
-                    mode_text = 'COOL'
-                elif diff < -ready_thresh:
-                    mode_text = 'HEATING'
-                else:
-                    mode_text = 'READY'
+            state = self.ready.state
+            if self.autotuning():
+                mode_text = 'TUNING'
+            elif self.sensor_health.state != SensorHealth.OK:
+                mode_text = 'SENSOR?'
+            elif state == ReadyMonitor.COOLING:
+                mode_text = 'COOL'
+            elif state == ReadyMonitor.HEATING:
+                mode_text = 'HEATING'
+            elif state == ReadyMonitor.SETTLING:
+                mode_text = 'SETTLE'
+            elif state == ReadyMonitor.READY:
+                mode_text = 'READY'
             else:
                 mode_text = 'STANDBY'
         else:
@@ -124,22 +204,28 @@ class SilviaControl:
                 mode_text = 'On@'+self.alarm_time_str
             else:
                 mode_text = 'OFF'
-        self.oled.text(mode_text, 0, 0)
-        self.oled.hline(0, 9, 128, 1)
+        screen.text('mode', mode_text, 0, 0)
+        screen.hline('rule', 0, 9, 128)
         
         # power info
         power_str = f'PWR:{int(self.pwm_val*100)}%'
         x = 128 - 8*len(power_str)
-        self.oled.text(power_str, x, 0)
+        screen.text('power', power_str, x, 0)
         
         # temp status
-        self.oled.text('TEMP', 0, 20)
-        self.oled.text('SET', 0, 46)
-        current = str(self.current_temp) if self.current_temp is not None else '--'
+        screen.text('temp_label', 'TEMP', 0, 20)
+        eta = self.ready.eta
+        if self.on and eta:
+            eta = min(eta, 5999)
+            screen.text('eta', f'{eta // 60}:{eta % 60:02d}', 0, 30)  # time to ready
+        else:
+            screen.text('eta', '', 0, 30)
+        screen.text('set_label', 'SET', 0, 46)
+        current = f'{self.current_temp:.1f}' if self.current_temp is not None else '--'
         setpoint = str(self.setpoint) if self.setpoint is not None else '--'
         x = 128 - (16 * 5)
-        self.oled.large_text(current, x, 20, 2)
-        self.oled.large_text(setpoint, x, 46, 2)
+        screen.text('current', current, x, 20, 2)
+        screen.text('setpoint', setpoint, x, 46, 2)
             
         # heating / ready
         """ready_thresh = 0.5
@@ -154,7 +240,7 @@ class SilviaControl:
             x = 128 - 8*len(ready_text)
             self.oled.text(ready_text, x, 56)"""
             
-        self.oled.show()
+        screen.show()
 
         
     def set_temp(self, temp):
@@ -166,13 +252,18 @@ class SilviaControl:
     
     def turn_off(self):
         self.on = False
+        self.abort_autotune()
         self.tsic.stop()
         self.set_temp(None)
+        self.session_log.flush()
         
     def turn_on(self):
         self.on = True
         self.set_temp(self.mode_temps[self.mode])
         self.tsic.start()
+        self.sensor_health.reset(self.tsic)
+        if not self.heater.running:
+            asyncio.create_task(self.heater.start())  # stopped by a shut down
         
     def power_switch(self, on_string):
         self.on = (on_string == "on")
@@ -182,17 +273,21 @@ class SilviaControl:
             self.turn_off()
         return f"Power set {on_string}"
         
+    def set_mode(self, mode):
+        self.mode = mode
+        set_mode = getattr(self.pid_controller, 'set_mode', None)
+        if set_mode:
+            set_mode(mode)  # gain scheduled controllers
+        self.set_temp(self.mode_temps[mode])
+        
     def mode_switch(self, mode=None):
         if mode:
-            self.mode = mode
-            self.set_temp(self.mode_temps[self.mode])
+            self.set_mode(mode)
             return f"Mode set to {self.mode}"
         elif self.mode == 'espresso':
-            self.mode = "steam"
-            self.set_temp(self.mode_temps[self.mode])
+            self.set_mode("steam")
         elif self.mode == 'steam':
-            self.mode = 'espresso'
-            self.set_temp(self.mode_temps[self.mode])
+            self.set_mode('espresso')
         
     def save_settings(self, data):
         try:
@@ -202,13 +297,56 @@ class SilviaControl:
             self.pid_tunings = data['PID']
             self.pid_controller.set_tunings(self.pid_tunings['P'], self.pid_tunings['I'], self.pid_tunings['D'])
             
+            self.settings.update(data)
             with open("settings.json", "w") as f:
-                ujson.dump(data, f)
+                ujson.dump(self.settings, f)
                 
             return "Settings saved"
         except:
             return "Failed to save settings"
         
+    def autotuning(self):
+        return self.autotuner is not None and self.autotuner.state == RelayAutotune.RUNNING
+    
+    def start_autotune(self, rule='zn'):
+        """Take the heater over with a relay autotune around the setpoint"""
+        if not self.on or self.setpoint is None:
+            return "Turn the machine on to autotune"
+        if self.autotuning():
+            return "Autotune already running"
+        # bias the relay at the power holding the setpoint, if it's there already
+        bias = 10.0
+        if self.current_temp is not None and abs(self.current_temp - self.setpoint) < 1:
+            bias = max(self.pwm_val * 100, 2.0)
+        self.autotuner = RelayAutotune(self.setpoint, bias=bias, rule=rule)
+        return "Autotune started"
+    
+    def autotune_done(self):
+        """Save the tunings found, the PID takes over again either way.
+        The tunings are for the FixedPointPID, the float PIDController
+        overshoots by degrees with them (no D filter, integral kept in 0-20),
+        so the "controller" setting is switched from float to fixed."""
+        self.pid_controller.reset()
+        if self.autotuner.state == RelayAutotune.DONE:
+            data = {"mode_temps": self.mode_temps, "PID": self.autotuner.result}
+            switch = self.settings.get('controller') not in ('fixed', 'scheduled', 'mpc')
+            if switch:
+                data["controller"] = 'fixed'
+            self.save_settings(data)
+            if switch:
+                self.pid_controller = self.make_pid()
+    
+    def abort_autotune(self):
+        if self.autotuning():
+            self.autotuner.abort()
+            self.pid_controller.reset()
+        return "Autotune aborted"
+    
+    def autotune_status(self):
+        if self.autotuner is None:
+            return {"state": RelayAutotune.IDLE}
+        return self.autotuner.get_status()
+    
     def get_status(self, on_interval):
         response_data = {
             "power": self.on,
@@ -217,10 +355,92 @@ class SilviaControl:
             "mode": self.mode,
             "on_interval": on_interval,
             "pwm_val": self.pwm_val,
-            "alarm_time": self.alarm_time_str
+            "alarm_time": self.alarm_time_str,
+            "history_seq": self.history.seq,
+            "filtered_temp": None if self.estimator.temp is None else round(self.estimator.temp, 2),
+            "temp_rate": round(self.estimator.rate, 3),
+            "model": self.model_status(),
+            "ready": self.ready.state,
+            "ready_eta": self.ready.eta,
+            "brew": self.brew.state,
+            "sensor": self.sensor_health.state,
+            "sensor_quality": round(self.sensor_health.quality, 2)
         }
         return response_data
     
+    def get_diagnostics(self):
+        """Sensor health, the ZACwire decoder's counters and the filter"""
+        return {
+            "sensor": self.sensor_health.get_status(),
+            "decoder": self.tsic.diagnostics(),
+            "filter": {"method": self.tsic.filter.method, "window": self.tsic.filter.window},
+            "raw_temp": self.tsic.raw_temp(),
+            "filtered_temp": None if self.estimator.temp is None else round(self.estimator.temp, 2)
+        }
+    
+    def model_status(self):
+        """Boiler model identified so far, None until it has converged"""
+        params = self.identifier.params()
+        if not params:
+            return None
+        gain, tau, dead_time = params
+        return {"gain": round(gain, 1), "tau": round(tau), "dead_time": dead_time}
+    
+    def boiler_model(self):
+        """(gain, tau, dead_time, ambient) identified, or from the "model"
+        setting, or None"""
+        params = self.identifier.params()
+        if params:
+            return params + (self.identifier.ambient,)
+        m = self.settings.get('model')
+        if m:
+            return m['gain'], m['tau'], m['dead_time'], m.get('ambient', 22.0)
+        return None
+    
+    def model_rate(self):
+        """Rate of change (C/s) the boiler model expects from the heater
+        power a dead time ago and the heat loss, 0 without a model"""
+        model = self.boiler_model()
+        if not model or self.current_temp is None:
+            return 0.0
+        gain, tau, dead_time, ambient = model
+        identifier = self.identifier
+        dead_time = int(round(dead_time))
+        if identifier.count > dead_time:
+            duty = identifier.at(identifier.duties, dead_time)
+        else:
+            duty = self.pwm_val
+        return (gain * duty - (self.current_temp - ambient)) / tau
+    
+    def brew_boost(self):
+        """Heater power (0-1) to add while a shot is pulled, which is spotted
+        from the temperature falling faster than the model expects"""
+        if self.mode != 'espresso':
+            self.brew.cancel()
+            return 0
+        return self.brew.update(self.current_temp, self.setpoint, self.estimator.rate, self.model_rate())
+    
+    def get_shots(self):
+        return {"shots": self.brew.get_shots()}
+    
+    def update_ready(self):
+        """Track the time to ready, sending a "ready" event to /events
+        subscribers when the boiler has settled at the setpoint"""
+        if self.autotuning():
+            self.ready.reset()
+            return
+        if self.ready.update(self.current_temp, self.setpoint, self.estimator.rate, self.boiler_model()):
+            self.server.events.publish(ujson.dumps(self.get_status(False)), event='ready')
+    
+    def publish_status(self):
+        """Push the status to /events subscribers, only if something changed"""
+        key = (self.on, self.current_temp, self.setpoint, self.pwm_val, self.mode, self.alarm_time_str,
+               self.ready.state, self.ready.eta, self.brew.state, self.sensor_health.state)
+        if key == self.last_published:
+            return
+        self.last_published = key
+        self.server.events.publish(ujson.dumps(self.get_status(False)))
+    
     def get_settings(self):
         response_data = {
             "mode_temps": self.mode_temps,
@@ -229,12 +449,33 @@ class SilviaControl:
         return response_data
     
     def get_history(self):
+        snap = self.history.snapshot()
         response_data = {
-            "setpoint_history": self.setpoint_history,
-            "temp_history": self.temp_history
+            "setpoint_history": list(self.history.values(self.history.setpoint, snap)),
+            "temp_history": list(self.history.values(self.history.temp, snap)),
+            "pwm_history": list(self.history.values(self.history.duty, snap)),
+            "mode_history": list(self.history.modes(snap))
         }
         return response_data
     
+    def history_json(self, since=None):
+        """Yield the same JSON as get_history piece by piece, straight from the buffer.
+        With since only the samples after that sequence number are included."""
+        snap = self.history.snapshot(since)
+        start, count = snap[:2]
+        # time is when the newest sample was taken, to line the samples up with /shots
+        yield ('{"start": %d, "seq": %d, "period_ms": %d, "time": %d, ' %
+               (start, start + count - 1, self.history.period_ms, time())).encode()
+        yield b'"setpoint_history": '
+        yield from self.history.json_values(self.history.setpoint, snap)
+        yield b', "temp_history": '
+        yield from self.history.json_values(self.history.temp, snap)
+        yield b', "pwm_history": '
+        yield from self.history.json_values(self.history.duty, snap)
+        yield b', "mode_history": '
+        yield from self.history.mode_json(snap)
+        yield b'}'
+    
     
     
     def schedule_alarm(self, alarm_time_string, current_time_str):
@@ -293,28 +534,74 @@ class SilviaControl:
         
     async def update_temp(self):
         while True:
-            self.temp_history.pop(0)  # Remove the oldest temperature
-            self.temp_history.append(self.current_temp)  # Add the current temperature
-            await asyncio.sleep_ms(100)
-            self.setpoint_history.pop(0)
-            self.setpoint_history.append(self.setpoint)
-            await asyncio.sleep_ms(100)
+            # overwrites the oldest sample, the duty is the one used over the last second
+            self.history.append(self.current_temp, self.setpoint, self.pwm_val, self.mode if self.on else None)
+            await asyncio.sleep_ms(200)
+            # fit only fresh readings taken while on, off they are 10 s apart and a
+            # held temperature isn't one, None breaks the identifier's run
+            age = self.sensor_health.age()
+            fresh = self.on and age is not None and age < 1.5
+            self.identifier.add(self.current_temp if fresh else None, self.pwm_val)  # the duty of the last second
+            self.adapt_model()
             
             #update heater
-            self.pwm_val = self.pid_controller.compute(self.current_temp)
+            if self.autotuning():
+                self.pwm_val = self.autotuner.update(self.current_temp)
+                if not self.autotuning():
+                    self.autotune_done()
+            elif self.current_temp is None:
+                self.pwm_val = 0  # no reading yet, keep the heater off
+            else:
+                self.pwm_val = min(1.0, self.pid_controller.compute(self.current_temp) + self.brew_boost())
+            if self.on:
+                self.pwm_val = min(self.pwm_val, self.sensor_health.max_duty())
             self.heater.set_duty(self.pwm_val)
+            self.log_sample()
+            self.update_ready()
+            self.publish_status()
             await asyncio.sleep_ms(800)
                 
+    def log_sample(self):
+        """Add this second to the session log while the machine is on"""
+        if not self.on:
+            return
+        flags = ON
+        if self.mode == 'steam':
+            flags |= STEAM
+        if self.brew.state == BrewDetector.BREWING:
+            flags |= BREWING
+        if self.autotuning():
+            flags |= AUTOTUNE
+        if self.current_temp is None or self.sensor_health.state != SensorHealth.OK:
+            flags |= NO_READING  # none, or a held one
+        self.session_log.append(time(), self.current_temp, self.setpoint, self.pwm_val, flags)
+    
+    def adapt_model(self):
+        """Once a minute hand the identified boiler model to a predictive
+        controller, if the "adapt_model" setting is on"""
+        updates = self.identifier.updates
+        if updates == self.model_updates or updates % 12 or not self.settings.get('adapt_model'):
+            return
+        self.model_updates = updates
+        params = self.identifier.params()
+        set_model = getattr(self.pid_controller, 'set_model', None)
+        if params and set_model:
+            gain, tau, dead_time = params
+            set_model(BoilerModel(gain, tau, dead_time, self.identifier.ambient))
+    
     def shut_down(self, msg=None):
         self.on = False
+        self.abort_autotune()
         self.tsic.stop()
-        self.setpoint = None
+        self.set_temp(None)  # the controller's too, or it keeps asking for heat
         self.heater.stop()
+        self.session_log.flush()
         self.oled.fill(0)
         self.oled.text("TURNED OFF", 10, 10)
         if msg:
             self.oled.text(msg, 10, 32)
         self.oled.show()
+        self.screen.invalidate()  # the next draw_screen starts from a clear screen
         
     def short_press(self):
         if self.on:
@@ -360,6 +647,10 @@ class SilviaControl:
     async def main(self):
         """Main entry point for starting tasks."""
         asyncio.create_task(self.server.start())
+        await self.run()
+
+    async def run(self):
+        """Run the heater, sensor and button tasks, without the web server"""
         asyncio.create_task(self.heater.start())
         #asyncio.create_task(self.knob_handler())
         asyncio.create_task(self.update_temp())
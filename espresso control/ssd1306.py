@@ -26,6 +26,10 @@ SET_PRECHARGE = const(0xD9)
 SET_VCOM_DESEL = const(0xDB)
 SET_CHARGE_PUMP = const(0x8D)
 
+# rough bus cost in bytes of the overheads, to choose how to send a change
+WINDOW_COST = const(10)  # setting the column and page window
+DATA_COST = const(3)  # starting a data write
+
 # Subclassing FrameBuffer provides support for graphics primitives
 # http://docs.micropython.org/en/latest/pyboard/library/framebuf.html
 class SSD1306(framebuf.FrameBuffer):
@@ -35,6 +39,11 @@ class SSD1306(framebuf.FrameBuffer):
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        self.shown = bytearray(len(self.buffer))  # what the display has, for show_dirty()
+        # columns marked dirty on each page, none when lo > hi
+        self.dirty_lo = bytearray([self.width - 1] * self.pages)
+        self.dirty_hi = bytearray(self.pages)
+        self.empty = True
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
         self.init_display()
 
@@ -89,8 +98,13 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
     def show(self):
-        x0 = 0
-        x1 = self.width - 1
+        self.set_window(0, self.width - 1, 0, self.pages - 1)
+        self.write_data(self.buffer)
+        self.shown[:] = self.buffer
+        self.clear_dirty()
+
+    def set_window(self, x0, x1, page0, page1):
+        """Columns and pages the next data goes to, left to right then down"""
         if self.width == 64:
             # displays with width of 64 pixels are shifted by 32
             x0 += 32
@@ -99,9 +113,92 @@ class SSD1306(framebuf.FrameBuffer):
         self.write_cmd(x0)
         self.write_cmd(x1)
         self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
+        self.write_cmd(page0)
+        self.write_cmd(page1)
+
+    def mark(self, x, y, w, h):
+        """Note that the rectangle was drawn on, for show_dirty()"""
+        x0 = max(x, 0)
+        x1 = min(x + w, self.width) - 1
+        y0 = max(y, 0)
+        y1 = min(y + h, self.height) - 1
+        if x0 > x1 or y0 > y1:
+            return
+        for page in range(y0 >> 3, (y1 >> 3) + 1):
+            if x0 < self.dirty_lo[page]:
+                self.dirty_lo[page] = x0
+            if x1 > self.dirty_hi[page]:
+                self.dirty_hi[page] = x1
+        self.empty = False
+
+    def clear_dirty(self):
+        for page in range(self.pages):
+            self.dirty_lo[page] = self.width - 1
+            self.dirty_hi[page] = 0
+        self.empty = True
+
+    def show_dirty(self):
+        """Send only the columns that changed within the marked areas. Each
+        page's change is narrowed to the columns that differ from what the
+        display has. Runs of changed pages go in one column window if that
+        sends fewer bytes than a window per page. Nothing goes over the bus
+        if nothing changed. Returns the number of data bytes sent."""
+        if self.empty:
+            return 0
+        buf = self.buffer
+        shown = self.shown
+        width = self.width
+        lo = self.dirty_lo
+        hi = self.dirty_hi
+        for page in range(self.pages):
+            # narrow to the bytes that differ, lo > hi when none do
+            base = page * width
+            a = lo[page]
+            b = hi[page]
+            while a <= b and buf[base + a] == shown[base + a]:
+                a += 1
+            while b >= a and buf[base + b] == shown[base + b]:
+                b -= 1
+            if a > b:
+                a = width - 1
+                b = 0
+            lo[page] = a
+            hi[page] = b
+        sent = 0
+        page = 0
+        while page < self.pages:
+            if lo[page] > hi[page]:
+                page += 1
+                continue
+            # a run of changed pages
+            first = page
+            x0 = lo[page]
+            x1 = hi[page]
+            separate = 0
+            while page < self.pages and lo[page] <= hi[page]:
+                x0 = min(x0, lo[page])
+                x1 = max(x1, hi[page])
+                separate += WINDOW_COST + DATA_COST + hi[page] - lo[page] + 1
+                page += 1
+            together = WINDOW_COST + (page - first) * (DATA_COST + x1 - x0 + 1)
+            if together <= separate:
+                sent += self.send_window(x0, x1, first, page - 1)
+            else:
+                for p in range(first, page):
+                    sent += self.send_window(lo[p], hi[p], p, p)
+        self.clear_dirty()
+        return sent
+
+    def send_window(self, x0, x1, page0, page1):
+        self.set_window(x0, x1, page0, page1)
+        buf = memoryview(self.buffer)
+        shown = memoryview(self.shown)
+        for page in range(page0, page1 + 1):
+            start = page * self.width + x0
+            end = page * self.width + x1 + 1
+            self.write_data(buf[start:end])
+            shown[start:end] = buf[start:end]
+        return (page1 - page0 + 1) * (x1 - x0 + 1)
 
 
 class SSD1306_I2C(SSD1306):
@@ -110,6 +207,7 @@ class SSD1306_I2C(SSD1306):
         self.addr = addr
         self.temp = bytearray(2)
         self.write_list = [b"\x40", None]  # Co=0, D/C#=1
+        self.window_cmd = bytearray((0x00, SET_COL_ADDR, 0, 0, SET_PAGE_ADDR, 0, 0))  # Co=0, D/C#=0: commands follow
         super().__init__(width, height, external_vcc)
 
     def write_cmd(self, cmd):
@@ -117,6 +215,18 @@ class SSD1306_I2C(SSD1306):
         self.temp[1] = cmd
         self.i2c.writeto(self.addr, self.temp)
 
+    def set_window(self, x0, x1, page0, page1):
+        # all six commands in one transaction
+        if self.width == 64:
+            x0 += 32
+            x1 += 32
+        cmd = self.window_cmd
+        cmd[2] = x0
+        cmd[3] = x1
+        cmd[5] = page0
+        cmd[6] = page1
+        self.i2c.writeto(self.addr, cmd)
+
     def write_data(self, buf):
         self.write_list[1] = buf
         self.i2c.writevto(self.addr, self.write_list)
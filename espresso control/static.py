@@ -0,0 +1,58 @@
+import os
+from binascii import crc32
+
+class StaticAsset:
+    def __init__(self, filename, content_type):
+        """A file served as is from flash.
+        If a gzipped copy (filename + '.gz', see tools/gzip_assets.py) exists it
+        is served instead with Content-Encoding: gzip. The headers and the ETag
+        are worked out once here, so a request only has to stream the file.
+        The headers leave out the blank line ending them, the server adds the
+        connection headers."""
+        self.filename = filename
+        self.gzip = False
+        try:
+            os.stat(filename + '.gz')
+            self.filename = filename + '.gz'
+            self.gzip = True
+        except OSError:
+            pass
+
+        buf = bytearray(512)
+        crc = 0
+        size = 0
+        with open(self.filename, 'rb') as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                crc = crc32(memoryview(buf)[:n], crc)
+                size += n
+        self.etag = '"%08x"' % (crc & 0xffffffff)
+        self.etag_bytes = self.etag.encode()
+
+        # no-cache makes the browser revalidate with If-None-Match, answered with a 304
+        header = "HTTP/1.1 200 OK\r\n"
+        header += f"Content-Type: {content_type}\r\n"
+        header += f"Content-Length: {size}\r\n"
+        if self.gzip:
+            header += "Content-Encoding: gzip\r\n"
+        header += f"ETag: {self.etag}\r\n"
+        header += "Cache-Control: no-cache\r\n"
+        self.header = header.encode('utf-8')
+
+        not_modified = "HTTP/1.1 304 Not Modified\r\n"
+        not_modified += f"ETag: {self.etag}\r\n"
+        not_modified += "Cache-Control: no-cache\r\n"
+        self.not_modified = not_modified.encode('utf-8')
+
+
+def load_assets(files):
+    """Make a dict of url path -> StaticAsset from (path, filename, content type) tuples"""
+    assets = {}
+    for path, filename, content_type in files:
+        try:
+            assets[path] = StaticAsset(filename, content_type)
+        except OSError as e:
+            print("Missing static file:", filename, e)
+    return assets
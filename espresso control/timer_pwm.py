@@ -0,0 +1,69 @@
+from machine import Pin, Timer
+from utime import ticks_ms, ticks_add, ticks_diff
+
+class TimerPWM:
+    def __init__(self, pin_num, freq=1.0, duty=0.0, timer_id=2):
+        """Slow PWM for the SSR with the edges switched from a hardware timer
+        callback, so the timing doesn't depend on what the event loop is doing.
+        Same interface as AsyncPWM. Each edge is scheduled at an absolute time
+        from the start of its period, so late callbacks don't add up.
+        Timer(0) is used by ZACwire, on the ESP32-C6 the other timer is id 2."""
+        self.pin = Pin(pin_num, Pin.OUT)
+        self.pin.value(0)
+        self.timer = Timer(timer_id)
+        self.freq = min(max(0.1, freq), 1.0)  # Limit frequency range
+        self.duty = min(max(0.0, duty), 1.0)  # Limit duty cycle range
+        self.period = 1 / self.freq  # Period in seconds
+        self.running = False
+        self.period_start = 0  # ticks_ms at the start of the current period
+        # bound once, so the timer callbacks don't allocate
+        self._period_cb = self._start_period
+        self._off_cb = self._switch_off
+
+    def set_frequency(self, freq):
+        """Set frequency in Hz (0.1-1.0), used from the next period"""
+        self.freq = min(max(0.1, freq), 1.0)
+        self.period = 1 / self.freq
+
+    def set_duty(self, duty):
+        """Set duty cycle (0.0-1.0), used from the next period"""
+        self.duty = min(max(0.0, duty), 1.0)
+
+    async def start(self):
+        """Start PWM generation. A coroutine like AsyncPWM.start(), but it
+        returns at once, the timer keeps running"""
+        self.running = True
+        self.period_start = ticks_ms()
+        self._start_period(None)
+
+    def _schedule(self, deadline, callback):
+        delay = ticks_diff(deadline, ticks_ms())
+        self.timer.init(mode=Timer.ONE_SHOT, period=max(delay, 0), callback=callback)
+
+    def _start_period(self, _):
+        if not self.running:
+            return
+        period_ms = int(self.period * 1000)
+        on_ms = int(period_ms * self.duty)
+        if on_ms > 0:
+            self.pin.value(1)
+        if 0 < on_ms < period_ms:
+            self._schedule(ticks_add(self.period_start, on_ms), self._off_cb)
+            return
+        if on_ms == 0:
+            self.pin.value(0)
+        self.period_start = ticks_add(self.period_start, period_ms)
+        self._schedule(self.period_start, self._period_cb)
+
+    def _switch_off(self, _):
+        self.pin.value(0)
+        if not self.running:
+            return
+        self.period_start = ticks_add(self.period_start, int(self.period * 1000))
+        self._schedule(self.period_start, self._period_cb)
+
+    def stop(self):
+        """Stop PWM generation"""
+        self.running = False
+        self.timer.deinit()
+        self.pin.value(0)
@@ -1,10 +1,32 @@
 import network
-import socket
 import time
 from secrets import mysecrets
 import uasyncio as asyncio
 import ujson
 import gc
+from history import FORMAT_INT16, FORMAT_DELTA
+from events import EventHub
+from static import load_assets
+from request import Request, GET, POST
+
+PORT = 80
+CHUNK_SIZE = 512  # buffer size for streamed responses
+MAX_CONNECTIONS = 4  # persistent connections, /events subscribers are limited separately
+MAX_REQUESTS = 100  # per connection
+IDLE_TIMEOUT_MS = 5000  # close a persistent connection without a new request after this
+REQUEST_BUF_SIZE = 1024  # largest request, headers and body
+KEEP_ALIVE = ("Keep-Alive: timeout=%d\r\n\r\n" % (IDLE_TIMEOUT_MS // 1000)).encode()
+CONNECTION_CLOSE = b"Connection: close\r\n\r\n"
+HISTORY_FORMATS = {'int16': FORMAT_INT16, 'delta': FORMAT_DELTA}
+STATIC_FILES = (
+    ('/', 'index.html', "text/html"),
+    ('/style.css', 'style.css', "text/css"),
+    ('/script.js', 'script.js', "application/javascript"),
+)
+
+class BadRequest(Exception):
+    """Raised by a route handler for a bad request, the message goes back with a 400"""
+
 
 class WebServer:
     def __init__(self, controller):
@@ -13,6 +35,24 @@ class WebServer:
         self._current_path = "/"
         self.controller = controller
         self.wlan = None
+        self.events = EventHub()
+        self.assets = load_assets(STATIC_FILES)
+        self.connections = 0
+        
+        # path: (handler, allowed methods, fields the request data must have)
+        self.routes = {
+            '/power': (self.power, POST, ('power',)),
+            '/mode': (self.mode, POST, ('mode',)),
+            '/status': (self.status, GET | POST, ()),
+            '/settings': (self.settings, GET | POST, ()),
+            '/save_settings': (self.save_settings, POST, ('mode_temps', 'PID')),
+            '/schedule_alarm': (self.schedule_alarm, POST, ('alarm_time', 'current_time')),
+            '/history': (self.history, GET | POST, ()),
+            '/autotune': (self.autotune, GET | POST, ()),
+            '/shots': (self.shots, GET, ()),
+            '/log': (self.log, GET, ()),
+            '/diagnostics': (self.diagnostics, GET, ()),
+        }
         
     @property
     def current_path(self):
@@ -36,193 +76,305 @@ class WebServer:
         else:
             return False
     
-    def handle_data(self, path, data):        
-        content = {}
-        
-        # handle webpage stuff
-        if path == '/':       
-            with open('index.html', 'r', encoding='utf-8') as file:
-                content = file.read()
-            content_type = "text/html"
-        elif path == '/style.css':
-            # Serve the CSS file
-            with open('style.css', 'r', encoding='utf-8') as file:
-                content = file.read()
-            content_type = "text/css"  
-        elif path == '/script.js':
-            # Serve the JavaScript file
-            with open('script.js', 'r', encoding='utf-8') as file:
-                content = file.read()
-            content_type = "application/javascript"
+    def json(self, content):
+        return "application/json", ujson.dumps(content).encode('utf-8')
+
+    # Route handlers, each gets the request data and returns (content type, body)
+    # where body is bytes, or an iterator of bytes pieces for streamed responses
+
+    def power(self, data):
+        return self.json(self.controller.power_switch(data["power"]))
+
+    def mode(self, data):
+        return self.json(self.controller.mode_switch(data["mode"]))
+
+    def status(self, data):
+        return self.json(self.controller.get_status(data.get("interval", False)))
+
+    def settings(self, data):
+        return self.json(self.controller.get_settings())
+
+    def save_settings(self, data):
+        return self.json(self.controller.save_settings(data))
+
+    def schedule_alarm(self, data):
+        return self.json(self.controller.schedule_alarm(data["alarm_time"], data["current_time"]))
+
+    def history(self, data):
+        # streamed, the full JSON string is never built
+        fmt = data.get('format')
+        since = self.int_param(data, 'since')
+        if fmt in HISTORY_FORMATS:
+            return "application/octet-stream", self.controller.history.binary(HISTORY_FORMATS[fmt], since)
+        return "application/json", self.controller.history_json(since)
+
+    def autotune(self, data):
+        # POST {"action": "start", "rule": "zn" | "tl" | "simc"} or {"action": "abort"}, GET for the status
+        action = data.get('action')
+        if action == 'start':
+            self.controller.start_autotune(data.get('rule', 'zn'))
+        elif action == 'abort':
+            self.controller.abort_autotune()
+        return self.json(self.controller.autotune_status())
+
+    def shots(self, data):
+        return self.json(self.controller.get_shots())
+
+    def diagnostics(self, data):
+        return self.json(self.controller.get_diagnostics())
+
+    def log(self, data):
+        # the session log from flash, ?from=&to= in the machine's time() seconds, see session_log.py
+        start = self.int_param(data, 'from')
+        end = self.int_param(data, 'to')
+        return "application/octet-stream", self.controller.session_log.read(start, end)
+
+    def int_param(self, data, key):
+        """An integer from the request data, None if it isn't there"""
+        value = data.get(key)
+        if value is None or value == '':
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise BadRequest(f"{key} must be an integer")
+
+    def parse_query(self, query):
+        """Parse a url query string into a dict of strings"""
+        params = {}
+        for pair in query.split('&'):
+            if '=' in pair:
+                key, value = pair.split('=', 1)
+                params[key] = value
+            elif pair:
+                params[pair] = ''
+        return params
+
+    async def send(self, writer, data):
+        """Write data to the client, waiting until the socket has taken it"""
+        writer.write(data)
+        await writer.drain()
+
+    def header_end(self, keep_alive):
+        """Last header lines, telling the client whether the connection stays open"""
+        return KEEP_ALIVE if keep_alive else CONNECTION_CLOSE
+
+    async def send_response(self, writer, content_type, body, keep_alive=True, status="200 OK"):
+        """Send a response, streamed with chunked transfer encoding if body isn't bytes"""
+        header = f"HTTP/1.1 {status}\r\n"
+        header += f"Content-Type: {content_type}\r\n"
+        if isinstance(body, bytes):
+            header += f"Content-Length: {len(body)}\r\n"
         else:
-            # handle user requests
-            if path == '/power':
-                cont = self.controller.power_switch(data["power"])
-            elif path == '/mode':
-                cont = self.controller.mode_switch(data["mode"])
-            elif path == '/status':
-                cont = self.controller.get_status(data["interval"])
-            elif path == '/settings':
-                cont = self.controller.get_settings()
-            elif path == '/save_settings':
-                cont = self.controller.save_settings(data)
-            elif path == '/history':
-                cont = self.controller.get_history()
-            elif path == '/schedule_alarm':
-                cont = self.controller.schedule_alarm(data["alarm_time"], data["current_time"])
-            else:
-                cont = "this path doesn't exist"
-            
-            content = ujson.dumps(cont)
-            content_type = "application/json"
-            
-        content_length = len(content.encode('utf-8'))
-            
-        response = f"HTTP/1.1 200 OK\r\n"
-        response += f"Content-Type: {content_type}\r\n"
-        response += f"Content-Length: {content_length}\r\n"
-        response += "Access-Control-Allow-Origin: *\r\n\r\n"
-        response += content
+            header += "Transfer-Encoding: chunked\r\n"
+        header += "Access-Control-Allow-Origin: *\r\n"
+        await self.send(writer, header.encode('utf-8'))
+        await self.send(writer, self.header_end(keep_alive))
+        if isinstance(body, bytes):
+            await self.send(writer, body)
+        else:
+            await self.send_chunked(writer, body)
+
+    async def send_error(self, writer, status, message, keep_alive=True):
+        content_type, content = self.json(message)
+        await self.send_response(writer, content_type, content, keep_alive, status)
+
+    async def send_chunked(self, writer, body):
+        """Send a response body that is yielded in pieces using chunked transfer encoding.
+        Pieces are collected in one small buffer, so memory use does not depend on the body size."""
+        buf = bytearray(CHUNK_SIZE)
+        n = 0
+        for piece in body:
+            if n + len(piece) > CHUNK_SIZE:
+                await self.send_chunk(writer, memoryview(buf)[:n])
+                n = 0
+            if len(piece) > CHUNK_SIZE:
+                await self.send_chunk(writer, piece)
+                continue
+            buf[n:n + len(piece)] = piece
+            n += len(piece)
+        if n:
+            await self.send_chunk(writer, memoryview(buf)[:n])
+        await self.send(writer, b"0\r\n\r\n")
         
-        return response.encode('utf-8')
+    async def send_chunk(self, writer, data):
+        await self.send(writer, ('%x\r\n' % len(data)).encode())
+        await self.send(writer, data)
+        await self.send(writer, b"\r\n")
 
+    async def send_static(self, writer, asset, request, keep_alive=True):
+        """Send a static file in fixed size pieces, or a 304 if the client's copy is current"""
+        if request.etag_matches(asset.etag_bytes):
+            await self.send(writer, asset.not_modified)
+            await self.send(writer, self.header_end(keep_alive))
+            return
+        await self.send(writer, asset.header)
+        await self.send(writer, self.header_end(keep_alive))
+        buf = bytearray(CHUNK_SIZE)
+        with open(asset.filename, 'rb') as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                await self.send(writer, memoryview(buf)[:n])
 
-    async def handle_client(self, client, addr):
-        #print(f"Handling client from {addr}")
+    async def stream_events(self, writer):
+        """Keep the connection open and push every published event to it"""
+        header = "HTTP/1.1 200 OK\r\n"
+        header += "Content-Type: text/event-stream\r\n"
+        header += "Cache-Control: no-cache\r\n"
+        header += "Access-Control-Allow-Origin: *\r\n\r\n"
+        await self.send(writer, header.encode('utf-8'))
+        
+        sub_id = self.events.subscribe()
+        seen = max(0, self.events.version - 1)  # start with the latest status
         try:
-            client.setblocking(False)
-            request = b""
-            headers = {}
-            content_length = 0
-            
-            # Read headers first
-            while True:
-                try:
-                    chunk = client.recv(1024)
-                    if not chunk:
-                        break
-                    request += chunk
-                    if b"\r\n\r\n" in request:
-                        headers_end = request.find(b"\r\n\r\n")
-                        headers_data = request[:headers_end].decode('utf-8')
-                        
-                        # Parse headers
-                        for line in headers_data.split('\r\n')[1:]:  # Skip first line (HTTP method)
-                            if ': ' in line:
-                                key, value = line.split(': ', 1)
-                                headers[key.lower()] = value
-                        
-                        # Get content length if present
-                        content_length = int(headers.get('content-length', 0))
-                        break
-                        
-                except OSError as e:
-                    if e.args[0] == 11:  # EAGAIN
-                        await asyncio.sleep(0.1)
-                        continue
-                    print("OS error line 115:", e)
-                    raise
-
-            # Parse request line
-            request_line = request.split(b'\r\n')[0].decode('utf-8')
-            method, path, _ = request_line.split(' ')
-            self._current_path = path
-            
-            # Read body if it exists
-            body = b""
-            body_start = request[request.find(b"\r\n\r\n") + 4:]
-            body += body_start
-            
-            remaining = content_length - len(body)
-            while remaining > 0:
-                try:
-                    chunk = client.recv(min(1024, remaining))
-                    if not chunk:
-                        break
-                    body += chunk
-                    remaining -= len(chunk)
-                except OSError as e:
-                    if e.args[0] == 11:  # EAGAIN
-                        await asyncio.sleep(0.1)
-                        continue
-                    print("OS error line 139:", e)
-                    raise
+            while sub_id in self.events.subscribers:
+                msg, seen = self.events.next_message(seen)
+                if msg is None:
+                    await self.events.event.wait()
+                else:
+                    await self.send(writer, msg)
+        finally:
+            self.events.unsubscribe(sub_id)
+
+    async def read_request(self, reader, writer, request):
+        """Receive into the request buffer until a whole request is in.
+        Returns False if the client closed the connection or didn't send the whole
+        request within the idle timeout. A request that doesn't fit in the buffer
+        or has a malformed Content-Length gets an error reply first, then False."""
+        start = time.ticks_ms()
+        while not request.parse():
+            if request.filled == len(request.buf):
+                await self.send_error(writer, "431 Request Header Fields Too Large", "headers too large", False)
+                return False
+            if not await self.receive(reader, request, len(request.buf), start):
+                return False
+        if request.bad:
+            await self.send_error(writer, "400 Bad Request", "bad Content-Length", False)
+            return False
+        
+        # Read body if it exists
+        end = request.header_end + request.content_length
+        if end > len(request.buf):
+            await self.send_error(writer, "413 Content Too Large", "body too large", False)
+            return False
+        while request.filled < end:
+            if not await self.receive(reader, request, end, start):
+                return False
+        return True
+
+    async def receive(self, reader, request, end, start):
+        """Read what has arrived into the request buffer up to end, waiting
+        no longer than the idle timeout from start. False on timeout or close."""
+        idle = max(1, IDLE_TIMEOUT_MS - time.ticks_diff(time.ticks_ms(), start))
+        try:
+            n = await asyncio.wait_for(reader.readinto(request.mv[request.filled:end]), idle / 1000)
+        except asyncio.TimeoutError:
+            return False
+        if not n:
+            return False
+        request.filled += n
+        return True
+
+    async def handle_client(self, reader, writer):
+        # only keep a few connections open, the rest get one response each
+        persistent = self.connections < MAX_CONNECTIONS
+        self.connections += 1
+        try:
+            request = Request(REQUEST_BUF_SIZE)
+            for n in range(MAX_REQUESTS):
+                if not await self.read_request(reader, writer, request):
+                    break
+                keep_alive = persistent and n < MAX_REQUESTS - 1 and not request.close
                 
-            # Get request body if present
-            data = None
-            if body:
-                try:
-                    data = ujson.loads(body)  # Parse JSON string into a Python dictionary
-                except ValueError as e:
-                    print("Error parsing body:", e)
-                    print("body: ", body)
-                                                    
-            response = self.handle_data(path, data)
+                path = request.path()
+                self._current_path = path
                 
-            data_sent = 0
-            total_data = len(response)
-            
-            while data_sent < total_data:
-                try:
-                    chunk = response[data_sent:data_sent + 2048] # Send data in smaller chunks
-                    bytes_written = client.write(chunk)
-                    if bytes_written is None:
-                        await asyncio.sleep(0.1)
-                        continue
-    
-                    data_sent += bytes_written
-                    
-                except OSError as e:
-                    if e.args[0] == 11:  # EAGAIN
-                        # Socket is not ready, retry after a short delay
-                        await asyncio.sleep(0.1)
-                        continue
-                    else:
-                        print("OS error line 177:", e)
-                        # If the error is not EAGAIN, raise it
-                        raise
-                except Exception as e:
-                    print(f"Error while sending data: {e}")
-                    break  # Optionally, break on other errors
+                if path == '/events':
+                    self.connections -= 1  # limited by the event hub instead
+                    persistent = False
+                    try:
+                        await self.stream_events(writer)
+                    finally:
+                        self.connections += 1
+                    break
+                asset = self.assets.get(path)
+                if asset:
+                    await self.send_static(writer, asset, request, keep_alive)
+                else:
+                    await self.dispatch(writer, request, path, keep_alive)
+                request.consume()
+                
+                if not keep_alive:
+                    break
 
         except Exception as e:
             print("Error handling client:", e)
         finally:
-            client.close()
-            #print(f"Connection closed for {addr}")
+            self.connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def dispatch(self, writer, request, path, keep_alive):
+        """Look the path up in the route table, check the request against it and run the handler"""
+        route = self.routes.get(path)
+        if route is None:
+            await self.send_error(writer, "404 Not Found", "this path doesn't exist", keep_alive)
+            return
+        handler, methods, fields = route
+        if not request.method & methods:
+            await self.send_error(writer, "405 Method Not Allowed", "method not allowed", keep_alive)
+            return
+        
+        # Get request body if present
+        data = {}
+        if request.content_length:
+            try:
+                data = ujson.loads(bytes(request.body()))  # Parse JSON string into a Python dictionary
+            except ValueError as e:
+                print("Error parsing body:", e)
+                data = None
+            if not isinstance(data, dict):
+                await self.send_error(writer, "400 Bad Request", "the body must be a JSON object", keep_alive)
+                return
+        query = request.query()
+        if query:
+            data.update(self.parse_query(query))
+        for field in fields:
+            if field not in data:
+                await self.send_error(writer, "400 Bad Request", f"missing {field}", keep_alive)
+                return
+        
+        try:
+            content_type, content = handler(data)
+        except BadRequest as e:
+            await self.send_error(writer, "400 Bad Request", str(e), keep_alive)
+            return
+        except Exception as e:
+            print("Error in handler for", path, e)
+            await self.send_error(writer, "500 Internal Server Error", "request failed", keep_alive)
+            return
+        await self.send_response(writer, content_type, content, keep_alive)
 
     async def serve(self):
-        addr = socket.getaddrinfo(self.ip_address, 80)[0][-1]
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        heartbeat_counter = 0
-                
+        # tasks only wake up when their socket is ready, no polling
+        server = await asyncio.start_server(self.handle_client, self.ip_address, PORT, backlog=3)
+        print(f"Server listening on http://{self.ip_address}:{PORT}")
+        
         try:
-            s.bind(addr)
-            s.listen(3)
-            s.setblocking(False)
-            print(f"Server listening on http://{addr[0]}:{addr[1]}")
-            
             while True:
-                heartbeat_counter += 1
-                if heartbeat_counter % 100 == 0:  # Every ~10 seconds (assuming 100ms sleep)
-                    gc.collect()
-                    #print(f"Free memory: {gc.mem_free()}")
-                try:
-                    client, addr = s.accept()
-                    asyncio.create_task(self.handle_client(client, addr))
-                    
-                except OSError as e:
-                    if e.args[0] == 11:  # EAGAIN
-                        await asyncio.sleep_ms(100)
-                        continue
-                    print("Socket error:", e)
-                    await asyncio.sleep(1)  # Add delay on error
+                await asyncio.sleep(10)
+                gc.collect()
+                #print(f"Free memory: {gc.mem_free()}")
                     
         except Exception as e:
             print(f"Server error: {e}")
         finally:
-            s.close()
+            server.close()
 
     async def start(self):
         """Start the web server"""
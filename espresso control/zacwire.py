@@ -1,171 +1,233 @@
 from machine import Pin, Timer
-from utime import ticks_diff, ticks_us
+from utime import ticks_add, ticks_diff, ticks_us
 from array import array
-from micropython import schedule
+import micropython
+from sensor_filter import SensorFilter, SCALE
+
+micropython.alloc_emergency_exception_buf(100)
+
+RING = const(128)  # edges the ring holds, a power of 2 (a reading is 40)
+WRAP = const(255)  # ring indices count to 2 * RING so a full ring can be told from an empty one
+MASK = const(127)
+EDGES = const(40)  # 2 bytes * (start + 8 data + parity) * falling and rising edge
+IDLE_US = const(1000)  # quiet line between readings (a bit is ~125 us)
+STALE_US = const(200000)  # no reading for this long is NOT_RUNNING
+POLL_MS = const(20)  # how often the timer looks for finished readings
+STROBE_MIN = const(30)  # plausible start bit low time in us, nominally 62.5
+STROBE_MAX = const(110)
 
 class ZACwire:
     # Constants for error conditions and limits
-    NOT_RUNNING = 2333     
-    WRONG_PARITY = 2222    
+    NOT_RUNNING = 2333
+    WRONG_PARITY = 2222
     LOW_RANGE_LIMIT = -50  # Actual sensor lower limit
     HIGH_RANGE_LIMIT = 150 # Actual sensor upper limit
 
-    def __init__(self, data_pin, power_pin, start=True):
-        """Initialize ZACwire for TSic306"""
+    def __init__(self, data_pin, power_pin, start=True, method='mode', window=15):
+        """Initialize ZACwire for TSic306.
+        The pin interrupt only stores the time of each edge in a ring and
+        never allocates. A timer decodes the finished readings from the
+        ring every POLL_MS: a reading is a burst of edges with an idle line
+        either side. Good readings go through a SensorFilter (method and
+        window, see there) and temp() returns its result."""
         self.timer = Timer(0)
-        self.bufloc = 0
-        self.buflen = 40  # Each packet has 40 edges (2 edgeds * 2 packets * (start + 8 data + parity))
-        self.buf = array('l', [0] * self.buflen)
-        self.dt = array('l', [0] * (self.buflen-1))
+        self.edges = array('l', [0] * RING)
+        self.head = 0  # next slot the interrupt writes, counts to WRAP
+        self.tail = 0  # first edge not decoded yet
+        self.dropped = 0  # edges lost to a full ring
+        self.seen_dropped = 0
+        self.lows = array('h', [0] * (EDGES // 2))  # low times of the last reading, us
         self.last_time = 0
-                
+
         self.pin = Pin(data_pin, Pin.IN)
         self.power = Pin(power_pin, Pin.OUT)
         self.power.value(0)
-        
-        self.bitslen = 14
-        self.bits = array('b', [0]*self.bitslen)
-        
+
+        # bound once, so neither callback allocates a bound method
+        self.irq_cb = self.irq_handler
+        self.poll_cb = self.poll
+
         self.rawT = ZACwire.NOT_RUNNING
-        self.parity_count = 0
+        # per reading diagnostics
+        self.packet_count = 0  # bursts of edges long enough to be a reading
         self.success_count = 0
-        self.wrong_count = 0
-        
-        self.last_temp = ZACwire.NOT_RUNNING
-        self.last_time = 0
-        self.max_temp_change = 10
-                
+        self.parity_count = 0
+        self.framing_count = 0  # wrong number of edges, no stop bit or implausible strobe
+        self.overrun_count = 0  # readings lost to a full ring
+        self.noise_count = 0  # stray edges, e.g. the line coming up at power on
+        self.strobe_us = 0  # start bit low time of the last reading
+
         self.parity = False
-        
-        self.temp_buf_length = 15
-        self.temp_buffer = array('l', [ZACwire.NOT_RUNNING] * self.temp_buf_length)
-        self.buffer_pos = 0
-        
+
+        self.filter = SensorFilter(method, window)
+
         self.on = False
-                        
+
         if start:
             self.start()
 
     def irq_handler(self, pin):
-        """Handle pin interrupts for both rising and falling edges."""
-        current_time = ticks_us()
-        self.buf[self.bufloc] = current_time
-        
-        if self.bufloc == 0:
-            # Start timer for decoding after receiving first edge
-            self.timer.init(period=5, callback=self.decode)
-        self.bufloc = self.bufloc + 1
-                
-
-    def timer_cb(self, _):
-        """Timer callback to initiate decoding."""
-        self.timer.deinit()
-        self.bufloc = 0
-        schedule(self.decode, None)
+        """Store the time of an edge. Runs as a hard interrupt: bounded work
+        and no allocation, a full ring drops the edge."""
+        head = self.head
+        if (head - self.tail) & WRAP == RING:
+            self.dropped += 1
+            return
+        self.edges[head & MASK] = ticks_us()
+        self.head = (head + 1) & WRAP
 
-    def decode(self, _):
-        """Decode both packets of temperature data."""
-        
-        self.timer.deinit()
-        self.bufloc = 0
-    
-        for k in range(self.buflen-1):
-            self.dt[k] = ticks_diff(self.buf[k+1], self.buf[k])
-            
-        threshold = 52
-        
-        # adjustment for if an extra bit was read (not sure why this is happening)
-        alt = 1
-        if self.dt[-1] > 125 or self.dt[-1] < -125:
-            alt = 0
-        
-        for j in range(self.bitslen):
-            self.bits[-1-j] = self.dt[(-1-j)*2+alt] < threshold
-        
-        parity1 = sum(self.bits[-9:-1]) % 2
-        parity2 = sum(self.bits[-14:-11]) % 2
-        if parity1 != self.bits[-1] or parity2 != self.bits[-11]:
+    def poll(self, _):
+        """Timer callback: decode every reading in the ring whose line has
+        since gone idle"""
+        head = self.head
+        if self.dropped != self.seen_dropped:
+            # the edges around the gap can't be framed, start again from here
+            self.seen_dropped = self.dropped
+            self.overrun_count += 1
+            self.tail = head
+            return
+        start = self.tail
+        edges = self.edges
+        i = start
+        while i != head:
+            nxt = (i + 1) & WRAP
+            if nxt == head:
+                if ticks_diff(ticks_us(), edges[i & MASK]) <= IDLE_US:
+                    break  # still arriving
+            elif ticks_diff(edges[nxt & MASK], edges[i & MASK]) <= IDLE_US:
+                i = nxt
+                continue
+            self.decode(start, (nxt - start) & WRAP)
+            start = nxt
+            i = nxt
+        self.tail = start
+
+    def decode(self, first, n):
+        """Decode the n edges from ring index first as one reading.
+        The stop bit between the two bytes is the widest gap between edges
+        that leaves room for a byte either side, which frames the bytes
+        even with a stray edge at either end."""
+        if n < 4:
+            self.noise_count += 1
+            return
+        self.packet_count += 1
+        edges = self.edges
+        gap = 0
+        widest = 0
+        for k in range(EDGES // 2, n - EDGES // 2 + 1):
+            dt = ticks_diff(edges[(first + k) & MASK], edges[(first + k - 1) & MASK])
+            if dt > widest:
+                widest = dt
+                gap = k
+        if not gap:
+            self.framing_count += 1
+            return
+        high = self.decode_byte(first + gap - EDGES // 2, 0)
+        low = self.decode_byte(first + gap, EDGES // 4)
+        if high == -1 or low == -1 or high > 7:
+            self.framing_count += 1
+            return
+        if high == -2 or low == -2:
             self.rawT = ZACwire.WRONG_PARITY
             self.parity_count += 1
             self.parity = True
             return
-            
-        self.rawT = self.bits[-2]
-        for k in range(7):
-            self.rawT += self.bits[-3-k] << k+1
-        for k in range(3):
-            self.rawT += self.bits[-12-k] << k+8
-        
-        self.temp_buffer[self.buffer_pos] = self.rawT
-        self.buffer_pos = (self.buffer_pos + 1) % self.temp_buf_length
+
+        self.rawT = (high << 8) | low
+        self.last_time = edges[(first + n - 1) & MASK]  # only a good reading is fresh
+        self.filter.add(self.rawT)
         self.success_count += 1
-        
         self.parity = False
-                
+
+    def decode_byte(self, first, slot):
+        """The byte whose start bit falls at ring index first, -1 if that
+        isn't a start bit, -2 on a parity error. Low times go into
+        self.lows from slot.
+        The start bit (strobe) is low for half a bit, a 1 for a quarter and
+        a 0 for three quarters. The bit time is measured over the whole byte,
+        from the first falling edge to the last, so one late edge hardly
+        moves it, and the strobe has to be nearer half a bit than a
+        quarter or three quarters. Data bits
+        low for less than half a bit are 1s."""
+        edges = self.edges
+        strobe = ticks_diff(edges[(first + 1) & MASK], edges[first & MASK])
+        self.lows[slot] = strobe
+        span = ticks_diff(edges[(first + EDGES // 2 - 2) & MASK], edges[first & MASK])  # 9 bits
+        half = span // 18
+        if strobe < STROBE_MIN or strobe > STROBE_MAX or 2 * strobe <= half or 2 * strobe >= 3 * half:
+            return -1
+        self.strobe_us = strobe
+        value = 0
+        ones = 0
+        for j in range(1, 10):
+            fall = first + 2 * j
+            low = ticks_diff(edges[(fall + 1) & MASK], edges[fall & MASK])
+            self.lows[slot + j] = low
+            if low < half:
+                ones += 1
+                if j < 9:
+                    value |= 1 << (8 - j)
+        if ones & 1:
+            return -2
+        return value
+
     def dump(self):
-        print("Last DT:", self.dt)
-        print("Last bits:", self.bits)
+        print("Last low times:", self.lows)
         print("Parity:", self.parity)
         print("rawT:", self.rawT)
-        print("temp_buffer:", self.temp_buffer)
-        
-    def get_mode_temp(self):
-        try:
-            time_diff = ticks_diff(ticks_us(), self.buf[self.bufloc])
-        except:
-            time_diff = ticks_diff(ticks_us(), self.buf[self.bufloc-1])
-        if time_diff > 200000:
-            return ZACwire.NOT_RUNNING
-        
-        counts = {}
-        max_count = 0
-        buffer = list(self.temp_buffer)
-        mode = buffer[0]
-        
-        # Count occurrences
-        for t in buffer:
-            if t in counts:
-                counts[t] += 1
-            else:
-                counts[t] = 1
-            if counts[t] > max_count:
-                max_count = counts[t]
-                mode = t
-                
-        if counts.get(self.rawT, 0) == max_count:
-            mode = self.rawT
-        
-        counts = None
-                    
-        return mode
-                    
+        print("Filter:", self.filter.method, self.filter.samples, self.filter.value)
+        print("Diagnostics:", self.diagnostics())
+
+    def diagnostics(self):
+        return {
+            "packets": self.packet_count,
+            "good": self.success_count,
+            "parity_errors": self.parity_count,
+            "framing_errors": self.framing_count,
+            "overruns": self.overrun_count,
+            "noise": self.noise_count,
+            "strobe_us": self.strobe_us,
+        }
+
+    def filtered(self):
+        """The filtered reading in 1/SCALE steps, None if there is none or
+        the last one is too old"""
+        value = self.filter.value
+        if value is None or ticks_diff(ticks_us(), self.last_time) > STALE_US:
+            return None
+        return value
 
     def start(self):
         """Start monitoring the sensor."""
-        self.pin.irq(trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, handler=self.irq_handler)
+        self.head = self.tail = 0
+        self.seen_dropped = self.dropped
+        self.last_time = ticks_add(ticks_us(), -STALE_US - 1)
+        self.filter.reset()
+        self.timer.init(mode=Timer.PERIODIC, period=POLL_MS, callback=self.poll_cb)
+        self.pin.irq(trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, handler=self.irq_cb, hard=True)
         self.power.value(1)
         self.on = True
 
     def stop(self):
         """Stop monitoring the sensor."""
         self.pin.irq(handler=None)
+        self.timer.deinit()
         self.rawT = ZACwire.NOT_RUNNING
         self.power.value(0)
         self.on = False
-        #self.temp_buffer = array('l', [ZACwire.NOT_RUNNING] * self.temp_buf_length)
-        
+
     def raw_temp(self):
         return self.rawT
-    
+
     def ratio(self):
-        return self.success_count/(self.success_count + self.parity_count)
-    
+        return self.success_count/max(1, self.packet_count)
+
     def temp(self):
         if self.on:
-            raw = self.get_mode_temp()
-            if raw == ZACwire.WRONG_PARITY or raw == ZACwire.NOT_RUNNING:
-                return raw
-            return raw / 2047 * 200 - 50
+            value = self.filtered()
+            if value is None:
+                return ZACwire.NOT_RUNNING
+            return value / (2047 * SCALE) * 200 - 50
         else:
             return ZACwire.NOT_RUNNING
 
@@ -179,6 +241,6 @@ class ZACwire:
         # TSic306 conversion formula for raw value to temperature
         return self.rawT / 2047 * 200 - 50
 
-    
-    
+
+
 #zw = ZACwire(2)
\ No newline at end of file
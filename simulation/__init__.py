@@ -0,0 +1,20 @@
+"""
+Host simulation of the espresso controller.
+
+Stand-ins for the MicroPython modules the controller imports (machine, utime,
+uasyncio, micropython, network, framebuf) run on a virtual clock, so the code
+in "espresso control" runs unchanged under CPython. A first order plus dead
+time boiler model closes the loop: the SSR pin drives its heater and its
+temperature comes back as TSic306 ZACwire edges on the sensor pin.
+
+    from simulation import Simulation
+    sim = Simulation().turn_on(0).shot(1200)
+    print(sim.run(30 * 60))
+
+or from the repository root: python -m simulation --minutes 30 --shot 1200
+"""
+
+from .boiler import Boiler
+from .clock import clock
+from .harness import Simulation, install
+from .tsic import FakeTSic
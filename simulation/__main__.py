@@ -0,0 +1,29 @@
+"""Simulate a heat-up from cold, optionally with shots, and print a summary."""
+
+import argparse
+
+from .harness import Simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation", description=__doc__)
+    parser.add_argument("--minutes", type=float, default=30, help="simulated time (default 30)")
+    parser.add_argument("--shot", type=float, action="append", default=[],
+                        help="pull a 28 s shot at this many seconds, can be repeated")
+    parser.add_argument("--csv", help="write the 1 s trace to this file")
+    parser.add_argument("--speed", type=float, help="virtual seconds per real second, default as fast as possible")
+    parser.add_argument("--verbose", action="store_true", help="show the controller's output")
+    args = parser.parse_args()
+
+    sim = Simulation(speed=args.speed, verbose=args.verbose).turn_on(0)
+    for t in args.shot:
+        sim.shot(t)
+    summary = sim.run(args.minutes * 60)
+    for key, value in summary.items():
+        print(f"{key:>16}: {value:.2f}" if isinstance(value, float) else f"{key:>16}: {value}")
+    if args.csv:
+        sim.write_csv(args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Run the relay autotune against the boiler model and try the tunings it finds:
+python -m simulation.bench_autotune
+
+For each rule the controller heats up, holds the setpoint and then autotunes.
+The tunings are then used for a heat-up from cold with a shot, with both PID
+controllers. The tunings suit the fixed-point PID, the float one overshoots
+by several degrees with them, which is why a finished autotune switches the
+"controller" setting to fixed. The saved column shows what it was left on.
+"""
+
+import argparse
+import json
+import os
+
+from .harness import APP_DIR, Simulation
+
+
+def autotune(rule, start):
+    sim = Simulation().turn_on(0)
+    sim.at(start, lambda sim: sim.controller.start_autotune(rule))
+    sim.run(start + 1800)
+    return sim.controller.autotune_status(), sim.controller.settings.get("controller")
+
+
+def heat_up(tunings, controller, minutes, shot):
+    with open(os.path.join(APP_DIR, "settings.json")) as f:
+        settings = json.load(f)
+    settings["PID"] = tunings
+    settings["controller"] = controller
+    return Simulation(settings=settings).turn_on(0).shot(shot).run(minutes * 60)
+
+
+def fmt(value, spec):
+    if value is None:
+        return "-".rjust(int(spec.split(".")[0]))
+    return format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_autotune", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", type=float, default=600, help="seconds before the autotune starts (default 600)")
+    parser.add_argument("--minutes", type=float, default=30, help="length of the heat-up runs (default 30)")
+    parser.add_argument("--shot", type=float, default=1500, help="shot time in the heat-up runs (default 1500)")
+    args = parser.parse_args()
+
+    with open(os.path.join(APP_DIR, "settings.json")) as f:
+        settings = json.load(f)
+    current = settings["PID"]
+    current_controller = settings.get("controller")
+    print(f"{'rule':>8} {'Ku':>7} {'Pu s':>6} {'P':>7} {'I':>7} {'D':>7} {'pid':>6}"
+          f" {'ready s':>8} {'over C':>7} {'err C':>6} {'saved':>6}")
+    for rule in ("current", "zn", "tl", "simc"):
+        if rule == "current":
+            status, saved = {"PID": current}, current_controller
+        else:
+            status, saved = autotune(rule, args.start)
+            if "PID" not in status:
+                print(f"{rule:>8} {status['state']}: {status['message']}")
+                continue
+        tunings = status["PID"]
+        for controller in ("float", "fixed"):
+            summary = heat_up(tunings, controller, args.minutes, args.shot)
+            print(f"{rule:>8} {fmt(status.get('Ku'), '7.2f')} {fmt(status.get('Pu'), '6.1f')}"
+                  f" {tunings['P']:>7.3f} {tunings['I']:>7.4f} {tunings['D']:>7.2f} {controller:>6}"
+                  f" {fmt(summary['time_to_ready'], '8.0f')} {fmt(summary['overshoot'], '7.2f')}"
+                  f" {fmt(summary['mean_abs_error'], '6.2f')} {saved or '-':>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Shot recovery with and without the brew boost:
+python -m simulation.bench_brew
+
+Three shots are pulled once the boiler has settled, the second two minutes
+after the first. For each heater boost profile the benchmark reports how
+far the temperature falls, the seconds from the end of the shot until it
+is back within 0.5 C of the setpoint, and the overshoot after that. It also
+lists the shots the controller detected and logged.
+"""
+
+import argparse
+import json
+
+from .bench_control import fmt, load_settings
+from .harness import READY_BAND, Simulation
+
+PROFILES = {
+    "none": [],
+    "flat": [[0, 80]],
+    "front": [[0, 100], [15, 70]],
+}
+SHOTS = (1500, 1620, 2400)
+DURATION = 28
+
+
+def run(profile):
+    settings = load_settings()
+    settings["brew"] = {"profile": profile}
+    sim = Simulation(settings=settings).turn_on(0)
+    for start in SHOTS:
+        sim.shot(start, DURATION)
+    logged = []
+    sim.at(SHOTS[-1] + 590, lambda sim: logged.extend(sim.controller.get_shots()["shots"]))
+    sim.run(SHOTS[-1] + 600)
+
+    results = []
+    for start in SHOTS:
+        end = start + DURATION
+        rows = [row for row in sim.trace if start <= row[0] < start + 300 and row[2] is not None]
+        setpoint = rows[0][3]
+        low = min(row[2] for row in rows)
+        recovery = None
+        overshoot = 0.0
+        for t, _, temp, _, _, _ in rows:
+            if t < end:
+                continue
+            if recovery is None:
+                if abs(temp - setpoint) < READY_BAND:
+                    recovery = t - end
+            else:
+                overshoot = max(overshoot, temp - setpoint)
+        results.append((start, setpoint - low, recovery, overshoot if recovery is not None else None))
+    return results, logged
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_brew", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("profiles", nargs="*", default=list(PROFILES),
+                        help="profiles to run: " + ", ".join(PROFILES) + " or a JSON list of [s, %%] steps")
+    args = parser.parse_args()
+
+    print(f"{'profile':>16} {'shot s':>6} {'drop C':>6} {'recover s':>9} {'over C':>6}")
+    for name in args.profiles:
+        profile = PROFILES[name] if name in PROFILES else json.loads(name)
+        results, logged = run(profile)
+        for start, drop, recovery, overshoot in results:
+            print(f"{name:>16} {start:>6} {drop:>6.1f} {fmt(recovery, '9.0f')} {fmt(overshoot, '6.2f')}")
+        for shot in logged:
+            print(f"{'':>16} logged: {shot['duration']} s, {shot['start_temp']} -> {shot['min_temp']} C,"
+                  f" recovered in {shot['recovery']} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Time to READY for each controller on the boiler model:
+python -m simulation.bench_control
+
+The boiler heats from cold to the espresso setpoint, switches to steam and
+back to espresso. For each phase the benchmark reports the seconds until the
+reading is within 0.5 C of the setpoint (READY on the display) and how far
+it then overshoots. The MPC model is first fitted to the log of a heat-up
+with the PID, like one from a real machine would be.
+"""
+
+import argparse
+import json
+import os
+
+from .harness import APP_DIR, READY_BAND, Simulation, install
+
+CONTROLLERS = ("float", "fixed", "scheduled", "mpc")
+
+
+def load_settings():
+    with open(os.path.join(APP_DIR, "settings.json")) as f:
+        return json.load(f)
+
+
+def identify(minutes=20):
+    """Fit a BoilerModel to a logged heat-up with the fixed point PID"""
+    install()
+    from mpc import BoilerModel
+
+    settings = load_settings()
+    settings["controller"] = "fixed"
+    sim = Simulation(settings=settings).turn_on(0)
+    sim.run(minutes * 60)
+    times = [row[0] for row in sim.trace]
+    temps = [row[2] for row in sim.trace]
+    duties = [row[4] for row in sim.trace]
+    return BoilerModel.from_heat_up(times, temps, duties, settings["mode_temps"]["espresso"])
+
+
+def phases(sim, changes, end):
+    """(setpoint, time to ready, overshoot) for each setpoint change"""
+    results = []
+    for i, start in enumerate(changes):
+        stop = changes[i + 1] if i + 1 < len(changes) else end
+        rows = [row for row in sim.trace if start <= row[0] < stop and row[2] is not None and row[3] is not None]
+        setpoint = rows[-1][3]
+        direction = 1 if rows[0][2] < setpoint else -1
+        ready = None
+        overshoot = 0.0
+        for t, _, temp, _, _, _ in rows:
+            if ready is None:
+                if abs(temp - setpoint) < READY_BAND:
+                    ready = t - start
+            else:
+                overshoot = max(overshoot, (temp - setpoint) * direction)
+        results.append((setpoint, ready, overshoot if ready is not None else None))
+    return results
+
+
+def run(controller, model, minutes):
+    settings = load_settings()
+    settings["controller"] = controller
+    if model:
+        settings["model"] = {"gain": model.gain, "tau": model.tau, "dead_time": model.dead_time,
+                             "ambient": model.ambient}
+    sim = Simulation(settings=settings).turn_on(0)
+    changes = [0, minutes * 20, minutes * 40]  # a third each
+    sim.at(changes[1], lambda sim: sim.controller.mode_switch("steam"))
+    sim.at(changes[2], lambda sim: sim.controller.mode_switch("espresso"))
+    sim.run(minutes * 60)
+    return phases(sim, changes, minutes * 60)
+
+
+def fmt(value, spec):
+    if value is None:
+        return "-".rjust(int(spec.split(".")[0]))
+    return format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_control", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=60, help="simulated time (default 60)")
+    parser.add_argument("controllers", nargs="*", default=CONTROLLERS, help="controllers to run")
+    args = parser.parse_args()
+
+    model = identify()
+    if model:
+        print(f"model: gain {model.gain:.0f} C, tau {model.tau:.0f} s, dead time {model.dead_time:.1f} s,"
+              f" ambient {model.ambient:.1f} C")
+    print(f"{'controller':>10} {'setpoint':>8} {'ready s':>8} {'over C':>7}")
+    for controller in args.controllers:
+        for setpoint, ready, overshoot in run(controller, model, args.minutes):
+            print(f"{controller:>10} {setpoint:>8.1f} {fmt(ready, '8.0f')} {fmt(overshoot, '7.2f')}")
+
+
+if __name__ == "__main__":
+    main()
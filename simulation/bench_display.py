@@ -0,0 +1,70 @@
+"""
+OLED traffic with full and partial refreshes:
+python -m simulation.bench_display
+
+The controller heats up, pulls a shot and idles at the setpoint while the
+display is redrawn every second, once sending the whole screen each time
+and once only the items that changed. For each the benchmark reports the
+bytes and I2C transactions a second, the time the bus was busy per redraw
+at 400 kHz (which blocks the event loop on the board) and the host time
+spent drawing with the framebuf stand-in. It also checks that the fake
+display's RAM ends up the same as the frame buffer, and exits with status 1
+if it doesn't.
+"""
+
+import argparse
+import sys
+import time
+
+from .harness import Simulation
+
+
+def run(partial, minutes):
+    sim = Simulation().turn_on(0).shot(minutes * 30)
+    frames = []
+
+    def setup(sim):
+        controller = sim.controller
+        controller.screen.partial = partial
+        draw = controller.draw_screen
+
+        def timed():
+            start = time.perf_counter()
+            draw()
+            frames.append(time.perf_counter() - start)
+        controller.draw_screen = timed
+
+    sim.at(0, setup)
+    seconds = minutes * 60
+    sim.run(seconds)
+    oled = sim.oled
+    same = oled.ram == sim.controller.oled.buffer
+    return {
+        "bytes": oled.bytes / seconds,
+        "transactions": oled.transactions / seconds,
+        "bus_ms": 1000 * oled.bus_seconds() / max(len(frames), 1),
+        "draw_ms": 1000 * sum(frames) / max(len(frames), 1),
+        "same": same,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_display", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10, help="simulated time (default 10)")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'refresh':>8} {'bytes/s':>8} {'writes/s':>8} {'bus ms':>7} {'draw ms':>7} {'ram ok':>6}")
+    for name, partial in (("full", False), ("partial", True)):
+        r = run(partial, args.minutes)
+        print(f"{name:>8} {r['bytes']:>8.0f} {r['transactions']:>8.1f} {r['bus_ms']:>7.2f} {r['draw_ms']:>7.2f}"
+              f" {'yes' if r['same'] else 'NO':>6}")
+        failed |= not r["same"]
+    if failed:
+        print("FAILED: the display doesn't show the frame buffer")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
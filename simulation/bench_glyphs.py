@@ -0,0 +1,87 @@
+"""
+Cost of drawing the large temperature text, with and without the glyph cache:
+python -m simulation.bench_glyphs
+
+Each frame draws the temperature and the setpoint at twice the font size,
+as on the display, with the temperature moving 0.1 C a frame. The benchmark
+counts the calls into the frame buffer per frame (pixel, fill_rect, blit
+...). Those are what cost on the board, each is a trip from Python into C.
+It also times a frame on this computer with the framebuf stand-in. That
+time is only good for comparing the two, the stand-in's blit is written in
+Python. The cached figures are after the first pass, when every glyph has
+been rendered.
+"""
+
+import argparse
+import functools
+import time
+
+from .harness import install
+
+CALLS = ("pixel", "fill_rect", "hline", "vline", "blit", "text", "fill")
+
+
+def count_calls(cls, counter):
+    """Count the outermost calls to the drawing methods of cls"""
+    depth = [0]
+
+    def wrap(method):
+        @functools.wraps(method)
+        def counted(*args, **kwargs):
+            if not depth[0]:
+                counter[0] += 1
+            depth[0] += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                depth[0] -= 1
+        return counted
+
+    for name in CALLS:
+        setattr(cls, name, wrap(getattr(cls, name)))
+
+
+def frames(n):
+    for k in range(n):
+        yield f"{93 + (k % 20) / 10:.1f}", "94.0"
+
+
+def run(cached, n, counter):
+    import framebuf2
+
+    framebuf2.glyphs = framebuf2.GlyphCache() if cached else framebuf2.GlyphCache(max_glyphs=0)
+    fb = framebuf2.FrameBuffer(bytearray(128 * 8), 128, 64, framebuf2.MONO_VLSB)
+    x = 128 - 16 * 5
+    if cached:
+        for current, setpoint in frames(20):  # render the glyphs first
+            fb.large_text(current, x, 20, 2)
+            fb.large_text(setpoint, x, 46, 2)
+    counter[0] = 0
+    start = time.perf_counter()
+    for current, setpoint in frames(n):
+        fb.fill_rect(x, 20, 80, 16, 0)
+        fb.fill_rect(x, 46, 80, 16, 0)
+        fb.large_text(current, x, 20, 2)
+        fb.large_text(setpoint, x, 46, 2)
+    seconds = time.perf_counter() - start
+    return counter[0] / n, 1000 * seconds / n, framebuf2.glyphs.count
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_glyphs", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200, help="frames to draw (default 200)")
+    args = parser.parse_args()
+    install()
+    import framebuf
+
+    counter = [0]
+    count_calls(framebuf.FrameBuffer, counter)
+    print(f"{'glyphs':>8} {'calls/frame':>11} {'host ms/frame':>13} {'cached':>6}")
+    for name, cached in (("drawn", False), ("cached", True)):
+        calls, ms, glyphs = run(cached, args.frames, counter)
+        print(f"{name:>8} {calls:>11.0f} {ms:>13.2f} {glyphs:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare boiler temperature ripple with the slow PWM and burst fire heater
+drivers: python -m simulation.bench_heater
+
+Each driver heats the boiler from cold and holds the setpoint. Ripple is
+measured on the model's temperature, sampled every 0.1 s, once the
+controller has settled.
+"""
+
+import argparse
+import json
+import math
+import os
+
+from . import machine
+from .clock import clock
+from .harness import APP_DIR, PINS, Simulation
+
+
+def ripple(sim, start):
+    """Peak to peak and RMS deviation from the mean of the boiler temperature after start"""
+    temps = [temp for t, temp, _, _, _, _ in sim.trace if t >= start]
+    mean = sum(temps) / len(temps)
+    rms = math.sqrt(sum((t - mean) ** 2 for t in temps) / len(temps))
+    return max(temps) - min(temps), rms, mean
+
+
+def run(heater, minutes, settle):
+    with open(os.path.join(APP_DIR, "settings.json")) as f:
+        settings = json.load(f)
+    settings["heater"] = heater
+    sim = Simulation(settings=settings, sample_period=0.1).turn_on(0)
+    switches = []
+
+    def count(value):
+        if value and clock.seconds() >= settle * 60:
+            switches.append(clock.seconds())
+
+    # count SSR switch-ons, added after the board is reset at the start of run
+    sim.at(0, lambda sim: machine.add_listener(PINS["ssr"], count))
+    summary = sim.run(minutes * 60)
+    p2p, rms, mean = ripple(sim, settle * 60)
+    return summary, p2p, rms, mean, len(switches) / (clock.seconds() - settle * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_heater", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=20, help="simulated time (default 20)")
+    parser.add_argument("--settle", type=float, default=10, help="minutes before ripple is measured (default 10)")
+    args = parser.parse_args()
+
+    print(f"{'heater':>8} {'ready s':>8} {'mean C':>8} {'p-p C':>8} {'rms C':>8} {'on/s':>8}")
+    for heater in ("pwm", "burst"):
+        summary, p2p, rms, mean, rate = run(heater, args.minutes, args.settle)
+        ready = summary["time_to_ready"]
+        ready = "-" if ready is None else f"{ready:.0f}"
+        print(f"{heater:>8} {ready:>8} {mean:>8.2f} {p2p:>8.3f} {rms:>8.3f} {rate:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
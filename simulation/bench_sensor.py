@@ -0,0 +1,72 @@
+"""
+How the controller copes with a failing temperature sensor:
+python -m simulation.bench_sensor
+
+The machine heats up and idles at the setpoint, and at --fail seconds the
+sensor starts to send bad packets: a share of them with a flipped bit, so
+they fail the parity check. For each case the benchmark reports when the
+machine shut down with a sensor fault, counted from the failure, and how
+far the boiler went above the setpoint in between. A sensor with some
+errors must keep the machine running, one that sends (nearly) nothing
+good must shut it down within the shutdown time of the sensor health
+(30 s) plus the time the quality takes to fall. Exits with status 1 if a
+case doesn't.
+"""
+
+import argparse
+import sys
+
+from .harness import Simulation
+
+SHUTDOWN_S = 30  # the default sensor_health shutdown
+FALL_S = 10  # time the quality score takes to fall under min_quality
+
+CASES = (
+    # name, share of packets failing parity, should it shut down
+    ("no errors", 0.0, False),
+    ("20% parity", 0.2, False),
+    ("97% parity", 0.97, True),
+    ("all parity", 1.0, True),
+)
+
+
+def run(error_rate, fail, minutes):
+    sim = Simulation().turn_on(0)
+    sim.at(fail, lambda sim: setattr(sim.tsic, "error_rate", error_rate))
+    sim.run(minutes * 60)
+    stopped = None
+    peak = 0.0
+    for t, temp, _, setpoint, _, _ in sim.trace:
+        if t < fail:
+            continue
+        if setpoint is None:
+            stopped = t - fail
+            break
+        peak = max(peak, temp - setpoint)
+    return stopped, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_sensor", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fail", type=float, default=600, help="seconds before the sensor fails (default 600)")
+    parser.add_argument("--minutes", type=float, default=20, help="simulated time (default 20)")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'sensor':>12} {'shut down s':>11} {'over C':>6} {'ok':>3}")
+    for name, error_rate, shuts_down in CASES:
+        stopped, peak = run(error_rate, args.fail, args.minutes)
+        if shuts_down:
+            ok = stopped is not None and stopped <= SHUTDOWN_S + FALL_S
+        else:
+            ok = stopped is None
+        print(f"{name:>12} {'-' if stopped is None else f'{stopped:.0f}':>11} {peak:>6.2f} {'yes' if ok else 'NO':>3}")
+        failed |= not ok
+    if failed:
+        print("FAILED: the sensor health didn't respond as it should")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
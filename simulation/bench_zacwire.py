@@ -0,0 +1,100 @@
+"""
+ZACwire decoding of jittered TSic306 readings:
+python -m simulation.bench_zacwire
+
+Random readings are sent edge by edge into the controller's ZACwire decoder,
+with Gaussian jitter on every edge time, a sensor clock running fast or
+slow, and a stray edge just before the reading. For each case the benchmark
+reports how many readings decoded, how many were rejected (parity or
+framing) and how many decoded to the wrong value: two flipped bits in one
+byte get past the parity check, which only starts to happen with jitter
+past 8 us. It exits with status 1 if a reading was lost with up to 4 us
+of jitter or decoded wrong with up to 8 us, so it doubles as a check of the
+decoder.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+
+from . import machine
+from .clock import clock
+from .harness import PINS, install
+from .tsic import packet_edges
+
+JITTER = (0, 2, 4, 6, 8, 10, 12)
+SKEW = (0.8, 0.9, 1.1, 1.2)
+
+
+def cases():
+    """(name, jitter us, clock scale, stray edge)"""
+    for jitter in JITTER:
+        yield f"jitter {jitter} us", jitter, 1.0, False
+    for scale in SKEW:
+        yield f"clock x{scale}", 2, scale, False
+    yield "stray edge", 2, 1.0, True
+
+
+def run(jitter, scale, stray, readings, seed):
+    """(good, rejected, wrong, diagnostics) after sending readings"""
+    from zacwire import ZACwire
+
+    rng = random.Random(seed)
+    clock.reset()
+    machine.reset_board()
+    machine.drive(PINS["tsic_data"], 0)
+    zw = ZACwire(PINS["tsic_data"], PINS["tsic_power"])
+    machine.drive(PINS["tsic_data"], 1)  # the line comes up with the power
+    good = wrong = 0
+    for _ in range(readings):
+        start = clock.us + 100000
+        raw = rng.randrange(2048)
+        edges = [(int(t * scale), level) for t, level in packet_edges(raw, jitter, rng)]
+        if stray:
+            # a short spike a few bits before the reading
+            clock.set_us(start - 400)
+            machine.drive(PINS["tsic_data"], 0)
+            clock.set_us(start - 398)
+            machine.drive(PINS["tsic_data"], 1)
+        for t, level in edges:
+            clock.set_us(start + t)
+            machine.drive(PINS["tsic_data"], level)
+        before = zw.success_count
+        clock.set_us(clock.us + 5000)
+        zw.poll(None)
+        if zw.success_count > before:
+            if zw.raw_temp() == raw:
+                good += 1
+            else:
+                wrong += 1
+    zw.stop()
+    return good, readings - good - wrong, wrong, zw.diagnostics()
+
+
+async def bench(args):
+    failed = False
+    print(f"{'case':>14} {'good %':>7} {'rejected':>8} {'wrong':>5} {'parity':>6} {'framing':>7} {'noise':>5} {'strobe us':>9}")
+    for name, jitter, scale, stray in cases():
+        good, rejected, wrong, diag = run(jitter, scale, stray, args.readings, args.seed)
+        print(f"{name:>14} {100 * good / args.readings:>7.2f} {rejected:>8} {wrong:>5} {diag['parity_errors']:>6}"
+              f" {diag['framing_errors']:>7} {diag['noise']:>5} {diag['strobe_us']:>9}")
+        if (jitter <= 4 and rejected) or (jitter <= 8 and wrong):
+            failed = True
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m simulation.bench_zacwire", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=2000, help="readings per case (default 2000)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    install()
+    if asyncio.run(bench(args)):
+        print("FAILED: readings lost or decoded wrong")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""First order plus dead time model of the boiler."""
+
+import math
+
+
+class Boiler:
+    def __init__(self, gain=1000.0, tau=1800.0, dead_time=8.0, ambient=22.0, volume=300.0,
+                 inlet_temp=20.0, temp=None):
+        """
+        gain: temperature rise above ambient the heater would reach at full
+        power (deg C), tau: time constant (s), dead_time: delay between the
+        heater switching and the sensor seeing it (s), volume: water in the
+        boiler (ml), inlet_temp: temperature of the water drawn in during a
+        shot. The defaults are roughly a Silvia: a 1 kW element heating the
+        boiler from cold at about 0.55 C/s, and about 7% power to hold 95 C.
+        """
+        self.gain = gain
+        self.tau = tau
+        self.dead_time = dead_time
+        self.ambient = ambient
+        self.volume = volume
+        self.inlet_temp = inlet_temp
+        self.temp = ambient if temp is None else temp
+        self.time = 0.0
+        self.heater = 0.0  # heater power seen by the water, 0-1
+        self.flow = 0.0  # ml/s of water drawn
+        self._pending = []  # (time, power) heater changes still in the dead time
+        self.energy = 0.0  # heater-on seconds, at full power
+
+    def _integrate(self, t):
+        dt = t - self.time
+        if dt <= 0:
+            return
+        # dT/dt = (gain*u - (T - ambient))/tau - flow/volume*(T - inlet)
+        rate = 1 / self.tau + self.flow / self.volume
+        target = (self.ambient / self.tau + self.gain * self.heater / self.tau
+                  + self.flow / self.volume * self.inlet_temp) / rate
+        self.temp = target + (self.temp - target) * math.exp(-rate * dt)
+        self.energy += self.heater * dt
+        self.time = t
+
+    def advance(self, t):
+        """Bring the model up to time t (s)"""
+        while self._pending and self._pending[0][0] <= t:
+            when, power = self._pending.pop(0)
+            self._integrate(when)
+            self.heater = power
+        self._integrate(t)
+
+    def set_heater(self, power, t):
+        """Switch the heater to power (0-1) at time t, felt after the dead time"""
+        self.advance(t)
+        self._pending.append((t + self.dead_time, power))
+
+    def set_flow(self, ml_per_s, t):
+        """Start or stop drawing water through the group at time t"""
+        self.advance(t)
+        self.flow = ml_per_s
+
+    def temperature(self, t):
+        self.advance(t)
+        return self.temp
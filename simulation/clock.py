@@ -0,0 +1,37 @@
+"""Virtual time shared by the stand-in utime, machine and uasyncio modules."""
+
+import math
+import time
+
+
+class VirtualClock:
+    def __init__(self):
+        self.reset()
+
+    def reset(self, epoch=1767225600, speed=None):
+        """Start again from zero. epoch is the wall clock time (Unix seconds) at
+        zero, speed is how many virtual seconds pass per real second while the
+        simulation is idle (None runs as fast as possible)."""
+        self.us = 0
+        self.epoch = epoch
+        self.speed = speed
+
+    def seconds(self):
+        return self.us / 1e6
+
+    def advance(self, seconds):
+        """Let virtual time pass, in real time divided by speed if it is set"""
+        if seconds <= 0:
+            return
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        # round up, or a wait shorter than half a microsecond would never end
+        self.us += int(math.ceil(seconds * 1e6))
+
+    def set_us(self, us):
+        """Move time forward to us, used for events inside a callback"""
+        if us > self.us:
+            self.us = us
+
+
+clock = VirtualClock()
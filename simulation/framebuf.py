@@ -0,0 +1,166 @@
+"""
+Stand-in for MicroPython's framebuf, in pure Python.
+
+Supports the MONO_VLSB, MONO_HLSB, MONO_HMSB and GS8 formats. text() draws
+8x8 characters like the real module, but from a made up pattern per
+character rather than the MicroPython font, so it is good for timing and
+for comparing two ways of drawing, not for reading.
+"""
+
+MONO_VLSB = 0
+RGB565 = 1
+GS4_HMSB = 2
+MONO_HLSB = 3
+MONO_HMSB = 4
+GS2_HMSB = 5
+GS8 = 6
+
+_glyphs = {}
+
+
+def _glyph(ch):
+    """Rows of an 8x8 character, bit 7 is the left column"""
+    code = ord(ch)
+    if code not in _glyphs:
+        if code <= 32 or code > 126:
+            rows = (0,) * 8
+        else:
+            h = (code * 2654435761) & 0xffffffff
+            rows = tuple(((h >> (4 * r)) | (h >> (4 * r + 9))) & 0x7e for r in range(7)) + (0,)
+        _glyphs[code] = rows
+    return _glyphs[code]
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        if format not in (MONO_VLSB, MONO_HLSB, MONO_HMSB, GS8):
+            raise NotImplementedError("framebuf stand-in only supports MONO_* and GS8")
+        self._buf = buffer
+        self._width = width
+        self._height = height
+        self._format = format
+        stride = width if stride is None else stride
+        if format in (MONO_HLSB, MONO_HMSB):
+            stride = (stride + 7) & ~7
+        self._stride = stride
+
+    def _get(self, x, y):
+        f = self._format
+        if f == MONO_VLSB:
+            return (self._buf[(y >> 3) * self._stride + x] >> (y & 7)) & 1
+        if f == GS8:
+            return self._buf[y * self._stride + x]
+        i = (x + y * self._stride) >> 3
+        bit = 7 - (x & 7) if f == MONO_HLSB else x & 7
+        return (self._buf[i] >> bit) & 1
+
+    def _set(self, x, y, c):
+        f = self._format
+        if f == GS8:
+            self._buf[y * self._stride + x] = c & 0xff
+            return
+        if f == MONO_VLSB:
+            i = (y >> 3) * self._stride + x
+            bit = y & 7
+        else:
+            i = (x + y * self._stride) >> 3
+            bit = 7 - (x & 7) if f == MONO_HLSB else x & 7
+        if c:
+            self._buf[i] |= 1 << bit
+        else:
+            self._buf[i] &= ~(1 << bit) & 0xff
+
+    def fill(self, c):
+        if self._format == GS8:
+            v = c & 0xff
+        else:
+            v = 0xff if c else 0
+        for i in range(len(self._buf)):
+            self._buf[i] = v
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            return None
+        if c is None:
+            return self._get(x, y)
+        self._set(x, y, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + w, self._width)
+        y1 = min(y + h, self._height)
+        for yy in range(y0, y1):
+            for xx in range(x0, x1):
+                self._set(xx, yy, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+        else:
+            self.fill_rect(x, y, w, 1, c)
+            self.fill_rect(x, y + h - 1, w, 1, c)
+            self.fill_rect(x, y, 1, h, c)
+            self.fill_rect(x + w - 1, y, 1, h, c)
+
+    def line(self, x0, y0, x1, y1, c):
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx + dy
+        while True:
+            self.pixel(x0, y0, c)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x0 += sx
+            if e2 <= dx:
+                err += dx
+                y0 += sy
+
+    def text(self, s, x, y, c=1):
+        for ch in s:
+            rows = _glyph(ch)
+            for j in range(8):
+                row = rows[j]
+                if row:
+                    for i in range(8):
+                        if row & (0x80 >> i):
+                            self.pixel(x + i, y + j, c)
+            x += 8
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for j in range(fbuf._height):
+            yy = y + j
+            if not 0 <= yy < self._height:
+                continue
+            for i in range(fbuf._width):
+                xx = x + i
+                if not 0 <= xx < self._width:
+                    continue
+                c = fbuf._get(i, j)
+                if c == key:
+                    continue
+                if palette is not None:
+                    c = palette.pixel(c, 0)
+                self._set(xx, yy, c)
+
+    def scroll(self, xstep, ystep):
+        w = self._width
+        h = self._height
+        pixels = [[self._get(x, y) for x in range(w)] for y in range(h)]
+        for y in range(h):
+            for x in range(w):
+                sx = x - xstep
+                sy = y - ystep
+                if 0 <= sx < w and 0 <= sy < h:
+                    self._set(x, y, pixels[sy][sx])
@@ -0,0 +1,179 @@
+"""
+Run the controller from "espresso control" against the boiler model.
+
+install() puts the stand-in MicroPython modules in sys.modules, after which
+the controller code imports unchanged. Simulation wires the SSR output to a
+Boiler and the boiler temperature back in through a FakeTSic, then runs the
+controller's tasks on the virtual clock.
+"""
+
+import asyncio
+import builtins
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from . import machine, micropython, network, utime
+from . import framebuf as _framebuf
+from . import uasyncio
+from .boiler import Boiler
+from .clock import clock
+from .oled import FakeSSD1306
+from .tsic import FakeTSic
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "espresso control")
+APP_FILES = ("settings.json", "index.html", "script.js", "style.css")
+
+# pins as wired in main.py
+PINS = dict(oled_scl=23, oled_sda=22, ssr=19, tsic_data=20, tsic_power=18, knob_clk=0, knob_dt=1, knob_sw=2)
+
+READY_BAND = 0.5  # |temp - setpoint| counted as ready, as on the display
+
+
+def install():
+    """Make the MicroPython modules importable and asyncio use the virtual clock"""
+    sys.modules["machine"] = machine
+    sys.modules["utime"] = utime
+    sys.modules["uasyncio"] = uasyncio
+    sys.modules["micropython"] = micropython
+    sys.modules["network"] = network
+    sys.modules["framebuf"] = _framebuf
+    sys.modules["ujson"] = json
+    # the MicroPython compiler knows const() without an import
+    builtins.const = micropython.const
+    # the controller code uses time.ticks_* as well as utime
+    for name in ("ticks_ms", "ticks_us", "ticks_add", "ticks_diff", "sleep_ms", "sleep_us"):
+        setattr(time, name, getattr(utime, name))
+    # the app's secrets.py, not the standard library module
+    if sys.modules.get("secrets") and not getattr(sys.modules["secrets"], "mysecrets", None):
+        del sys.modules["secrets"]
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    asyncio.set_event_loop_policy(uasyncio.VirtualEventLoopPolicy())
+
+
+class Simulation:
+    def __init__(self, boiler=None, settings=None, speed=None, verbose=False,
+                 jitter_us=0.0, error_rate=0.0, seed=0, sample_period=1.0):
+        """
+        boiler: the Boiler to control (defaults to a cold Silvia), settings:
+        dict written to settings.json in place of the app's own, speed:
+        virtual seconds per real second (None for as fast as possible),
+        verbose: let the controller's prints through, jitter_us / error_rate:
+        passed to the FakeTSic, sample_period: seconds between trace samples.
+        """
+        install()
+        self.boiler = boiler or Boiler()
+        self.settings = settings
+        self.speed = speed
+        self.verbose = verbose
+        self.jitter_us = jitter_us
+        self.error_rate = error_rate
+        self.seed = seed
+        self.sample_period = sample_period
+        self.actions = []  # (seconds, callable(sim))
+        self.trace = []  # (seconds, boiler temp, controller temp, setpoint, duty, heater)
+        self.controller = None
+        self.tsic = None
+        self.oled = None
+
+    def at(self, seconds, action):
+        """Call action(sim) at a simulated time"""
+        self.actions.append((seconds, action))
+        return self
+
+    def turn_on(self, seconds=0.0):
+        return self.at(seconds, lambda sim: sim.controller.turn_on())
+
+    def shot(self, seconds, duration=28.0, flow=2.0):
+        """Pull a shot: draw flow ml/s of cold water for duration seconds"""
+        self.at(seconds, lambda sim: sim.boiler.set_flow(flow, clock.seconds()))
+        self.at(seconds + duration, lambda sim: sim.boiler.set_flow(0.0, clock.seconds()))
+        return self
+
+    def run(self, seconds):
+        """Simulate for seconds, returns the summary()"""
+        clock.reset(speed=self.speed)
+        machine.reset_board()
+        cwd = os.getcwd()
+        workdir = tempfile.mkdtemp(prefix="espresso-sim-")
+        out = sys.stdout if self.verbose else io.StringIO()
+        try:
+            for name in os.listdir(APP_DIR):
+                if name in APP_FILES or name.endswith(".gz"):
+                    shutil.copy(os.path.join(APP_DIR, name), workdir)
+            if self.settings is not None:
+                with open(os.path.join(workdir, "settings.json"), "w") as f:
+                    json.dump(self.settings, f)
+            os.chdir(workdir)
+            with contextlib.redirect_stdout(out):
+                asyncio.run(self._main(seconds))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+        return self.summary()
+
+    async def _main(self, seconds):
+        from silvia_control import SilviaControl
+
+        machine.add_listener(PINS["ssr"], lambda v: self.boiler.set_heater(v, clock.seconds()))
+        self.tsic = FakeTSic(PINS["tsic_data"], PINS["tsic_power"], self.boiler.temperature,
+                             jitter_us=self.jitter_us, error_rate=self.error_rate, seed=self.seed)
+        self.oled = FakeSSD1306()
+        machine.add_i2c_device(0x3C, self.oled)
+        machine.drive(PINS["knob_sw"], 1)  # button released
+        self.controller = SilviaControl(**PINS)
+
+        loop = asyncio.get_running_loop()
+        for when, action in self.actions:
+            loop.call_at(when, action, self)
+        task = asyncio.create_task(self.controller.run())
+        try:
+            while clock.seconds() < seconds:
+                self.sample()
+                await asyncio.sleep(self.sample_period)
+        finally:
+            task.cancel()
+            self.controller.shut_down()
+
+    def sample(self):
+        c = self.controller
+        self.trace.append((clock.seconds(), self.boiler.temperature(clock.seconds()),
+                           c.current_temp, c.setpoint, c.pwm_val, self.boiler.heater))
+
+    def summary(self):
+        """Time to first get within READY_BAND of the setpoint, the overshoot
+        after that and the heater energy used"""
+        ready = None
+        peak = None
+        settled = []
+        for t, temp, _, setpoint, _, _ in self.trace:
+            if setpoint is None:
+                continue
+            if ready is None:
+                if abs(temp - setpoint) < READY_BAND:
+                    ready = t
+                continue
+            peak = temp - setpoint if peak is None else max(peak, temp - setpoint)
+            settled.append(abs(temp - setpoint))
+        return {
+            "seconds": clock.seconds(),
+            "time_to_ready": ready,
+            "overshoot": max(peak, 0.0) if peak is not None else None,
+            "mean_abs_error": sum(settled) / len(settled) if settled else None,
+            "energy": self.boiler.energy,
+            "sensor_packets": self.tsic.packets if self.tsic else 0,
+            "display_bytes": self.oled.bytes if self.oled else 0,
+        }
+
+    def write_csv(self, path):
+        with open(path, "w") as f:
+            f.write("seconds,boiler_temp,controller_temp,setpoint,duty,heater\n")
+            for row in self.trace:
+                f.write(",".join("" if v is None else f"{v:.3f}" if isinstance(v, float) else str(v)
+                                 for v in row) + "\n")
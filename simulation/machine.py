@@ -0,0 +1,209 @@
+"""
+Stand-in for MicroPython's machine module.
+
+Pins with the same id share their state, so a simulated device can watch an
+output (add_listener) or drive an input and fire its interrupt (drive).
+Timers run their callbacks from the event loop on the virtual clock.
+"""
+
+import asyncio
+import calendar
+
+from .clock import clock
+
+_pins = {}
+_i2c_devices = {}
+
+
+def reset_board():
+    """Forget all pin states, listeners and I2C devices"""
+    _pins.clear()
+    _i2c_devices.clear()
+
+
+class _PinState:
+    def __init__(self):
+        self.value = 0
+        self.mode = None
+        self.pull = None
+        self.handler = None
+        self.trigger = 0
+        self.listeners = []
+
+
+def _state(pin_id):
+    if pin_id not in _pins:
+        _pins[pin_id] = _PinState()
+    return _pins[pin_id]
+
+
+def add_listener(pin_id, callback):
+    """Call callback(value) whenever the code sets output pin_id"""
+    _state(pin_id).listeners.append(callback)
+
+
+def drive(pin_id, value):
+    """Set input pin_id from outside, firing its interrupt on a matching edge"""
+    state = _state(pin_id)
+    old = state.value
+    state.value = value
+    if state.handler and old != value:
+        edge = Pin.IRQ_RISING if value else Pin.IRQ_FALLING
+        if state.trigger & edge:
+            state.handler(Pin(pin_id))
+
+
+def pin_value(pin_id):
+    return _state(pin_id).value
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._state = _state(id)
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None):
+        if mode != -1:
+            self._state.mode = mode
+        if pull != -1:
+            self._state.pull = pull
+            if pull == Pin.PULL_UP and self._state.mode == Pin.IN:
+                self._state.value = 1
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self._state.value
+        value = 1 if value else 0
+        self._state.value = value
+        for listener in self._state.listeners:
+            listener(value)
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_RISING | IRQ_FALLING, hard=False):
+        self._state.handler = handler
+        self._state.trigger = trigger if handler else 0
+
+    def __repr__(self):
+        return f"Pin({self.id})"
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self._handle = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=None, callback=None, tick_hz=1000):
+        self.deinit()
+        if freq is not None:
+            period_s = 1 / freq
+        else:
+            period_s = period / tick_hz
+        self._mode = mode
+        self._period = period_s
+        self._callback = callback
+        self._loop = asyncio.get_event_loop()
+        self._due = self._loop.time() + period_s
+        self._handle = self._loop.call_at(self._due, self._fire)
+
+    def _fire(self):
+        if self._mode == Timer.PERIODIC:
+            # schedule from the due time so periods don't drift
+            self._due += self._period
+            self._handle = self._loop.call_at(self._due, self._fire)
+        else:
+            self._handle = None
+        if self._callback:
+            self._callback(self)
+
+    def deinit(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+
+class I2C:
+    def __init__(self, id=0, scl=None, sda=None, freq=400000, **kwargs):
+        self.id = id
+        self.freq = freq
+        self.transactions = 0
+        self.bytes_written = 0
+
+    def scan(self):
+        return sorted(_i2c_devices)
+
+    def writeto(self, addr, buf, stop=True):
+        self.transactions += 1
+        self.bytes_written += len(buf)
+        if addr in _i2c_devices:
+            _i2c_devices[addr].write(bytes(buf))
+        return 1
+
+    def writevto(self, addr, vector, stop=True):
+        data = b"".join(bytes(b) for b in vector)
+        return self.writeto(addr, data, stop)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return bytes(nbytes)
+
+
+def add_i2c_device(addr, device):
+    """Route writes to addr to device.write(data)"""
+    _i2c_devices[addr] = device
+
+
+class SPI:
+    def __init__(self, id=1, *args, **kwargs):
+        pass
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def write(self, buf):
+        pass
+
+
+class RTC:
+    def datetime(self, datetimetuple=None):
+        """Get or set (year, month, day, weekday, hours, minutes, seconds, subseconds)"""
+        if datetimetuple is None:
+            import time
+            t = time.gmtime(clock.epoch + clock.us // 1000000)
+            return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday, t.tm_hour, t.tm_min, t.tm_sec, 0)
+        Y, M, D, _, h, m, s = datetimetuple[:7]
+        clock.epoch = calendar.timegm((Y, M, D, h, m, s, 0, 0, 0)) - clock.us // 1000000
+
+
+def freq(hz=None):
+    return 160000000
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def idle():
+    pass
@@ -0,0 +1,37 @@
+"""Stand-in for the micropython module."""
+
+import asyncio
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+def schedule(func, arg):
+    """Run func(arg) soon from the event loop, like a soft interrupt"""
+    asyncio.get_event_loop().call_soon(func, arg)
+    return True
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(*args):
+    pass
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
@@ -0,0 +1,30 @@
+"""Stand-in for the network module, always connected to localhost."""
+
+STA_IF = 0
+AP_IF = 1
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._connected = False
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def connect(self, ssid=None, key=None):
+        self._connected = True
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected
+
+    def ifconfig(self):
+        if self._connected:
+            return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+        return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
@@ -0,0 +1,64 @@
+"""Fake SSD1306 on the simulated I2C bus, keeping its own display RAM."""
+
+BUS_HZ = 400000  # I2C clock of the OLED
+
+
+class FakeSSD1306:
+    def __init__(self, width=128, height=64):
+        """Takes the bytes the driver writes: a control byte (0x80 one
+        command, 0x00 commands, 0x40 data) and what follows. Data goes to
+        the column and page window in horizontal addressing mode like the
+        real controller, so ram can be compared with the frame buffer."""
+        self.width = width
+        self.pages = height // 8
+        self.ram = bytearray(width * self.pages)
+        self.window = (0, width - 1, 0, self.pages - 1)
+        self.col = 0
+        self.page = 0
+        self.pending = []  # command bytes waiting for their arguments
+        self.transactions = 0
+        self.bytes = 0  # including the address byte of each transaction
+        self.data_bytes = 0
+        self.refreshes = 0  # transactions with data
+
+    def bus_seconds(self):
+        """Time the writes so far held the bus: 9 clocks a byte, plus start and stop"""
+        return (self.bytes * 9 + self.transactions * 2) / BUS_HZ
+
+    def write(self, data):
+        self.transactions += 1
+        self.bytes += len(data) + 1
+        control, body = data[0], data[1:]
+        if control == 0x40:
+            self.refreshes += 1
+            self.data_bytes += len(body)
+            for b in body:
+                self.put(b)
+        else:
+            for b in body:
+                self.command(b)
+
+    def command(self, b):
+        self.pending.append(b)
+        op = self.pending[0]
+        if op in (0x21, 0x22) and len(self.pending) < 3:
+            return
+        if op in (0x20, 0x81, 0xA8, 0xD3, 0xDA, 0xD5, 0xD9, 0xDB, 0x8D) and len(self.pending) < 2:
+            return
+        if op == 0x21:
+            self.window = (self.pending[1], self.pending[2]) + self.window[2:]
+            self.col = self.pending[1]
+        elif op == 0x22:
+            self.window = self.window[:2] + (self.pending[1], self.pending[2])
+            self.page = self.pending[1]
+        self.pending = []
+
+    def put(self, b):
+        c0, c1, p0, p1 = self.window
+        if self.col < self.width and self.page < self.pages:
+            self.ram[self.page * self.width + self.col] = b
+        if self.col >= c1:
+            self.col = c0
+            self.page = p0 if self.page >= p1 else self.page + 1
+        else:
+            self.col += 1
@@ -0,0 +1,87 @@
+"""Fake TSic306 sending ZACwire packets on the simulated data pin."""
+
+import asyncio
+import random
+
+from . import machine
+from .clock import clock
+
+BIT_US = 125  # ZACwire bit period
+STROBE_US = BIT_US / 2  # low time of the start bit
+ONE_US = BIT_US / 4  # low time of a 1
+ZERO_US = BIT_US * 3 / 4  # low time of a 0
+
+
+def temp_to_raw(temp):
+    """11 bit TSic306 reading for a temperature, -50 to 150 C"""
+    raw = int(round((temp + 50) / 200 * 2047))
+    return min(max(raw, 0), 2047)
+
+
+def packet_edges(raw, jitter_us=0.0, rng=random):
+    """(time us, level) of every edge of one reading: two bytes, each a start
+    bit, 8 data bits and an even parity bit, with a stop bit in between.
+    The first byte carries the top 3 bits of raw."""
+    edges = []
+    t = 0.0
+    for byte in (raw >> 8, raw & 0xff):
+        bits = [(byte >> (7 - i)) & 1 for i in range(8)]
+        lows = [STROBE_US] + [ONE_US if b else ZERO_US for b in bits] + [ONE_US if sum(bits) & 1 else ZERO_US]
+        for low in lows:
+            edges.append((t, 0))
+            edges.append((t + low, 1))
+            t += BIT_US
+        t += BIT_US  # stop bit
+    if jitter_us:
+        jittered = []
+        last = -1
+        for t, level in edges:
+            t = max(last + 1, t + rng.gauss(0, jitter_us))
+            jittered.append((t, level))
+            last = t
+        edges = jittered
+    return [(int(round(t)), level) for t, level in edges]
+
+
+class FakeTSic:
+    def __init__(self, data_pin, power_pin, read_temp, interval_ms=100, jitter_us=0.0,
+                 error_rate=0.0, seed=None):
+        """read_temp(seconds) gives the temperature to send. A reading goes out
+        every interval_ms while the power pin is high, the first one 70 ms after
+        power up. error_rate is the fraction of packets with a flipped bit."""
+        self.data_pin = data_pin
+        self.read_temp = read_temp
+        self.interval_us = interval_ms * 1000
+        self.jitter_us = jitter_us
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.packets = 0
+        self._handle = None
+        machine.drive(data_pin, 0)
+        machine.add_listener(power_pin, self._power)
+
+    def _power(self, value):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        machine.drive(self.data_pin, value)
+        if value:
+            loop = asyncio.get_event_loop()
+            self._handle = loop.call_at(loop.time() + 0.07, self._send)
+
+    def _send(self):
+        start = clock.us
+        raw = temp_to_raw(self.read_temp(clock.seconds()))
+        edges = packet_edges(raw, self.jitter_us, self.rng)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            # stretch one low time across the 1/0 threshold
+            i = 2 * self.rng.randrange(1, len(edges) // 2)
+            t, level = edges[i - 1]
+            low = ZERO_US if t - edges[i - 2][0] < STROBE_US else ONE_US
+            edges[i - 1] = (edges[i - 2][0] + int(round(low)), level)
+        for t, level in edges:
+            clock.set_us(start + t)
+            machine.drive(self.data_pin, level)
+        self.packets += 1
+        loop = asyncio.get_event_loop()
+        self._handle = loop.call_at((start + self.interval_us) / 1e6, self._send)
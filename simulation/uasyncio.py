@@ -0,0 +1,63 @@
+"""
+Stand-in for uasyncio: CPython's asyncio running on the virtual clock.
+
+VirtualEventLoop never blocks waiting for a timer. When nothing is ready it
+moves the virtual clock to the next scheduled callback, so an hour of
+asyncio.sleep() calls takes as long as the code in between needs. Real
+sockets are still polled, so a server started in the simulation can be used.
+"""
+
+import asyncio
+import selectors
+from asyncio import *  # noqa: F401,F403
+
+from .clock import clock
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready:
+            return ready
+        if timeout is None:
+            if len(self.get_map()) <= 1:  # only the loop's own wakeup pipe
+                raise RuntimeError("simulation stalled, no task is waiting for anything")
+            timeout = 0.01  # waiting on real sockets only
+        clock.advance(timeout)
+        return []
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__(VirtualSelector())
+
+    def time(self):
+        return clock.seconds()
+
+
+class VirtualEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    def new_event_loop(self):
+        return VirtualEventLoop()
+
+
+def sleep_ms(ms):
+    return asyncio.sleep(ms / 1000)
+
+
+def wait_for_ms(aw, timeout):
+    return asyncio.wait_for(aw, timeout / 1000)
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
@@ -0,0 +1,68 @@
+"""Stand-in for MicroPython's utime, driven by the virtual clock."""
+
+import time as _time
+
+from .clock import clock
+
+# MicroPython ticks wrap around at 2**30 like on the ESP32
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+def ticks_us():
+    return clock.us & TICKS_MAX
+
+
+def ticks_ms():
+    return (clock.us // 1000) & TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def time():
+    return clock.epoch + clock.us // 1000000
+
+
+def time_ns():
+    return clock.epoch * 1000000000 + clock.us * 1000
+
+
+def _tuple(t):
+    return tuple(t[:6]) + (t.tm_wday, t.tm_yday)
+
+
+def gmtime(secs=None):
+    return _tuple(_time.gmtime(time() if secs is None else secs))
+
+
+def localtime(secs=None):
+    # the ESP32 RTC has no time zone, local time is UTC
+    return gmtime(secs)
+
+
+def mktime(t):
+    import calendar
+    return calendar.timegm(tuple(t[:6]) + (0, 0, 0))
+
+
+def sleep(seconds):
+    clock.advance(seconds)
+
+
+def sleep_ms(ms):
+    clock.advance(ms / 1000)
+
+
+def sleep_us(us):
+    clock.advance(us / 1e6)
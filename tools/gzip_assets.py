@@ -0,0 +1,32 @@
+"""
+Compress the web app files for the ESP32.
+
+Writes index.html.gz, style.css.gz and script.js.gz next to the originals in
+"espresso control". Upload them along with the rest of the files and the web
+server sends them with Content-Encoding: gzip. Run it again after editing the
+web files, a stale .gz is served in place of the edited file.
+
+usage: python tools/gzip_assets.py
+"""
+
+import gzip
+import os
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "espresso control")
+ASSETS = ("index.html", "style.css", "script.js")
+
+
+def main():
+    for name in ASSETS:
+        path = os.path.join(APP_DIR, name)
+        with open(path, "rb") as f:
+            data = f.read()
+        # mtime=0 keeps the output, and so the ETag, the same for unchanged files
+        packed = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(path + ".gz", "wb") as f:
+            f.write(packed)
+        print(f"{name}: {len(data)} -> {len(packed)} bytes")
+
+
+if __name__ == "__main__":
+    main()